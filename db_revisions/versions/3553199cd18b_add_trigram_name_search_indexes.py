@@ -0,0 +1,42 @@
+"""Add trigram indexes for institution name search
+
+Revision ID: 3553199cd18b
+Revises: ca39ad68af05
+Create Date: 2026-10-18 16:05:12.481203
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "3553199cd18b"
+down_revision: Union[str, None] = "ca39ad68af05"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+SEARCH_COLUMNS = ["name", "parent_legal_name", "top_holder_legal_name"]
+
+
+def upgrade() -> None:
+    # pg_trgm is Postgres only; other dialects (sqlite in tests) search with a plain substring match
+    if op.get_context().dialect.name != "postgresql":
+        return
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    for column in SEARCH_COLUMNS:
+        op.create_index(
+            f"ix_financial_institutions_{column}_trgm",
+            "financial_institutions",
+            [column],
+            postgresql_using="gin",
+            postgresql_ops={column: "gin_trgm_ops"},
+        )
+
+
+def downgrade() -> None:
+    if op.get_context().dialect.name != "postgresql":
+        return
+    for column in SEARCH_COLUMNS:
+        op.drop_index(f"ix_financial_institutions_{column}_trgm", table_name="financial_institutions")
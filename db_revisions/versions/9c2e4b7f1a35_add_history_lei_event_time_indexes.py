@@ -0,0 +1,32 @@
+"""Add (lei, event_time) indexes to the history tables
+
+Revision ID: 9c2e4b7f1a35
+Revises: d87cac81c861
+Create Date: 2026-10-18 17:12:04.531870
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "9c2e4b7f1a35"
+down_revision: Union[str, None] = "d87cac81c861"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        "ix_financial_institutions_history_lei_event_time", "financial_institutions_history", ["lei", "event_time"]
+    )
+    op.create_index(
+        "ix_fi_to_type_mapping_history_fi_id_event_time", "fi_to_type_mapping_history", ["fi_id", "event_time"]
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_fi_to_type_mapping_history_fi_id_event_time", table_name="fi_to_type_mapping_history")
+    op.drop_index("ix_financial_institutions_history_lei_event_time", table_name="financial_institutions_history")
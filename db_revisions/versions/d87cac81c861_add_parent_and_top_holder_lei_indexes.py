@@ -0,0 +1,28 @@
+"""Add parent_lei and top_holder_lei indexes
+
+Revision ID: d87cac81c861
+Revises: 3553199cd18b
+Create Date: 2026-10-18 16:41:37.905116
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "d87cac81c861"
+down_revision: Union[str, None] = "3553199cd18b"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index(op.f("ix_financial_institutions_parent_lei"), "financial_institutions", ["parent_lei"])
+    op.create_index(op.f("ix_financial_institutions_top_holder_lei"), "financial_institutions", ["top_holder_lei"])
+
+
+def downgrade() -> None:
+    op.drop_index(op.f("ix_financial_institutions_top_holder_lei"), table_name="financial_institutions")
+    op.drop_index(op.f("ix_financial_institutions_parent_lei"), table_name="financial_institutions")
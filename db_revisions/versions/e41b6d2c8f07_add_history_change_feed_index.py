@@ -0,0 +1,32 @@
+"""Add the change feed (event_time, lei, version) index to the institution history
+
+Revision ID: e41b6d2c8f07
+Revises: 9c2e4b7f1a35
+Create Date: 2026-10-18 18:03:51.204417
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "e41b6d2c8f07"
+down_revision: Union[str, None] = "9c2e4b7f1a35"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        "ix_financial_institutions_history_event_time_lei_version",
+        "financial_institutions_history",
+        ["event_time", "lei", "version"],
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(
+        "ix_financial_institutions_history_event_time_lei_version", table_name="financial_institutions_history"
+    )
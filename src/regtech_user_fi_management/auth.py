@@ -0,0 +1,118 @@
+import asyncio
+import hashlib
+import logging
+import time
+from threading import Lock, Thread
+from typing import Any, Callable, Dict
+
+import jwt
+from regtech_api_commons.oauth2.config import KeycloakSettings
+
+from regtech_user_fi_management.config import kc_settings, settings
+from regtech_user_fi_management.util.ttl_cache import TtlCache
+
+log = logging.getLogger(__name__)
+
+
+class JwksKeys:
+    """
+    The realm's signing keys by key id. They're fetched at startup and refreshed in the background so
+    verifying a token never waits on Keycloak. A token signed with a key that isn't held yet is rejected,
+    and starts a background refresh, at most one at a time and once every `min_refresh_interval` seconds,
+    so rotated keys are picked up promptly without letting made up key ids stall requests.
+    """
+
+    def __init__(
+        self,
+        certs_url: str,
+        timeout: float = 10,
+        min_refresh_interval: float = 30,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self._client = jwt.PyJWKClient(certs_url, cache_keys=False, cache_jwk_set=False, timeout=timeout)
+        self.min_refresh_interval = min_refresh_interval
+        self._clock = clock
+        self._lock = Lock()
+        self._keys: Dict[str, jwt.PyJWK] = {}
+        self._refresh_requested_at: float | None = None
+        self._refresh_thread: Thread | None = None
+
+    def refresh(self) -> None:
+        keys = {key.key_id: key for key in self._client.get_jwk_set().keys}
+        with self._lock:
+            self._keys = keys
+
+    def get(self, kid: str | None) -> jwt.PyJWK | None:
+        if (key := self._keys.get(kid)) is None:
+            self._request_refresh()
+        return key
+
+    def _request_refresh(self) -> None:
+        with self._lock:
+            if self._refresh_thread is not None and self._refresh_thread.is_alive():
+                return
+            now = self._clock()
+            if self._refresh_requested_at is not None and now - self._refresh_requested_at < self.min_refresh_interval:
+                return
+            self._refresh_requested_at = now
+            self._refresh_thread = Thread(target=self._refresh_quietly, name="jwks-refresh", daemon=True)
+            self._refresh_thread.start()
+
+    def _refresh_quietly(self) -> None:
+        try:
+            self.refresh()
+        except Exception:
+            log.exception("Failed to refresh the realm's signing keys")
+
+    async def refresh_periodically(self, interval: float) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await asyncio.to_thread(self.refresh)
+            except Exception:
+                # keep verifying with the keys already held, the next round will try again
+                log.exception("Failed to refresh the realm's signing keys")
+
+
+class TokenVerifier:
+    """
+    Verifies bearer tokens against the realm's signing keys, and caches the validated claims by token hash
+    until the token expires so repeat requests with the same token skip signature verification.
+    Used in place of `OAuth2Admin` as the claims source of `BearerTokenAuthBackend`.
+    """
+
+    def __init__(self, kc_settings: KeycloakSettings, keys: JwksKeys, cache_maxsize: int):
+        self.keys = keys
+        self.issuer = kc_settings.kc_realm_url.unicode_string()
+        self.audience = kc_settings.auth_client
+        self.options = dict(kc_settings.jwt_opts)
+        self.leeway = self.options.pop("leeway", 0)
+        self.claims_cache: TtlCache[str, Dict[str, Any]] = TtlCache("token_claims", ttl=0, maxsize=cache_maxsize)
+
+    def get_claims(self, token: str) -> Dict[str, Any] | None:
+        cache_key = hashlib.sha256(token.encode()).hexdigest()
+        if (claims := self.claims_cache.get(cache_key)) is not None:
+            return claims
+        try:
+            if (key := self.keys.get(jwt.get_unverified_header(token).get("kid"))) is None:
+                return None
+            claims = jwt.decode(
+                token,
+                key=key,
+                algorithms=[key.algorithm_name],
+                audience=self.audience,
+                issuer=self.issuer,
+                options=self.options,
+                leeway=self.leeway,
+            )
+        except jwt.PyJWTError as e:
+            log.debug("Token rejected: %s", e)
+            return None
+        if (expires_in := claims.get("exp", 0) - time.time()) > 0:
+            self.claims_cache.set(cache_key, claims, ttl=expires_in)
+        return claims
+
+
+jwks_keys = JwksKeys(kc_settings.certs_url.unicode_string(), timeout=settings.keycloak_timeout)
+
+token_verifier = TokenVerifier(kc_settings, jwks_keys, cache_maxsize=settings.token_cache_maxsize)
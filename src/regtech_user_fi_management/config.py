@@ -1,9 +1,9 @@
 import os
 from pathlib import Path
-from typing import Set
+from typing import Literal, Set
 from urllib import parse
 
-from pydantic import field_validator, PostgresDsn, ValidationInfo
+from pydantic import field_validator, PostgresDsn, SecretStr, ValidationInfo
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 from regtech_api_commons.oauth2.config import KeycloakSettings
@@ -12,6 +12,8 @@ from regtech_regex.regex_config import RegexConfigs
 
 JWT_OPTS_PREFIX = "jwt_opts_"
 
+StartupMigrations = Literal["locked", "verify", "off"]
+
 env_files_to_load: list[Path | str] = [".env"]
 if os.getenv("ENV", "LOCAL") == "LOCAL":
     env_files_to_load.append(".env.local")
@@ -24,18 +26,51 @@ class Settings(BaseSettings):
     inst_db_pwd: str
     inst_db_host: str
     inst_db_scheme: str = "postgresql+psycopg2"
+    inst_async_db_scheme: str = "postgresql+asyncpg"
     inst_conn: str | None = None
+    inst_async_conn: str | None = None
+    inst_replica_async_conn: str | None = None
     admin_scopes: Set[str] = set(["query-groups", "manage-users"])
     db_logging: bool = True
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
+    db_pool_timeout: float = 30
+    db_pool_recycle: int = 1800
+    db_pool_pre_ping: bool = True
+    reference_data_ttl: int = 900
+    denied_domains_refresh_interval: int = 300
+    export_chunk_size: int = 500
+    bulk_upsert_chunk_size: int = 1000
+    keycloak_concurrency: int = 8
+    keycloak_timeout: float = 10
+    keycloak_breaker_failures: int = 5
+    keycloak_breaker_reset: float = 30
+    user_cache_ttl: int = 30
+    user_cache_maxsize: int = 10000
+    token_cache_maxsize: int = 10000
+    jwks_refresh_interval: int = 300
+    replica_stickiness_seconds: float = 5
+    replica_stickiness_secret: SecretStr | None = None
+    startup_migrations: StartupMigrations = "locked"
+    check_history_tables: bool = True
+    query_stats_header: bool = False
+    query_repeat_threshold: int = 5
+    search_max_results: int = 50
+    max_page_size: int = 1000
+    family_max_depth: int = 10
+    change_feed_settle_seconds: float = 5
+    change_feed_max_wait: float = 30
+    change_feed_heartbeat_seconds: float = 15
 
     def __init__(self, **data):
         super().__init__(**data)
 
-    @field_validator("inst_conn", mode="before")
+    @field_validator("inst_conn", "inst_async_conn", mode="before")
     @classmethod
     def build_postgres_dsn(cls, field_value, info: ValidationInfo) -> str:
+        scheme_field = "inst_async_db_scheme" if info.field_name == "inst_async_conn" else "inst_db_scheme"
         postgres_dsn = PostgresDsn.build(
-            scheme=info.data.get("inst_db_scheme"),
+            scheme=info.data.get(scheme_field),
             username=info.data.get("inst_db_user"),
             password=parse.quote(str(info.data.get("inst_db_pwd")), safe=""),
             host=info.data.get("inst_db_host"),
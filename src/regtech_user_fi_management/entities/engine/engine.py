@@ -1,13 +1,108 @@
+import logging
+import secrets
+from typing import Dict
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
 from regtech_user_fi_management.config import settings
+from regtech_user_fi_management.entities.engine.notifications import HistoryNotifier
+from regtech_user_fi_management.entities.engine.pool import (
+    InstrumentedAsyncQueuePool,
+    pool_metrics,
+    replica_pool_metrics,
+)
+from regtech_user_fi_management.entities.engine.query_stats import instrument_engines
+from regtech_user_fi_management.entities.engine.routing import REPLICA_READS_KEY, RoutingSession
+from regtech_user_fi_management.util.write_marker import WriteMarker
+
+log = logging.getLogger(__name__)
+
+pool_options = {
+    "pool_size": settings.db_pool_size,
+    "max_overflow": settings.db_max_overflow,
+    "pool_timeout": settings.db_pool_timeout,
+    "pool_recycle": settings.db_pool_recycle,
+    "pool_pre_ping": settings.db_pool_pre_ping,
+}
 
-engine = create_engine(str(settings.inst_conn), echo=settings.db_logging).execution_options(
+engine = create_engine(str(settings.inst_conn), echo=settings.db_logging, **pool_options).execution_options(
     schema_translate_map={None: settings.inst_db_schema}
 )
 SessionLocal = Session = sessionmaker(engine, expire_on_commit=False)
 
+async_engine = create_async_engine(
+    str(settings.inst_async_conn), echo=settings.db_logging, poolclass=InstrumentedAsyncQueuePool, **pool_options
+).execution_options(schema_translate_map={None: settings.inst_db_schema})
+
+async_replica_engine = (
+    create_async_engine(
+        str(settings.inst_replica_async_conn),
+        echo=settings.db_logging,
+        poolclass=InstrumentedAsyncQueuePool.recording_to(replica_pool_metrics),
+        **pool_options,
+    ).execution_options(schema_translate_map={None: settings.inst_db_schema})
+    if settings.inst_replica_async_conn
+    else None
+)
+
+instrument_engines()
+
+AsyncSessionLocal = async_sessionmaker(
+    async_engine,
+    expire_on_commit=False,
+    class_=AsyncSession,
+    sync_session_class=RoutingSession,
+    replica=async_replica_engine.sync_engine if async_replica_engine else None,
+)
+
+# history is written to the primary, so that's where change feed readers listen for it
+history_notifier = HistoryNotifier(async_engine)
+
+
+def _write_marker() -> WriteMarker | None:
+    if async_replica_engine is None:
+        return None
+    if settings.replica_stickiness_secret:
+        secret = settings.replica_stickiness_secret.get_secret_value().encode()
+    else:
+        log.warning("REPLICA_STICKINESS_SECRET isn't set, reads only stick to the primary on the process that wrote")
+        secret = secrets.token_bytes(32)
+    return WriteMarker(secret, ttl=settings.replica_stickiness_seconds)
+
+
+# clients that wrote recently keep reading from the primary until the replica has caught up; the marker of
+# the last write travels with the client so every process, not just the one that wrote, can honour it.
+# Clients that don't send one back, e.g. cross-origin or cookie-less ones, might have just written, so they always read
+# from the primary
+write_marker = _write_marker()
+
+
+def get_pool_status() -> Dict[str, Dict[str, int | float]]:
+    status = {"primary": pool_metrics.snapshot(async_engine.pool)}
+    if async_replica_engine is not None:
+        status["replica"] = replica_pool_metrics.snapshot(async_replica_engine.pool)
+    return status
+
+
+def use_replica(session: AsyncSession, write_marker_value: str | None = None) -> None:
+    """
+    Lets the session's plain reads go to the replica when the client's write marker shows no write within the
+    stickiness window; without a genuine marker reads stay on the primary.
+    """
+    if write_marker is not None and write_marker.is_settled(write_marker_value):
+        session.info[REPLICA_READS_KEY] = True
+
+
+def issue_write_marker(written_at: float | None = None) -> str | None:
+    return write_marker.issue(written_at) if write_marker is not None else None
+
+
+async def dispose_engines() -> None:
+    await async_engine.dispose()
+    if async_replica_engine is not None:
+        await async_replica_engine.dispose()
+
 
-def get_session():
-    with Session() as session:
+async def get_session():
+    async with AsyncSessionLocal() as session:
         yield session
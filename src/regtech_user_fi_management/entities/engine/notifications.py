@@ -0,0 +1,78 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Set
+
+from sqlalchemy import Select, func, select
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+log = logging.getLogger(__name__)
+
+HISTORY_CHANNEL = "fi_history"
+
+
+def history_notification(dialect_name: str) -> Select | None:
+    """
+    The statement that wakes change feed readers once the transaction writing history commits;
+    only Postgres has one.
+    """
+    if dialect_name == "postgresql":
+        return select(func.pg_notify(HISTORY_CHANNEL, ""))
+
+
+class HistoryNotifier:
+    """
+    Wakes change feed readers when history is written. One connection, opened on first use, LISTENs on
+    the history channel and sets every subscriber's event when a notification arrives. Other databases
+    have no notifications, so subscribers only wake on their own timeouts and the feed falls back to polling.
+    """
+
+    def __init__(self, engine: AsyncEngine, channel: str = HISTORY_CHANNEL):
+        self.engine = engine
+        self.channel = channel
+        self._subscribers: Set[asyncio.Event] = set()
+        self._connection: AsyncConnection | None = None
+        self._driver: Any = None
+        self._lock = asyncio.Lock()
+
+    def _notify(self, *args: Any) -> None:
+        for event in self._subscribers:
+            event.set()
+
+    async def _listen(self) -> None:
+        async with self._lock:
+            if self._driver is not None and not self._driver.is_closed():
+                return
+            await self.close()
+            try:
+                self._connection = await self.engine.connect()
+                self._driver = (await self._connection.get_raw_connection()).driver_connection
+                await self._driver.add_listener(self.channel, self._notify)
+            except Exception:
+                log.exception(f"Failed to listen on {self.channel}, change feed readers will poll")
+                await self.close()
+
+    @asynccontextmanager
+    async def subscribe(self) -> AsyncIterator[asyncio.Event]:
+        """
+        Yields an event that's set whenever history is written while subscribed; clear it before reading
+        so a write landing during the read isn't missed.
+        """
+        if self.engine.dialect.name == "postgresql":
+            await self._listen()
+        event = asyncio.Event()
+        self._subscribers.add(event)
+        try:
+            yield event
+        finally:
+            self._subscribers.discard(event)
+
+    async def close(self) -> None:
+        if self._connection is not None:
+            connection, self._connection, self._driver = self._connection, None, None
+            try:
+                # the listener stays registered on the DBAPI connection, so it's discarded rather than pooled
+                await connection.invalidate()
+                await connection.close()
+            except Exception:
+                log.exception(f"Failed to close the {self.channel} listener connection")
@@ -0,0 +1,74 @@
+import time
+from threading import Lock
+from typing import Dict
+
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+from regtech_user_fi_management.metrics import observe_checkout_wait
+
+
+class PoolMetrics:
+    """
+    Running totals for connection checkouts, shared by every pool instance of an engine so
+    the numbers survive engine dispose / pool recreation. Each checkout's wait is also observed
+    in the `db_pool_checkout_wait_seconds` histogram, labelled with `name`.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        self.checkouts = 0
+        self.checkout_timeouts = 0
+
+    def record_checkout(self, wait_seconds: float, timed_out: bool = False) -> None:
+        with self._lock:
+            if timed_out:
+                self.checkout_timeouts += 1
+            else:
+                self.checkouts += 1
+        observe_checkout_wait(self.name, wait_seconds)
+
+    def snapshot(self, pool: QueuePool) -> Dict[str, int | float]:
+        with self._lock:
+            return {
+                "pool_size": pool.size(),
+                "checked_in": pool.checkedin(),
+                "checked_out": pool.checkedout(),
+                "overflow": max(pool.overflow(), 0),
+                "checkouts": self.checkouts,
+                "checkout_timeouts": self.checkout_timeouts,
+            }
+
+
+pool_metrics = PoolMetrics("primary")
+replica_pool_metrics = PoolMetrics("replica")
+
+
+class InstrumentedAsyncQueuePool(AsyncAdaptedQueuePool):
+    """
+    AsyncAdaptedQueuePool that records how long each checkout waited, including
+    time spent opening a new connection or pre-pinging a pooled one.
+    """
+
+    metrics = pool_metrics
+
+    @classmethod
+    def recording_to(cls, metrics: PoolMetrics) -> type["InstrumentedAsyncQueuePool"]:
+        """
+        The pool class for an engine whose checkouts are recorded separately, e.g. the replica's.
+        """
+        return type(cls.__name__, (cls,), {"metrics": metrics})
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            conn = super().connect()
+        except PoolTimeoutError:
+            self.metrics.record_checkout(time.perf_counter() - start, timed_out=True)
+            raise
+        self.metrics.record_checkout(time.perf_counter() - start)
+        return conn
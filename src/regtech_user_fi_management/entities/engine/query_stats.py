@@ -0,0 +1,95 @@
+import re
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from regtech_user_fi_management.metrics import observe_statement
+
+_PLACEHOLDER = re.compile(r"\$\d+|%\(\w+\)s|\?")
+_PLACEHOLDER_LIST = re.compile(r"\?(?:\s*,\s*\?)+")
+_START_KEY = "query_stats_start"
+
+
+def statement_shape(statement: str) -> str:
+    """
+    Normalizes a statement so executions that only differ in parameters, or in how many values an expanding
+    IN renders, share a shape.
+    """
+    return _PLACEHOLDER_LIST.sub("?", _PLACEHOLDER.sub("?", " ".join(statement.split())))
+
+
+class QueryStats:
+    """
+    Statements executed, and the time spent executing them, while the stats are being tracked.
+    Nested stats also record into the stats they're nested in.
+    """
+
+    def __init__(self, parent: "QueryStats | None" = None):
+        self.parent = parent
+        self.statements: List[str] = []
+        self.duration = 0.0
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+    def record(self, statement: str, duration: float) -> None:
+        self.statements.append(statement)
+        self.duration += duration
+        if self.parent is not None:
+            self.parent.record(statement, duration)
+
+    def repeated(self, threshold: int) -> Dict[str, int]:
+        """
+        Statement shapes executed at least `threshold` times, the usual sign of an N+1 query pattern.
+        """
+        shapes = Counter(statement_shape(statement) for statement in self.statements)
+        return {shape: count for shape, count in shapes.items() if count >= threshold}
+
+    def reset(self) -> None:
+        self.statements.clear()
+        self.duration = 0.0
+
+
+_current_stats: ContextVar[QueryStats | None] = ContextVar("query_stats", default=None)
+
+
+@contextmanager
+def track_queries() -> Iterator[QueryStats]:
+    """
+    Records the statements executed within the block, on any instrumented engine, into the yielded stats.
+    """
+    stats = QueryStats(_current_stats.get())
+    token = _current_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _current_stats.reset(token)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info[_START_KEY] = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = conn.info.pop(_START_KEY, None)
+    if start is None:
+        return
+    duration = time.perf_counter() - start
+    observe_statement(duration)
+    if (stats := _current_stats.get()) is not None:
+        stats.record(statement, duration)
+
+
+def instrument_engines() -> None:
+    """
+    Times every statement on every engine, for the tracked stats and `db_statement_duration_seconds`.
+    """
+    if not event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
@@ -0,0 +1,25 @@
+from typing import Any
+
+from sqlalchemy import Engine, Select
+from sqlalchemy.orm import Session
+
+REPLICA_READS_KEY = "replica_reads"
+
+
+class RoutingSession(Session):
+    """
+    Session that sends plain SELECTs to the read replica while `info[REPLICA_READS_KEY]` is set.
+    Flushes, locking reads and any other statement go to the primary, and clear the flag so reads
+    that follow a write in the same session see it.
+    """
+
+    def __init__(self, bind: Engine | None = None, replica: Engine | None = None, **kw: Any):
+        super().__init__(bind=bind, **kw)
+        self.replica = replica
+
+    def get_bind(self, mapper=None, clause=None, **kw: Any):
+        if self.replica is not None and self.info.get(REPLICA_READS_KEY):
+            if not self._flushing and isinstance(clause, Select) and clause._for_update_arg is None:
+                return self.replica
+            self.info[REPLICA_READS_KEY] = False
+        return super().get_bind(mapper=mapper, clause=clause, **kw)
@@ -1,77 +1,129 @@
-from typing import List
-from sqlalchemy import Connection, Table, event, inspect
-from sqlalchemy.orm import Mapper
+from functools import cache
+from itertools import chain
+from typing import Any, Dict, Iterable, List, Tuple
+from sqlalchemy import Column, Engine, Table, event, inspect
+from sqlalchemy.orm import NO_VALUE, InstanceState, Session, UOWTransaction
 
-from regtech_user_fi_management.entities.models.dao import Base, FinancialInstitutionDao, SblTypeMappingDao
-from regtech_user_fi_management.entities.engine.engine import engine
+from regtech_user_fi_management.entities.engine.notifications import history_notification
+from regtech_user_fi_management.entities.models.dao import FinancialInstitutionDao, SblTypeMappingDao
+from regtech_user_fi_management.entities.repos.repo_utils import get_history_tables
 
+HISTORY_KEY = "fi_history"
+UNTRACKED_ATTRIBUTES = {"event_time"}
+TYPE_CHANGE_FIELDS = ("details",)
 
-def inspect_fi(fi: FinancialInstitutionDao):
+
+@cache
+def _diff_plan(cls: type) -> Tuple[str, ...]:
+    """
+    The column attributes of a mapped class whose changes feed the changeset, resolved once per mapper
+    so change detection doesn't walk every attribute and relationship on each flush.
+    """
+    return tuple(
+        attr.key
+        for attr in inspect(cls).column_attrs
+        # query expressions like `approved` aren't stored, so they're never part of the changeset
+        if isinstance(attr.expression, Column) and attr.key not in UNTRACKED_ATTRIBUTES
+    )
+
+
+def _diff_attributes(state: InstanceState, keys: Iterable[str]) -> Dict[str, Dict[str, List[Any]]]:
+    """
+    Diffs the loaded values against the committed ones; equivalent to each attribute's history for plain columns.
+    """
     changes = {}
+    committed = state.committed_state
+    for key in keys:
+        if key not in committed:
+            continue
+        old, new = committed[key], state.dict.get(key, NO_VALUE)
+        if old == new:
+            continue
+        changes[key] = {"old": [] if old is NO_VALUE else [old], "new": [] if new is NO_VALUE else [new]}
+    return changes
+
+
+def inspect_fi(fi: FinancialInstitutionDao):
     new_version = fi.version + 1 if fi.version else 1
     state = inspect(fi)
-    for attr in state.attrs:
-        if attr.key == "event_time":
-            continue
-        if attr.key == "sbl_institution_types":
-            field_changes = inspect_type_fields(attr.value)
-            if attr.history.has_changes() or field_changes:
-                old_types = {"old": [o.as_db_dict() for o in attr.history.deleted]} if attr.history.deleted else {}
-                new_types = (
-                    {"new": [{**n.as_db_dict(), "version": new_version} for n in attr.history.added]}
-                    if attr.history.added
-                    else {}
-                )
-                changes[attr.key] = {**old_types, **new_types, "field_changes": field_changes}
-        elif attr.history.has_changes():
-            changes[attr.key] = {"old": attr.history.deleted, "new": attr.history.added}
+    changes = _diff_attributes(state, _diff_plan(FinancialInstitutionDao))
+    if "sbl_institution_types" in state.dict:
+        history = state.attrs.sbl_institution_types.history
+        field_changes = inspect_type_fields(state.dict["sbl_institution_types"])
+        if history.has_changes() or field_changes:
+            old_types = {"old": [o.as_db_dict() for o in history.deleted]} if history.deleted else {}
+            new_types = (
+                {"new": [{**n.as_db_dict(), "version": new_version} for n in history.added]} if history.added else {}
+            )
+            changes["sbl_institution_types"] = {**old_types, **new_types, "field_changes": field_changes}
     return changes
 
 
-def inspect_type_fields(types: List[SblTypeMappingDao], fields: List[str] = ["details"]):
+def inspect_type_fields(types: List[SblTypeMappingDao], fields: Tuple[str, ...] = TYPE_CHANGE_FIELDS):
     changes = []
     for t in types:
-        state = inspect(t)
-        attr_changes = {
-            attr.key: {"old": attr.history.deleted, "new": attr.history.added}
-            for attr in state.attrs
-            if attr.key in fields and attr.history.has_changes()
-        }
-        if attr_changes:
+        if attr_changes := _diff_attributes(inspect(t), fields):
             changes.append({**t.as_db_dict(), **attr_changes})
     return changes
 
 
 def _setup_fi_history(fi_history: Table, mapping_history: Table):
-    def _insert_history(
-        mapper: Mapper[FinancialInstitutionDao], connection: Connection, target: FinancialInstitutionDao
-    ):
-        new_version = target.version + 1 if target.version else 1
-        changes = inspect_fi(target)
-        if changes:
-            target.version = new_version
-            for t in target.sbl_institution_types:
-                t.version = new_version
-            hist = target.__dict__.copy()
-            hist.pop("event_time", None)
-            history_columns = fi_history.columns.keys()
-            for key in hist.copy():
-                if key not in history_columns:
-                    del hist[key]
-            hist["changeset"] = changes
-            types = [t.as_db_dict() for t in target.sbl_institution_types]
-            connection.execute(fi_history.insert().values(hist))
-            if types:
-                connection.execute(mapping_history.insert().values(types))
-
-    return _insert_history
+    """
+    Returns the `before_flush` and `after_flush` session listeners that record history for every institution
+    changed in a flush, written with a single multi-row insert per history table.
+    """
+    # multi-row inserts need every row to share the same keys; event_time is left to the server default
+    history_columns = [key for key in fi_history.columns.keys() if key != "event_time"]
+
+    def _collect_history(session: Session, flush_context: UOWTransaction, instances: Iterable[Any] | None):
+        fi_rows, type_rows = session.info[HISTORY_KEY] = ([], [])
+        for target in chain(session.new, session.dirty):
+            if not isinstance(target, FinancialInstitutionDao):
+                continue
+            new_version = target.version + 1 if target.version else 1
+            changes = inspect_fi(target)
+            if changes:
+                target.version = new_version
+                for t in target.sbl_institution_types:
+                    t.version = new_version
+                hist = {key: target.__dict__.get(key) for key in history_columns}
+                hist["changeset"] = changes
+                fi_rows.append(hist)
+                type_rows.extend(t.as_db_dict() for t in target.sbl_institution_types)
+
+    def _insert_history(session: Session, flush_context: UOWTransaction):
+        fi_rows, type_rows = session.info.pop(HISTORY_KEY, ([], []))
+        if fi_rows:
+            connection = session.connection()
+            connection.execute(fi_history.insert().values(fi_rows))
+            if type_rows:
+                connection.execute(mapping_history.insert().values(type_rows))
+            if (notification := history_notification(session.get_bind().dialect.name)) is not None:
+                connection.execute(notification)
+
+    return _collect_history, _insert_history
+
+
+def check_history_tables(engine: Engine, schema: str | None = None) -> None:
+    """
+    Compares the declared history tables' columns with the database's, so a migration the declarations
+    weren't updated for fails startup instead of the first write.
+    """
+    inspector = inspect(engine)
+    for table in get_history_tables():
+        actual = {column["name"] for column in inspector.get_columns(table.name, schema=schema)}
+        declared = set(table.columns.keys())
+        if actual != declared:
+            raise RuntimeError(
+                f"{table.name} doesn't match its declaration; "
+                f"missing from the database: {sorted(declared - actual)}, undeclared: {sorted(actual - declared)}"
+            )
 
 
 def setup_dao_listeners():
-    fi_history = Table("financial_institutions_history", Base.metadata, autoload_with=engine)
-    mapping_history = Table("fi_to_type_mapping_history", Base.metadata, autoload_with=engine)
+    fi_history, mapping_history = get_history_tables()
 
-    insert_fi_history = _setup_fi_history(fi_history, mapping_history)
+    collect_fi_history, insert_fi_history = _setup_fi_history(fi_history, mapping_history)
 
-    event.listen(FinancialInstitutionDao, "before_insert", insert_fi_history)
-    event.listen(FinancialInstitutionDao, "before_update", insert_fi_history)
+    event.listen(Session, "before_flush", collect_fi_history)
+    event.listen(Session, "after_flush", insert_fi_history)
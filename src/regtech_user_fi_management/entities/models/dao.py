@@ -1,10 +1,24 @@
 from datetime import datetime
 from typing import List
-from sqlalchemy import ForeignKey, func, String, inspect
-from sqlalchemy.orm import Mapped, mapped_column, relationship, DeclarativeBase
-
-
-class Base(DeclarativeBase):
+from sqlalchemy import (
+    JSON,
+    Boolean,
+    Column,
+    DateTime,
+    ForeignKey,
+    Index,
+    Integer,
+    PrimaryKeyConstraint,
+    Table,
+    func,
+    String,
+    inspect,
+)
+from sqlalchemy.ext.asyncio import AsyncAttrs
+from sqlalchemy.orm import Mapped, mapped_column, query_expression, relationship, DeclarativeBase
+
+
+class Base(AsyncAttrs, DeclarativeBase):
     pass
 
 
@@ -18,7 +32,7 @@ class SblTypeMappingDao(Base):
     __mapper_args__ = {"version_id_col": version, "version_id_generator": False}
     lei: Mapped[str] = mapped_column("fi_id", ForeignKey("financial_institutions.lei"), primary_key=True)
     type_id: Mapped[str] = mapped_column(ForeignKey("sbl_institution_type.id"), primary_key=True)
-    sbl_type: Mapped["SBLInstitutionTypeDao"] = relationship(lazy="selectin")
+    sbl_type: Mapped["SBLInstitutionTypeDao"] = relationship()
     details: Mapped[str] = mapped_column(nullable=True)
     modified_by: Mapped[str] = mapped_column()
 
@@ -42,32 +56,34 @@ class FinancialInstitutionDao(AuditMixin, Base):
     lei: Mapped[str] = mapped_column(String(20), unique=True, index=True, primary_key=True)
     name: Mapped[str] = mapped_column(index=True)
     lei_status_code: Mapped[str] = mapped_column(ForeignKey("lei_status.code"), nullable=False)
-    lei_status: Mapped["LeiStatusDao"] = relationship(lazy="selectin")
+    lei_status: Mapped["LeiStatusDao"] = relationship()
     domains: Mapped[List["FinancialInstitutionDomainDao"]] = relationship(
-        "FinancialInstitutionDomainDao", back_populates="fi", lazy="selectin"
+        "FinancialInstitutionDomainDao", back_populates="fi"
     )
     tax_id: Mapped[str] = mapped_column(String(10), unique=True, nullable=True)
     rssd_id: Mapped[int] = mapped_column(unique=True, nullable=True)
     primary_federal_regulator_id: Mapped[str] = mapped_column(ForeignKey("federal_regulator.id"), nullable=True)
-    primary_federal_regulator: Mapped["FederalRegulatorDao"] = relationship(lazy="selectin")
+    primary_federal_regulator: Mapped["FederalRegulatorDao"] = relationship()
     hmda_institution_type_id: Mapped[str] = mapped_column(ForeignKey("hmda_institution_type.id"), nullable=True)
-    hmda_institution_type: Mapped["HMDAInstitutionTypeDao"] = relationship(lazy="selectin")
-    sbl_institution_types: Mapped[List[SblTypeMappingDao]] = relationship(lazy="selectin", cascade="all, delete-orphan")
+    hmda_institution_type: Mapped["HMDAInstitutionTypeDao"] = relationship()
+    sbl_institution_types: Mapped[List[SblTypeMappingDao]] = relationship(cascade="all, delete-orphan")
     hq_address_street_1: Mapped[str] = mapped_column()
     hq_address_street_2: Mapped[str] = mapped_column(nullable=True)
     hq_address_street_3: Mapped[str] = mapped_column(nullable=True)
     hq_address_street_4: Mapped[str] = mapped_column(nullable=True)
     hq_address_city: Mapped[str] = mapped_column()
     hq_address_state_code: Mapped[str] = mapped_column(ForeignKey("address_state.code"), nullable=True)
-    hq_address_state: Mapped["AddressStateDao"] = relationship(lazy="selectin")
+    hq_address_state: Mapped["AddressStateDao"] = relationship()
     hq_address_zip: Mapped[str] = mapped_column(String(5))
-    parent_lei: Mapped[str] = mapped_column(String(20), nullable=True)
+    parent_lei: Mapped[str] = mapped_column(String(20), index=True, nullable=True)
     parent_legal_name: Mapped[str] = mapped_column(nullable=True)
     parent_rssd_id: Mapped[int] = mapped_column(nullable=True)
-    top_holder_lei: Mapped[str] = mapped_column(String(20), nullable=True)
+    top_holder_lei: Mapped[str] = mapped_column(String(20), index=True, nullable=True)
     top_holder_legal_name: Mapped[str] = mapped_column(nullable=True)
     top_holder_rssd_id: Mapped[int] = mapped_column(nullable=True)
     modified_by: Mapped[str] = mapped_column()
+    # only populated by queries that ask for it, see institutions_repo.get_associated_institutions
+    approved: Mapped[bool | None] = query_expression()
 
 
 class FinancialInstitutionDomainDao(AuditMixin, Base):
@@ -112,3 +128,51 @@ class LeiStatusDao(AuditMixin, Base):
     code: Mapped[str] = mapped_column(index=True, primary_key=True, unique=True)
     name: Mapped[str] = mapped_column(unique=True, nullable=False)
     can_file: Mapped[bool] = mapped_column(index=True)
+
+
+# The history tables are written by the history listener and bulk upserts, never mapped. They're declared here,
+# matching the migrations, so startup doesn't need to reflect them; `check_history_tables` compares the two.
+fi_history_table = Table(
+    "financial_institutions_history",
+    Base.metadata,
+    Column("version", Integer, nullable=False),
+    Column("lei", String, nullable=False),
+    Column("name", String),
+    Column("is_active", Boolean),
+    Column("tax_id", String(10)),
+    Column("rssd_id", Integer),
+    Column("primary_federal_regulator_id", String(4)),
+    Column("hmda_institution_type_id", String),
+    Column("hq_address_street_1", String),
+    Column("hq_address_street_2", String),
+    Column("hq_address_city", String),
+    Column("hq_address_state_code", String(2)),
+    Column("hq_address_zip", String(5)),
+    Column("parent_lei", String(20)),
+    Column("parent_legal_name", String),
+    Column("parent_rssd_id", Integer),
+    Column("top_holder_lei", String(20)),
+    Column("top_holder_legal_name", String),
+    Column("top_holder_rssd_id", Integer),
+    Column("event_time", DateTime, server_default=func.now(), nullable=False),
+    Column("modified_by", String),
+    Column("changeset", JSON),
+    Column("lei_status_code", String),
+    PrimaryKeyConstraint("lei", "version"),
+    Index("ix_financial_institutions_history_lei_event_time", "lei", "event_time"),
+    Index("ix_financial_institutions_history_event_time_lei_version", "event_time", "lei", "version"),
+)
+
+sbl_type_mapping_history_table = Table(
+    "fi_to_type_mapping_history",
+    Base.metadata,
+    Column("version", Integer),
+    Column("fi_id", String, nullable=False),
+    Column("type_id", String, nullable=False),
+    Column("details", String),
+    Column("modified_by", String),
+    Column("event_time", DateTime, server_default=func.now(), nullable=False),
+    Column("changeset", JSON),
+    PrimaryKeyConstraint("fi_id", "type_id", "version"),
+    Index("ix_fi_to_type_mapping_history_fi_id_event_time", "fi_id", "event_time"),
+)
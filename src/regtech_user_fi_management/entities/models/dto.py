@@ -1,6 +1,7 @@
 from regtech_user_fi_management.config import regex_configs
 
-from typing import Generic, List, Set, Sequence
+from datetime import datetime
+from typing import Any, Dict, Generic, List, Set, Sequence
 from pydantic import BaseModel, model_validator
 from typing import TypeVar
 
@@ -170,3 +171,39 @@ class FinancialInstitutionWithRelationsDto(FinancialInstitutionDto):
 
 class FinancialInstitutionAssociationDto(FinancialInstitutionWithRelationsDto):
     approved: bool
+
+
+class FinancialInstitutionBulkUpsertDto(BaseModel):
+    created: List[str] = []
+    updated: List[str] = []
+    unchanged: List[str] = []
+    groups: Dict[str, str] = {}
+
+
+class FinancialInstitutionHistoryDto(BaseModel):
+    lei: str
+    version: int
+    event_time: datetime
+    modified_by: str | None = None
+    changeset: Dict[str, Any] | None = None
+
+    class Config:
+        from_attributes = True
+
+
+class FinancialInstitutionFamilyMemberDto(BaseModel):
+    lei: str
+    name: str
+    parent_lei: str | None = None
+    top_holder_lei: str | None = None
+    depth: int
+
+    class Config:
+        from_attributes = True
+
+
+class FinancialInstitutionFamilyDto(BaseModel):
+    lei: str
+    ancestors: List[FinancialInstitutionFamilyMemberDto] = []
+    descendants: List[FinancialInstitutionFamilyMemberDto] = []
+    truncated: bool = False
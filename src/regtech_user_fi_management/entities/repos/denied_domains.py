@@ -0,0 +1,33 @@
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from regtech_user_fi_management.config import settings
+from regtech_user_fi_management.entities.models.dao import DeniedDomainDao
+from regtech_user_fi_management.metrics import instrumented
+from regtech_user_fi_management.util.domain_suffix_set import DomainSuffixSet
+from regtech_user_fi_management.util.ttl_cache import TtlCache
+
+DENIED_DOMAINS_KEY = "denied_domains"
+
+# Every check_domain call consults the denied domains, so the whole table is held in memory
+# and reloaded from the DB once the TTL lapses.
+denied_domains_cache: TtlCache[str, DomainSuffixSet] = TtlCache(
+    DENIED_DOMAINS_KEY, ttl=settings.denied_domains_refresh_interval
+)
+
+
+@instrumented
+async def load_denied_domains(session: AsyncSession) -> DomainSuffixSet:
+    denied_domains = DomainSuffixSet(await session.scalars(select(DeniedDomainDao.domain)))
+    denied_domains_cache.set(DENIED_DOMAINS_KEY, denied_domains)
+    return denied_domains
+
+
+async def get_denied_domains(session: AsyncSession) -> DomainSuffixSet:
+    if (denied_domains := denied_domains_cache.get(DENIED_DOMAINS_KEY)) is not None:
+        return denied_domains
+    return await load_denied_domains(session)
+
+
+def invalidate_denied_domains() -> None:
+    denied_domains_cache.invalidate()
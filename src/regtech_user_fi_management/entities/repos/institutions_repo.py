@@ -1,65 +1,386 @@
-from typing import List, Sequence, Set
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Dict, List, Sequence, Set, Tuple
 
-from sqlalchemy.orm import Session
+from sqlalchemy import (
+    Column,
+    ColumnElement,
+    Row,
+    Table,
+    column,
+    delete,
+    func,
+    literal,
+    or_,
+    select,
+    table,
+    tuple_,
+    union_all,
+)
+from sqlalchemy.orm import aliased, with_expression
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from regtech_api_commons.models.auth import AuthenticatedUser
 
-from .repo_utils import get_associated_sbl_types
+from .denied_domains import get_denied_domains
+from .loader_profiles import LoaderProfile, loader_profiles
+from .repo_utils import get_associated_sbl_types, get_history_tables, upsert_insert
 
+from regtech_user_fi_management.entities.engine.notifications import history_notification
 from regtech_user_fi_management.entities.models.dao import (
     FinancialInstitutionDao,
     FinancialInstitutionDomainDao,
     HMDAInstitutionTypeDao,
     SBLInstitutionTypeDao,
-    DeniedDomainDao,
     AddressStateDao,
     FederalRegulatorDao,
+    LeiStatusDao,
+    SblTypeMappingDao,
 )
 
 from regtech_user_fi_management.entities.models.dto import (
+    FinancialInstitutionBulkUpsertDto,
     FinancialInstitutionDto,
     FinancialInstitutionDomainCreate,
+    FinancialInstitutionFamilyDto,
+    FinancialInstitutionFamilyMemberDto,
+    FinancialInstitutionWithRelationsDto,
     SblTypeAssociationDto,
 )
+from regtech_user_fi_management.metrics import instrumented
 
 
-def get_institutions(
-    session: Session,
+@instrumented
+async def get_institutions(
+    session: AsyncSession,
     leis: List[str] | None = None,
     domain: str = "",
     page: int = 0,
     count: int = 100,
+    after_lei: str | None = None,
+    profile: LoaderProfile = "full",
 ) -> Sequence[FinancialInstitutionDao]:
-    query = session.query(FinancialInstitutionDao)
+    """
+    Pages through institutions in lei order; when `after_lei` is given the page starts right after
+    that lei using the primary key index (keyset pagination) and `page` is ignored.
+    """
+    stmt = select(FinancialInstitutionDao).options(*loader_profiles[profile]).order_by(FinancialInstitutionDao.lei)
     if leis is not None:
-        query = query.filter(FinancialInstitutionDao.lei.in_(leis))
+        stmt = stmt.filter(FinancialInstitutionDao.lei.in_(leis))
     elif d := domain.strip():
-        query = query.join(FinancialInstitutionDomainDao).filter(FinancialInstitutionDomainDao.domain == d)
-    return query.limit(count).offset(page * count).all()
+        stmt = stmt.join(FinancialInstitutionDomainDao).filter(FinancialInstitutionDomainDao.domain == d)
+    if after_lei is not None:
+        stmt = stmt.filter(FinancialInstitutionDao.lei > after_lei).limit(count)
+    else:
+        stmt = stmt.limit(count).offset(page * count)
+    return (await session.scalars(stmt)).all()
+
+
+@instrumented
+async def get_associated_institutions(
+    session: AsyncSession, leis: List[str], email_domain: str, profile: LoaderProfile = "full"
+) -> Sequence[FinancialInstitutionDao]:
+    """
+    Loads the given institutions with `approved` computed in the query: whether `email_domain`
+    is one of the institution's domains.
+    """
+    approved = (
+        select(FinancialInstitutionDomainDao.lei)
+        .where(
+            FinancialInstitutionDomainDao.lei == FinancialInstitutionDao.lei,
+            FinancialInstitutionDomainDao.domain == email_domain,
+        )
+        .exists()
+    )
+    stmt = (
+        select(FinancialInstitutionDao)
+        .where(FinancialInstitutionDao.lei.in_(leis))
+        .options(with_expression(FinancialInstitutionDao.approved, approved), *loader_profiles[profile])
+        .order_by(FinancialInstitutionDao.lei)
+    )
+    return (await session.scalars(stmt)).all()
+
+
+async def stream_institutions(
+    session: AsyncSession, chunk_size: int = 500, profile: LoaderProfile = "full"
+) -> AsyncIterator[Sequence[FinancialInstitutionDao]]:
+    """
+    Yields every institution in lei order, `chunk_size` at a time, from a server-side cursor.
+    Collections are loaded once per chunk, and each chunk is expunged from the session
+    once the caller is done with it so memory stays flat regardless of table size.
+    """
+    stmt = (
+        select(FinancialInstitutionDao)
+        .options(*loader_profiles[profile])
+        .order_by(FinancialInstitutionDao.lei)
+        .execution_options(yield_per=chunk_size)
+    )
+    result = await session.stream_scalars(stmt)
+    async for chunk in result.partitions():
+        yield chunk
+        for fi in chunk:
+            session.expunge(fi)
+
+
+SEARCH_COLUMNS = (
+    FinancialInstitutionDao.name,
+    FinancialInstitutionDao.parent_legal_name,
+    FinancialInstitutionDao.top_holder_legal_name,
+)
+
+
+@instrumented
+async def search_institutions(
+    session: AsyncSession, query: str, limit: int = 20, profile: LoaderProfile = "full"
+) -> Sequence[FinancialInstitutionDao]:
+    """
+    Institutions whose name, parent or top holder name fuzzily matches `query`, best match first.
+    On Postgres this ranks by pg_trgm word similarity and each match is served by that column's trigram index;
+    other dialects fall back to a case insensitive substring match ordered by name.
+    """
+    stmt = select(FinancialInstitutionDao).options(*loader_profiles[profile])
+    if session.get_bind().dialect.name == "postgresql":
+        term = literal(query)
+        stmt = stmt.filter(or_(*(term.op("<%")(column) for column in SEARCH_COLUMNS))).order_by(
+            func.greatest(*(func.word_similarity(term, column) for column in SEARCH_COLUMNS)).desc()
+        )
+    else:
+        stmt = stmt.filter(or_(*(column.icontains(query, autoescape=True) for column in SEARCH_COLUMNS))).order_by(
+            FinancialInstitutionDao.name
+        )
+    return (await session.scalars(stmt.order_by(FinancialInstitutionDao.lei).limit(limit))).all()
+
+
+@instrumented
+async def get_institution_family(
+    session: AsyncSession, lei: str, max_depth: int = 10
+) -> FinancialInstitutionFamilyDto | None:
+    """
+    The institution's ancestors, following `parent_lei` up, and all its descendants, following it down,
+    in a single statement of two recursive CTEs. Each walk carries the path of leis it has visited so a
+    cycle in the data ends it, and stops `max_depth` levels away; walking one level further only tells
+    whether the family was truncated.
+    """
+    fi = FinancialInstitutionDao
+    root = select(fi.lei, fi.parent_lei, literal(0).label("depth"), ("/" + fi.lei + "/").label("path")).where(
+        fi.lei == lei
+    )
+
+    ancestors = root.cte("ancestors", recursive=True)
+    parent = aliased(fi)
+    ancestors = ancestors.union_all(
+        select(parent.lei, parent.parent_lei, ancestors.c.depth - 1, ancestors.c.path + parent.lei + "/")
+        .join_from(ancestors, parent, parent.lei == ancestors.c.parent_lei)
+        .where(ancestors.c.depth > -(max_depth + 1), ~ancestors.c.path.contains("/" + parent.lei + "/"))
+    )
+
+    descendants = root.cte("descendants", recursive=True)
+    child = aliased(fi)
+    descendants = descendants.union_all(
+        select(child.lei, child.parent_lei, descendants.c.depth + 1, descendants.c.path + child.lei + "/")
+        .join_from(descendants, child, child.parent_lei == descendants.c.lei)
+        .where(descendants.c.depth < max_depth + 1, ~descendants.c.path.contains("/" + child.lei + "/"))
+    )
+
+    members = union_all(
+        select(ancestors.c.lei, ancestors.c.depth), select(descendants.c.lei, descendants.c.depth)
+    ).subquery()
+    rows = (
+        await session.execute(
+            select(fi.lei, fi.name, fi.parent_lei, fi.top_holder_lei, members.c.depth)
+            .join(members, members.c.lei == fi.lei)
+            .order_by(members.c.depth, fi.lei)
+        )
+    ).all()
+    if not rows:
+        return None
+    family = FinancialInstitutionFamilyDto(lei=lei)
+    for row in rows:
+        if abs(row.depth) > max_depth:
+            family.truncated = True
+        elif row.depth < 0:
+            family.ancestors.append(FinancialInstitutionFamilyMemberDto.model_validate(row))
+        elif row.depth > 0:
+            family.descendants.append(FinancialInstitutionFamilyMemberDto.model_validate(row))
+    # closest ancestor first
+    family.ancestors.reverse()
+    return family
+
+
+@instrumented
+async def get_institution(
+    session: AsyncSession, lei: str, profile: LoaderProfile = "full"
+) -> FinancialInstitutionDao | None:
+    return await session.get(FinancialInstitutionDao, lei, options=loader_profiles[profile])
+
+
+@instrumented
+async def get_institution_version(session: AsyncSession, lei: str) -> Row[Tuple[int, int]] | None:
+    """
+    Returns the institution's version and domain count without loading the institution or its relationships.
+    """
+    domain_count = (
+        select(func.count())
+        .where(FinancialInstitutionDomainDao.lei == FinancialInstitutionDao.lei)
+        .correlate(FinancialInstitutionDao)
+        .scalar_subquery()
+    )
+    stmt = select(FinancialInstitutionDao.version, domain_count.label("domain_count")).where(
+        FinancialInstitutionDao.lei == lei
+    )
+    return (await session.execute(stmt)).one_or_none()
+
+
+def _history_entry_columns(fi_history: Table) -> Tuple[Column, ...]:
+    c = fi_history.c
+    return c.lei, c.version, c.event_time, c.modified_by, c.changeset
+
+
+@instrumented
+async def get_institution_history(
+    session: AsyncSession, lei: str, count: int = 100, before_version: int | None = None
+) -> Sequence[Row]:
+    """
+    The institution's history entries, newest first; when `before_version` is given the page starts
+    right below that version using the history primary key.
+    """
+    fi_history, _ = get_history_tables()
+    stmt = (
+        select(*_history_entry_columns(fi_history))
+        .where(fi_history.c.lei == lei)
+        .order_by(fi_history.c.version.desc())
+        .limit(count)
+    )
+    if before_version is not None:
+        stmt = stmt.where(fi_history.c.version < before_version)
+    return (await session.execute(stmt)).all()
 
 
-def get_institution(session: Session, lei: str) -> FinancialInstitutionDao | None:
-    return session.get(FinancialInstitutionDao, lei)
+pg_stat_activity = table("pg_stat_activity", column("xact_start"), column("backend_type"), column("datname"))
 
 
-def get_sbl_types(session: Session) -> Sequence[SBLInstitutionTypeDao]:
-    return session.query(SBLInstitutionTypeDao).all()
+def change_feed_cutoff(dialect_name: str, settle_seconds: float) -> ColumnElement | None:
+    """
+    The event_time change feed entries must be older than to be returned. event_time is when the writing
+    transaction started, so one still running can commit entries that sort before ones already returned.
+    On Postgres nothing is returned from the start of the oldest transaction still running in this database
+    on; sessions of other roles only show theirs with pg_read_all_stats, so history must be written by the
+    app's role. Elsewhere entries are held back for `settle_seconds` by the database's clock, which only
+    covers writes that commit within that window.
+    """
+    if dialect_name == "postgresql":
+        return (
+            select(func.min(pg_stat_activity.c.xact_start))
+            .where(
+                pg_stat_activity.c.backend_type == "client backend",
+                pg_stat_activity.c.datname == func.current_database(),
+            )
+            .scalar_subquery()
+        )
+    if settle_seconds:
+        return func.datetime("now", f"-{settle_seconds} seconds")
+
 
+@instrumented
+async def get_institution_changes(
+    session: AsyncSession,
+    after: Tuple[datetime, str, int] | None = None,
+    count: int = 100,
+    settle_seconds: float = 0,
+) -> Sequence[Row]:
+    """
+    History entries across all institutions in (event_time, lei, version) order, starting right after
+    the `after` key using the history's event_time index. Entries that may still be joined by ones sorting
+    before them are held back, see `change_feed_cutoff`.
+    """
+    fi_history, _ = get_history_tables()
+    stmt = (
+        select(*_history_entry_columns(fi_history))
+        .order_by(fi_history.c.event_time, fi_history.c.lei, fi_history.c.version)
+        .limit(count)
+    )
+    if after is not None:
+        stmt = stmt.where(tuple_(fi_history.c.event_time, fi_history.c.lei, fi_history.c.version) > tuple_(*after))
+    if (cutoff := change_feed_cutoff(session.get_bind().dialect.name, settle_seconds)) is not None:
+        stmt = stmt.where(fi_history.c.event_time < cutoff)
+    return (await session.execute(stmt)).all()
 
-def get_hmda_types(session: Session) -> Sequence[HMDAInstitutionTypeDao]:
-    return session.query(HMDAInstitutionTypeDao).all()
 
+@instrumented
+async def get_institution_as_of(
+    session: AsyncSession, lei: str, as_of: int | datetime
+) -> FinancialInstitutionWithRelationsDto | None:
+    """
+    Rebuilds the institution as it was at version `as_of`, or as of the latest change at or before
+    the `as_of` time, from its history: one query on the institution history, joined to the reference
+    tables, and one on the type mapping history for that version. Domains aren't versioned, so they're
+    left empty.
+    """
+    fi_history, mapping_history = get_history_tables()
+    stmt = (
+        select(fi_history, LeiStatusDao, FederalRegulatorDao, HMDAInstitutionTypeDao, AddressStateDao)
+        .outerjoin(LeiStatusDao, LeiStatusDao.code == fi_history.c.lei_status_code)
+        .outerjoin(FederalRegulatorDao, FederalRegulatorDao.id == fi_history.c.primary_federal_regulator_id)
+        .outerjoin(HMDAInstitutionTypeDao, HMDAInstitutionTypeDao.id == fi_history.c.hmda_institution_type_id)
+        .outerjoin(AddressStateDao, AddressStateDao.code == fi_history.c.hq_address_state_code)
+        .where(fi_history.c.lei == lei)
+    )
+    if isinstance(as_of, datetime):
+        # event_time is stored without a time zone, in UTC
+        if as_of.tzinfo:
+            as_of = as_of.astimezone(timezone.utc).replace(tzinfo=None)
+        stmt = (
+            stmt.where(fi_history.c.event_time <= as_of)
+            .order_by(fi_history.c.event_time.desc(), fi_history.c.version.desc())
+            .limit(1)
+        )
+    else:
+        stmt = stmt.where(fi_history.c.version == as_of)
+    if not (row := (await session.execute(stmt)).first()):
+        return None
 
-def get_address_states(session: Session) -> Sequence[AddressStateDao]:
-    return session.query(AddressStateDao).all()
+    fi = {key: row._mapping[column] for key, column in fi_history.c.items()}
+    types = await session.execute(
+        select(SBLInstitutionTypeDao, mapping_history.c.details)
+        .join(SBLInstitutionTypeDao, SBLInstitutionTypeDao.id == mapping_history.c.type_id)
+        .where(mapping_history.c.fi_id == lei, mapping_history.c.version == fi["version"])
+        .order_by(mapping_history.c.type_id)
+    )
+    return FinancialInstitutionWithRelationsDto.model_validate(
+        {
+            **fi,
+            "lei_status": row.LeiStatusDao,
+            "primary_federal_regulator": row.FederalRegulatorDao,
+            "hmda_institution_type": row.HMDAInstitutionTypeDao,
+            "hq_address_state": row.AddressStateDao,
+            "sbl_institution_types": [{"sbl_type": sbl_type, "details": details} for sbl_type, details in types],
+        },
+        from_attributes=True,
+    )
 
 
-def get_federal_regulators(session: Session) -> Sequence[FederalRegulatorDao]:
-    return session.query(FederalRegulatorDao).all()
+@instrumented
+async def get_sbl_types(session: AsyncSession) -> Sequence[SBLInstitutionTypeDao]:
+    return (await session.scalars(select(SBLInstitutionTypeDao))).all()
 
 
-def upsert_institution(
-    session: Session, fi: FinancialInstitutionDto, user: AuthenticatedUser
+@instrumented
+async def get_hmda_types(session: AsyncSession) -> Sequence[HMDAInstitutionTypeDao]:
+    return (await session.scalars(select(HMDAInstitutionTypeDao))).all()
+
+
+@instrumented
+async def get_address_states(session: AsyncSession) -> Sequence[AddressStateDao]:
+    return (await session.scalars(select(AddressStateDao))).all()
+
+
+@instrumented
+async def get_federal_regulators(session: AsyncSession) -> Sequence[FederalRegulatorDao]:
+    return (await session.scalars(select(FederalRegulatorDao))).all()
+
+
+@instrumented
+async def upsert_institution(
+    session: AsyncSession, fi: FinancialInstitutionDto, user: AuthenticatedUser
 ) -> FinancialInstitutionDao:
     fi_data = fi.__dict__.copy()
     fi_data.pop("_sa_instance_state", None)
@@ -69,15 +390,118 @@ def upsert_institution(
         types_association = get_associated_sbl_types(fi.lei, user.id, fi.sbl_institution_types)
         fi_data["sbl_institution_types"] = types_association
 
-    db_fi = session.merge(FinancialInstitutionDao(**fi_data, modified_by=user.id))
-    session.commit()
-    return db_fi
+    db_fi = await session.merge(FinancialInstitutionDao(**fi_data, modified_by=user.id))
+    await session.commit()
+    # relationships can't be lazy loaded under asyncio, so reload them for serialization
+    return await session.get(
+        FinancialInstitutionDao, db_fi.lei, options=loader_profiles["full"], populate_existing=True
+    )
+
 
+def _type_changes(old_types: List[Dict[str, Any]], new_types: List[Dict[str, Any]], version: int) -> Dict[str, Any]:
+    """
+    Mirrors the `sbl_institution_types` changeset the history listener records; like `SblTypeMappingDao`
+    equality, a changed detail shows up as the old association removed and the new one added.
+    """
+    old_keys = {(t["type_id"], t["details"]) for t in old_types}
+    new_keys = {(t["type_id"], t["details"]) for t in new_types}
+    removed = [t for t in old_types if (t["type_id"], t["details"]) not in new_keys]
+    added = [{**t, "version": version} for t in new_types if (t["type_id"], t["details"]) not in old_keys]
+    if not removed and not added:
+        return {}
+    old = {"old": removed} if removed else {}
+    new = {"new": added} if added else {}
+    return {**old, **new, "field_changes": []}
 
-def update_sbl_types(
-    session: Session, user: AuthenticatedUser, lei: str, sbl_types: Sequence[SblTypeAssociationDto | str]
+
+@instrumented
+async def bulk_upsert_institutions(
+    session: AsyncSession, fis: Sequence[FinancialInstitutionDto], user: AuthenticatedUser, chunk_size: int = 1000
+) -> FinancialInstitutionBulkUpsertDto:
+    """
+    Writes institutions with one INSERT ... ON CONFLICT per chunk instead of a merge per institution.
+    Institutions are compared against their current rows first, so unchanged ones aren't rewritten or versioned;
+    history for the changed ones is written with a single insert per history table per chunk.
+    Each chunk is committed on its own, re-running a partially applied load is safe.
+    """
+    fi_table = FinancialInstitutionDao.__table__
+    mapping_table = SblTypeMappingDao.__table__
+    fi_history, mapping_history = get_history_tables()
+    fi_history_columns = set(fi_history.columns.keys())
+    result = FinancialInstitutionBulkUpsertDto()
+
+    for start in range(0, len(fis), chunk_size):
+        chunk = fis[start : start + chunk_size]
+        leis = [fi.lei for fi in chunk]
+        current_rows = {
+            row["lei"]: row
+            for row in (
+                await session.execute(select(fi_table).where(fi_table.c.lei.in_(leis)).with_for_update())
+            ).mappings()
+        }
+        current_types: Dict[str, List[Dict[str, Any]]] = {lei: [] for lei in leis}
+        for row in (await session.execute(select(mapping_table).where(mapping_table.c.fi_id.in_(leis)))).mappings():
+            current_types[row["fi_id"]].append(dict(row))
+
+        fi_rows, type_rows, fi_history_rows = [], [], []
+        for fi in chunk:
+            current = current_rows.get(fi.lei)
+            new_row = {**fi.model_dump(exclude={"sbl_institution_types", "version"}), "modified_by": user.id}
+            old_types = current_types[fi.lei]
+            kept_by = {(t["type_id"], t["details"]): t["modified_by"] for t in old_types}
+            new_types = [
+                {
+                    "fi_id": fi.lei,
+                    "type_id": t.type_id,
+                    "details": t.details,
+                    "modified_by": kept_by.get((t.type_id, t.details), user.id),
+                }
+                for t in get_associated_sbl_types(fi.lei, user.id, fi.sbl_institution_types)
+            ]
+            version = current["version"] + 1 if current and current["version"] else 1
+            changes = {
+                key: {"old": [current[key]] if current else [], "new": [value]}
+                for key, value in new_row.items()
+                if not current or current[key] != value
+            }
+            if type_changes := _type_changes(old_types, new_types, version):
+                changes["sbl_institution_types"] = type_changes
+            if current and changes.keys() <= {"modified_by"}:
+                result.unchanged.append(fi.lei)
+                continue
+            (result.updated if current else result.created).append(fi.lei)
+            new_row["version"] = version
+            fi_rows.append(new_row)
+            fi_history_rows.append(
+                {key: value for key, value in new_row.items() if key in fi_history_columns} | {"changeset": changes}
+            )
+            type_rows.extend({**t, "version": version} for t in new_types)
+
+        if fi_rows:
+            changed_leis = [row["lei"] for row in fi_rows]
+            stmt = upsert_insert(session, fi_table).values(fi_rows)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[fi_table.c.lei],
+                set_={key: stmt.excluded[key] for key in fi_rows[0] if key != "lei"} | {"event_time": func.now()},
+            )
+            await session.execute(stmt)
+            await session.execute(delete(mapping_table).where(mapping_table.c.fi_id.in_(changed_leis)))
+            if type_rows:
+                await session.execute(mapping_table.insert().values(type_rows))
+            await session.execute(fi_history.insert().values(fi_history_rows))
+            if type_rows:
+                await session.execute(mapping_history.insert().values(type_rows))
+            if (notification := history_notification(session.get_bind().dialect.name)) is not None:
+                await session.execute(notification)
+        await session.commit()
+    return result
+
+
+@instrumented
+async def update_sbl_types(
+    session: AsyncSession, user: AuthenticatedUser, lei: str, sbl_types: Sequence[SblTypeAssociationDto | str]
 ) -> FinancialInstitutionDao | None:
-    if fi := get_institution(session, lei):
+    if fi := await get_institution(session, lei, "sbl_types"):
         new_types = set(get_associated_sbl_types(lei, user.id, sbl_types))
         old_types = set(fi.sbl_institution_types)
         add_types = new_types.difference(old_types)
@@ -87,12 +511,16 @@ def update_sbl_types(
         fi.sbl_institution_types.extend(add_types)
         for type in fi.sbl_institution_types:
             type.version = fi.version
-        session.commit()
+        await session.commit()
+        # newly associated types only carry the type_id, load the sbl_type relation for serialization
+        for type in fi.sbl_institution_types:
+            await type.awaitable_attrs.sbl_type
         return fi
 
 
-def add_domains(
-    session: Session, lei: str, domains: List[FinancialInstitutionDomainCreate]
+@instrumented
+async def add_domains(
+    session: AsyncSession, lei: str, domains: List[FinancialInstitutionDomainCreate]
 ) -> Set[FinancialInstitutionDomainDao]:
     daos = set(
         map(
@@ -101,11 +529,12 @@ def add_domains(
         )
     )
     session.add_all(daos)
-    session.commit()
+    await session.commit()
     return daos
 
 
-def is_domain_allowed(session: Session, domain: str) -> bool:
+@instrumented
+async def is_domain_allowed(session: AsyncSession, domain: str) -> bool:
     if domain:
-        return session.get(DeniedDomainDao, domain) is None
+        return domain not in await get_denied_domains(session)
     return False
@@ -0,0 +1,30 @@
+from typing import Dict, Literal, Sequence
+
+from sqlalchemy.orm import joinedload, raiseload, selectinload
+from sqlalchemy.orm.interfaces import LoaderOption
+
+from regtech_user_fi_management.entities.models.dao import FinancialInstitutionDao, SblTypeMappingDao
+
+LoaderProfile = Literal["full", "sbl_types", "none"]
+
+# Relationships are lazy loaded by default, which isn't possible once a DAO leaves the session under asyncio,
+# so every repo function that returns institutions picks the profile matching what its callers read:
+# many-to-one lookups are joined into the institution query, collections are loaded with one extra query each.
+# Relationships a profile leaves out raise when read, so a caller reading more than its profile loads fails loudly.
+_sbl_types = selectinload(FinancialInstitutionDao.sbl_institution_types).joinedload(SblTypeMappingDao.sbl_type)
+
+loader_profiles: Dict[LoaderProfile, Sequence[LoaderOption]] = {
+    # everything FinancialInstitutionWithRelationsDto serializes
+    "full": (
+        joinedload(FinancialInstitutionDao.lei_status),
+        joinedload(FinancialInstitutionDao.primary_federal_regulator),
+        joinedload(FinancialInstitutionDao.hmda_institution_type),
+        joinedload(FinancialInstitutionDao.hq_address_state),
+        selectinload(FinancialInstitutionDao.domains),
+        _sbl_types,
+    ),
+    # the sbl type associations, with their types, only
+    "sbl_types": (_sbl_types, raiseload("*")),
+    # columns only
+    "none": (raiseload("*"),),
+}
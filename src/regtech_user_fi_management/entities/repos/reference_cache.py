@@ -0,0 +1,48 @@
+from typing import Awaitable, Callable, Dict, Literal, Sequence, Tuple, Type, get_args
+
+from pydantic import BaseModel
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import regtech_user_fi_management.entities.repos.institutions_repo as repo
+from regtech_user_fi_management.config import settings
+from regtech_user_fi_management.entities.models.dto import AddressStateDto, FederalRegulatorDto, InstitutionTypeDto
+from regtech_user_fi_management.metrics import instrumented
+from regtech_user_fi_management.util.ttl_cache import TtlCache
+
+ReferenceType = Literal["sbl_types", "hmda_types", "address_states", "federal_regulators"]
+
+# The reference tables are seeded by migrations and rarely change, so their rows are kept
+# as DTOs (not session bound DAOs) and served from memory until the TTL lapses.
+reference_cache: TtlCache[ReferenceType, Sequence[BaseModel]] = TtlCache(
+    "reference_data", ttl=settings.reference_data_ttl
+)
+
+_loaders: Dict[ReferenceType, Tuple[Callable[[AsyncSession], Awaitable[Sequence]], Type[BaseModel]]] = {
+    "sbl_types": (lambda session: repo.get_sbl_types(session), InstitutionTypeDto),
+    "hmda_types": (lambda session: repo.get_hmda_types(session), InstitutionTypeDto),
+    "address_states": (lambda session: repo.get_address_states(session), AddressStateDto),
+    "federal_regulators": (lambda session: repo.get_federal_regulators(session), FederalRegulatorDto),
+}
+
+
+@instrumented
+async def load_reference_data(session: AsyncSession, ref_type: ReferenceType) -> Sequence[BaseModel]:
+    loader, dto = _loaders[ref_type]
+    data = [dto.model_validate(row) for row in await loader(session)]
+    reference_cache.set(ref_type, data)
+    return data
+
+
+async def get_reference_data(session: AsyncSession, ref_type: ReferenceType) -> Sequence[BaseModel]:
+    if (data := reference_cache.get(ref_type)) is not None:
+        return data
+    return await load_reference_data(session, ref_type)
+
+
+async def warm_up_reference_cache(session: AsyncSession) -> None:
+    for ref_type in get_args(ReferenceType):
+        await load_reference_data(session, ref_type)
+
+
+def invalidate_reference_cache(ref_type: ReferenceType | None = None) -> None:
+    reference_cache.invalidate(ref_type)
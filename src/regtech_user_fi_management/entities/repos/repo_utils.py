@@ -1,5 +1,13 @@
-from typing import Sequence, TypeVar
-from regtech_user_fi_management.entities.models.dao import Base, SblTypeMappingDao
+from typing import Sequence, Tuple, TypeVar
+from sqlalchemy import Insert, Table
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from regtech_user_fi_management.entities.models.dao import (
+    Base,
+    SblTypeMappingDao,
+    fi_history_table,
+    sbl_type_mapping_history_table,
+)
 from regtech_user_fi_management.entities.models.dto import SblTypeAssociationDto
 
 T = TypeVar("T", bound=Base)
@@ -16,3 +24,20 @@ def get_associated_sbl_types(
         )
         for t in types
     ]
+
+
+def get_history_tables() -> Tuple[Table, Table]:
+    return fi_history_table, sbl_type_mapping_history_table
+
+
+def upsert_insert(session: AsyncSession, table: Table) -> Insert:
+    """
+    Returns the dialect specific INSERT that supports ON CONFLICT for the session's database.
+    """
+    match session.get_bind().dialect.name:
+        case "postgresql":
+            return postgresql.insert(table)
+        case "sqlite":
+            return sqlite.insert(table)
+        case dialect:
+            raise NotImplementedError(f"Upsert is not supported for {dialect}")
@@ -0,0 +1,126 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from http import HTTPStatus
+from typing import Any, Callable, Dict, Iterable, Set, Tuple, TypeVar
+
+from regtech_api_commons.api.exceptions import RegTechHttpException
+from regtech_api_commons.models.auth import RegTechUser
+from regtech_api_commons.oauth2.oauth2_admin import OAuth2Admin
+
+from regtech_user_fi_management.config import kc_settings, settings
+from regtech_user_fi_management.metrics import KEYCLOAK_IN_FLIGHT, KEYCLOAK_LATENCY
+from regtech_user_fi_management.util.circuit_breaker import CircuitBreaker, CircuitOpenError
+
+R = TypeVar("R")
+
+
+class KeycloakAdmin:
+    """
+    Async access to the Keycloak admin API through a single shared `OAuth2Admin`, so every call reuses
+    its pooled HTTP connections. Calls run on a dedicated, bounded thread pool instead of the one serving
+    sync endpoints and dependencies, so a slow Keycloak can't starve DB only endpoints. Calls wait for
+    a free worker before they're submitted, and only the call itself is bounded by `timeout`, so a burst
+    of calls queues instead of timing out. Repeated failures open a circuit breaker that fails calls fast with a 503.
+    """
+
+    def __init__(self, oauth2_admin: OAuth2Admin, max_workers: int, timeout: float, breaker: CircuitBreaker):
+        self.oauth2_admin = oauth2_admin
+        self.timeout = timeout
+        self.breaker = breaker
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="keycloak")
+        self._slots = asyncio.Semaphore(max_workers)
+
+    async def _call(self, fn: Callable[..., R], *args) -> R:
+        async with self._slots:
+            return await self._call_with_slot(fn, *args)
+
+    async def _call_with_slot(self, fn: Callable[..., R], *args) -> R:
+        # checked once a worker is free, so calls queued behind a failing Keycloak fail fast once the circuit opens
+        try:
+            self.breaker.before_call()
+        except CircuitOpenError as e:
+            raise RegTechHttpException(HTTPStatus.SERVICE_UNAVAILABLE, name="Keycloak Unavailable", detail=str(e))
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        outcome = "error"
+        try:
+            with KEYCLOAK_IN_FLIGHT.track_inprogress():
+                result = await asyncio.wait_for(loop.run_in_executor(self._executor, partial(fn, *args)), self.timeout)
+            outcome = "success"
+        except TimeoutError:
+            outcome = "timeout"
+            self.breaker.record_failure()
+            raise RegTechHttpException(
+                HTTPStatus.GATEWAY_TIMEOUT,
+                name="Keycloak Timeout",
+                detail=f"Keycloak didn't respond in {self.timeout}s",
+            )
+        except Exception as e:
+            # client errors mean Keycloak is up and answering, they shouldn't trip the breaker
+            if getattr(e, "status_code", HTTPStatus.INTERNAL_SERVER_ERROR) >= HTTPStatus.INTERNAL_SERVER_ERROR:
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+            raise
+        except BaseException:
+            # cancelled; no outcome to record, but a half open trial mustn't be left in flight
+            outcome = "cancelled"
+            self.breaker.release_trial()
+            raise
+        finally:
+            KEYCLOAK_LATENCY.labels(getattr(fn, "__name__", "call"), outcome).observe(time.perf_counter() - start)
+        self.breaker.record_success()
+        return result
+
+    async def get_user(self, user_id: str) -> Any:
+        return await self._call(self.oauth2_admin.get_user, user_id)
+
+    async def update_user(self, user_id: str, payload: Dict[str, Any]) -> None:
+        await self._call(self.oauth2_admin.update_user, user_id, payload)
+
+    async def associate_to_leis(self, user_id: str, leis: Set[str]) -> None:
+        await self._call(self.oauth2_admin.associate_to_leis, user_id, leis)
+
+    async def upsert_group(self, lei: str, name: str) -> str:
+        return await self._call(self.oauth2_admin.upsert_group, lei, name)
+
+    async def upsert_groups(self, groups: Dict[str, str]) -> Dict[str, str]:
+        """
+        Creates or renames the group for each lei to name pair; `_call` bounds how many run at once.
+        """
+
+        async def upsert_group(lei: str, name: str) -> Tuple[str, str]:
+            return lei, await self.upsert_group(lei, name)
+
+        return dict(await asyncio.gather(*(upsert_group(lei, name) for lei, name in groups.items())))
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def apply_user_writes(user: Any, name: str | None = None, leis: Iterable[str] | None = None) -> RegTechUser:
+    """
+    Builds the user representation that results from a profile or association write,
+    so the user doesn't have to be fetched back from Keycloak afterwards.
+    """
+    current = RegTechUser.model_validate(user, from_attributes=True)
+    update: Dict[str, Any] = {}
+    if name is not None:
+        update["name"] = name
+    if leis:
+        update["institutions"] = current.institutions + sorted(set(leis).difference(current.institutions))
+    return RegTechUser(**{**current.model_dump(include=set(RegTechUser.model_fields)), **update})
+
+
+keycloak_admin = KeycloakAdmin(
+    OAuth2Admin(kc_settings),
+    max_workers=settings.keycloak_concurrency,
+    timeout=settings.keycloak_timeout,
+    breaker=CircuitBreaker(
+        "keycloak",
+        failure_threshold=settings.keycloak_breaker_failures,
+        reset_timeout=settings.keycloak_breaker_reset,
+    ),
+)
@@ -1,17 +1,16 @@
+import asyncio
 from contextlib import asynccontextmanager
-import os
 import logging
+from anyio import to_thread
 from fastapi import FastAPI
 from fastapi.exceptions import RequestValidationError
 from fastapi.security import OAuth2AuthorizationCodeBearer
 from fastapi.middleware.cors import CORSMiddleware
 from starlette.exceptions import HTTPException
+from prometheus_client import REGISTRY
 from starlette.middleware.authentication import AuthenticationMiddleware
-from alembic.config import Config
-from alembic import command
 
 from regtech_api_commons.oauth2.oauth2_backend import BearerTokenAuthBackend
-from regtech_api_commons.oauth2.oauth2_admin import OAuth2Admin
 from regtech_api_commons.api.exceptions import RegTechHttpException
 from regtech_api_commons.api.exception_handlers import (
     regtech_http_exception_handler,
@@ -20,30 +19,59 @@ from regtech_api_commons.api.exception_handlers import (
     general_exception_handler,
 )
 
-from regtech_user_fi_management.config import kc_settings
-from regtech_user_fi_management.entities.listeners import setup_dao_listeners
+from regtech_user_fi_management.auth import jwks_keys, token_verifier
+from regtech_user_fi_management.config import kc_settings, settings
+from regtech_user_fi_management.entities.engine.engine import (
+    AsyncSessionLocal,
+    dispose_engines,
+    engine,
+    get_pool_status,
+    history_notifier,
+)
+from regtech_user_fi_management.entities.listeners import check_history_tables, setup_dao_listeners
+from regtech_user_fi_management.entities.repos.denied_domains import load_denied_domains
+from regtech_user_fi_management.entities.repos.reference_cache import warm_up_reference_cache
+from regtech_user_fi_management.keycloak_admin import keycloak_admin
+from regtech_user_fi_management.middleware import (
+    QUERY_COUNT_HEADER,
+    QUERY_DURATION_HEADER,
+    QUERY_REPEATED_HEADER,
+    QueryStatsMiddleware,
+    RequestLatencyMiddleware,
+)
+from regtech_user_fi_management.metrics import CacheCollector, PoolCollector, ThreadpoolCollector, metrics
+from regtech_user_fi_management.migrations import startup_migrations
 from regtech_user_fi_management.routers import admin_router, institutions_router
+from regtech_user_fi_management.util.ttl_cache import all_caches
 
 
 log = logging.getLogger()
 
 
-def run_migrations():
-    file_dir = os.path.dirname(os.path.realpath(__file__))
-    alembic_cfg = Config(f"{file_dir}/../../alembic.ini")
-    alembic_cfg.set_main_option("script_location", f"{file_dir}/../../db_revisions")
-    alembic_cfg.set_main_option("prepend_sys_path", f"{file_dir}/../../")
-    command.upgrade(alembic_cfg, "head")
-
-
 @asynccontextmanager
 async def lifespan(app_: FastAPI):
     log.info("Starting up...")
-    log.info("run alembic upgrade head...")
-    run_migrations()
+    log.info(f"startup migrations: {settings.startup_migrations}")
+    await asyncio.to_thread(startup_migrations, settings.startup_migrations, engine, settings.inst_db_schema)
+    if settings.check_history_tables:
+        await asyncio.to_thread(check_history_tables, engine, settings.inst_db_schema)
     setup_dao_listeners()
+    log.info("warming up reference data and denied domains caches...")
+    async with AsyncSessionLocal() as session:
+        await warm_up_reference_cache(session)
+        await load_denied_domains(session)
+    log.info("prefetching the realm's signing keys...")
+    try:
+        await asyncio.to_thread(jwks_keys.refresh)
+    except Exception:
+        log.exception("Failed to prefetch the realm's signing keys, they'll be fetched on first use")
+    jwks_refresh = asyncio.create_task(jwks_keys.refresh_periodically(settings.jwks_refresh_interval))
     yield
+    jwks_refresh.cancel()
     log.info("Shutting down...")
+    await history_notifier.close()
+    await dispose_engines()
+    keycloak_admin.close()
 
 
 app = FastAPI(lifespan=lifespan)
@@ -59,13 +87,25 @@ oauth2_scheme = OAuth2AuthorizationCodeBearer(
     authorizationUrl=kc_settings.auth_url.unicode_string(), tokenUrl=kc_settings.token_url.unicode_string()
 )
 
-app.add_middleware(AuthenticationMiddleware, backend=BearerTokenAuthBackend(oauth2_scheme, OAuth2Admin(kc_settings)))
+app.add_middleware(AuthenticationMiddleware, backend=BearerTokenAuthBackend(oauth2_scheme, token_verifier))
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Next-Cursor", QUERY_COUNT_HEADER, QUERY_DURATION_HEADER, QUERY_REPEATED_HEADER],
 )
+app.add_middleware(
+    QueryStatsMiddleware,
+    repeat_threshold=settings.query_repeat_threshold,
+    expose_headers=settings.query_stats_header,
+)
+app.add_middleware(RequestLatencyMiddleware)
+
+REGISTRY.register(PoolCollector(get_pool_status))
+REGISTRY.register(ThreadpoolCollector(to_thread.current_default_thread_limiter))
+REGISTRY.register(CacheCollector(all_caches))
+app.add_api_route("/metrics", metrics, include_in_schema=False)
 
 app.include_router(admin_router, prefix="/v1/admin")
 app.include_router(institutions_router, prefix="/v1/institutions")
@@ -0,0 +1,134 @@
+from collections import defaultdict
+from contextvars import ContextVar
+from functools import wraps
+from typing import Any, Awaitable, Callable, Dict, Iterable, ParamSpec, TypeVar
+
+from fastapi import Response
+from prometheus_client import CONTENT_TYPE_LATEST, Gauge, Histogram, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily, Metric
+from prometheus_client.registry import Collector
+
+from regtech_user_fi_management.util.ttl_cache import TtlCache
+
+P = ParamSpec("P")
+R = TypeVar("R")
+
+DB_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "Request latency by route template", ["method", "route", "status"]
+)
+DB_STATEMENT_DURATION = Histogram(
+    "db_statement_duration_seconds", "SQL statement execution time by repo function", ["function"], buckets=DB_BUCKETS
+)
+KEYCLOAK_LATENCY = Histogram(
+    "keycloak_request_duration_seconds", "Keycloak admin call latency", ["operation", "outcome"]
+)
+DB_POOL_CHECKOUT_WAIT = Histogram(
+    "db_pool_checkout_wait_seconds",
+    "Time spent waiting for a pooled connection, including opening or pre-pinging it",
+    ["pool"],
+    buckets=DB_BUCKETS,
+)
+KEYCLOAK_IN_FLIGHT = Gauge("keycloak_requests_in_flight", "Keycloak admin calls currently running")
+
+current_repo_function: ContextVar[str] = ContextVar("repo_function", default="other")
+
+
+def instrumented(fn: Callable[P, Awaitable[R]]) -> Callable[P, Awaitable[R]]:
+    """
+    Labels the statements the repo function runs with its name in `db_statement_duration_seconds`.
+    """
+
+    @wraps(fn)
+    async def wrapper(*args: P.args, **kwargs: P.kwargs) -> R:
+        token = current_repo_function.set(fn.__name__)
+        try:
+            return await fn(*args, **kwargs)
+        finally:
+            current_repo_function.reset(token)
+
+    return wrapper
+
+
+def observe_statement(duration: float) -> None:
+    DB_STATEMENT_DURATION.labels(current_repo_function.get()).observe(duration)
+
+
+def observe_checkout_wait(pool: str, wait_seconds: float) -> None:
+    DB_POOL_CHECKOUT_WAIT.labels(pool).observe(wait_seconds)
+
+
+class PoolCollector(Collector):
+    """
+    Reports each connection pool's state, labelled by pool, read when scraped. Running totals are counters,
+    everything else describes the pool right now.
+    """
+
+    COUNTERS = {"checkouts", "checkout_timeouts"}
+
+    def __init__(self, pool_status: Callable[[], Dict[str, Dict[str, int | float]]]):
+        self.pool_status = pool_status
+
+    def collect(self) -> Iterable[Metric]:
+        families: Dict[str, GaugeMetricFamily | CounterMetricFamily] = {}
+        for pool, status in self.pool_status().items():
+            for key, value in status.items():
+                if key not in families:
+                    family = CounterMetricFamily if key in self.COUNTERS else GaugeMetricFamily
+                    families[key] = family(
+                        f"db_pool_{key}", f"Connection pool {key.replace('_', ' ')}", labels=["pool"]
+                    )
+                families[key].add_metric([pool], value)
+        yield from families.values()
+
+
+class ThreadpoolCollector(Collector):
+    """
+    Reports how many of the threadpool's tokens, shared by sync endpoints and dependencies, are in use.
+    The limiter belongs to the running event loop, so this only reports when scraped from it.
+    """
+
+    def __init__(self, limiter: Callable[[], Any]):
+        self.limiter = limiter
+
+    def collect(self) -> Iterable[Metric]:
+        try:
+            limiter = self.limiter()
+        except Exception:
+            return
+        yield GaugeMetricFamily(
+            "threadpool_threads_in_use", "Threadpool tokens borrowed", value=limiter.borrowed_tokens
+        )
+        yield GaugeMetricFamily("threadpool_threads_total", "Threadpool token limit", value=limiter.total_tokens)
+
+
+class CacheCollector(Collector):
+    """
+    Reports hits, misses and size for every in-process cache, summed over caches sharing a name.
+    """
+
+    def __init__(self, caches: Callable[[], Iterable[TtlCache]]):
+        self.caches = caches
+
+    def collect(self) -> Iterable[Metric]:
+        hits = CounterMetricFamily("cache_hits", "Cache lookups that found a live entry", labels=["cache"])
+        misses = CounterMetricFamily(
+            "cache_misses", "Cache lookups that found nothing or an expired entry", labels=["cache"]
+        )
+        entries = GaugeMetricFamily("cache_entries", "Entries currently held", labels=["cache"])
+        totals: Dict[str, list[int]] = defaultdict(lambda: [0, 0, 0])
+        for cache in self.caches():
+            total = totals[cache.name]
+            total[0] += cache.hits
+            total[1] += cache.misses
+            total[2] += len(cache)
+        for name, (hit_count, miss_count, entry_count) in totals.items():
+            hits.add_metric([name], hit_count)
+            misses.add_metric([name], miss_count)
+            entries.add_metric([name], entry_count)
+        yield from (hits, misses, entries)
+
+
+async def metrics() -> Response:
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
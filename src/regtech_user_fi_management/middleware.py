@@ -0,0 +1,100 @@
+import logging
+import time
+
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from regtech_user_fi_management.entities.engine.query_stats import QueryStats, track_queries
+from regtech_user_fi_management.metrics import REQUEST_LATENCY
+
+log = logging.getLogger(__name__)
+
+QUERY_COUNT_HEADER = "X-Query-Count"
+QUERY_DURATION_HEADER = "X-Query-Duration-Ms"
+QUERY_REPEATED_HEADER = "X-Query-Repeated"
+
+
+class QueryStatsMiddleware:
+    """
+    Counts the SQL statements each request runs and the time spent in them. The totals are logged,
+    statement shapes repeated `repeat_threshold` or more times are logged as likely N+1 patterns,
+    and with `expose_headers` the numbers are also returned as response headers.
+    """
+
+    def __init__(self, app: ASGIApp, repeat_threshold: int = 5, expose_headers: bool = False):
+        self.app = app
+        self.repeat_threshold = repeat_threshold
+        self.expose_headers = expose_headers
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        with track_queries() as stats:
+
+            async def send_with_stats(message: Message) -> None:
+                if message["type"] == "http.response.start" and self.expose_headers:
+                    headers = MutableHeaders(scope=message)
+                    headers[QUERY_COUNT_HEADER] = str(stats.count)
+                    headers[QUERY_DURATION_HEADER] = f"{stats.duration * 1000:.2f}"
+                    headers[QUERY_REPEATED_HEADER] = str(len(stats.repeated(self.repeat_threshold)))
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_with_stats)
+            finally:
+                self.log_stats(scope, stats)
+
+    def log_stats(self, scope: Scope, stats: QueryStats) -> None:
+        if not stats.count:
+            return
+        request = f"{scope['method']} {scope['path']}"
+        log.info(f"{request}: {stats.count} statements in {stats.duration * 1000:.2f} ms")
+        for shape, count in stats.repeated(self.repeat_threshold).items():
+            log.warning(f"{request}: possible N+1, statement ran {count} times: {shape[:200]}")
+
+
+def route_template(scope: Scope) -> str:
+    """
+    The matched route's path template, including the prefix of the router it was included from.
+    """
+    if (route := scope.get("route")) is None:
+        return "unmatched"
+    try:
+        matched = route.path.format(**scope.get("path_params", {}))
+    except (KeyError, IndexError):
+        return route.path
+    path = scope["path"]
+    return path[: -len(matched)] + route.path if path.endswith(matched) else route.path
+
+
+class RequestLatencyMiddleware:
+    """
+    Records each request's latency in `http_request_duration_seconds`, labelled with the matched route's
+    path template rather than the raw path so LEIs don't multiply the series.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        start = time.perf_counter()
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            REQUEST_LATENCY.labels(scope["method"], route_template(scope), str(status)).observe(
+                time.perf_counter() - start
+            )
@@ -0,0 +1,92 @@
+import logging
+import os
+
+from alembic import command
+from alembic.config import Config
+from alembic.runtime.migration import MigrationContext
+from alembic.script import ScriptDirectory
+from sqlalchemy import Connection, Engine, text
+
+from regtech_user_fi_management.config import StartupMigrations
+
+log = logging.getLogger(__name__)
+
+# arbitrary application wide key for pg_advisory_lock, shared by every process that may migrate this schema
+MIGRATION_LOCK_ID = 0x55534552_46494D47
+
+
+def alembic_config() -> Config:
+    file_dir = os.path.dirname(os.path.realpath(__file__))
+    alembic_cfg = Config(f"{file_dir}/../../alembic.ini")
+    alembic_cfg.set_main_option("script_location", f"{file_dir}/../../db_revisions")
+    alembic_cfg.set_main_option("prepend_sys_path", f"{file_dir}/../../")
+    return alembic_cfg
+
+
+def head_revision(alembic_cfg: Config) -> str | None:
+    return ScriptDirectory.from_config(alembic_cfg).get_current_head()
+
+
+def current_revision(conn: Connection, schema: str | None) -> str | None:
+    return MigrationContext.configure(conn, opts={"version_table_schema": schema}).get_current_revision()
+
+
+def is_at_head(conn: Connection, alembic_cfg: Config, schema: str | None) -> bool:
+    return current_revision(conn, schema) == head_revision(alembic_cfg)
+
+
+def run_migrations(alembic_cfg: Config | None = None) -> None:
+    command.upgrade(alembic_cfg or alembic_config(), "head")
+
+
+def migrate_with_lock(engine: Engine, schema: str | None, alembic_cfg: Config | None = None) -> bool:
+    """
+    Upgrades to head unless the database is already there, holding a Postgres advisory lock while migrating
+    so concurrently starting processes wait for the first one and then find nothing left to do.
+    Returns whether this process ran the upgrade.
+    """
+    alembic_cfg = alembic_cfg or alembic_config()
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        if is_at_head(conn, alembic_cfg, schema):
+            return False
+        log.info("waiting for the migration lock...")
+        conn.execute(text("SELECT pg_advisory_lock(:id)"), {"id": MIGRATION_LOCK_ID})
+        try:
+            if is_at_head(conn, alembic_cfg, schema):
+                return False
+            log.info("run alembic upgrade head...")
+            run_migrations(alembic_cfg)
+            return True
+        finally:
+            conn.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": MIGRATION_LOCK_ID})
+
+
+def verify_at_head(engine: Engine, schema: str | None, alembic_cfg: Config | None = None) -> None:
+    alembic_cfg = alembic_cfg or alembic_config()
+    with engine.connect() as conn:
+        current = current_revision(conn, schema)
+    if current != (head := head_revision(alembic_cfg)):
+        raise RuntimeError(f"Database is at revision {current}, expected {head}; run the migrations first.")
+
+
+def startup_migrations(mode: StartupMigrations, engine: Engine, schema: str | None) -> None:
+    if mode == "locked":
+        migrate_with_lock(engine, schema)
+    elif mode == "verify":
+        verify_at_head(engine, schema)
+
+
+def main() -> None:
+    """
+    One-shot runner for deploy jobs: `python -m regtech_user_fi_management.migrations`
+    """
+    from regtech_user_fi_management.config import settings
+    from regtech_user_fi_management.entities.engine.engine import engine
+
+    logging.basicConfig(level=logging.INFO)
+    if not migrate_with_lock(engine, settings.inst_db_schema):
+        log.info("database already at head")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,4 @@
+import asyncio
 from typing import Set
 from fastapi import Depends, Request
 from starlette.authentication import requires
@@ -7,31 +8,51 @@ from regtech_api_commons.api.router_wrapper import Router
 from regtech_user_fi_management.entities.models.dto import UserProfile
 
 from regtech_api_commons.models.auth import RegTechUser
-from regtech_api_commons.oauth2.oauth2_admin import OAuth2Admin
-from regtech_user_fi_management.config import kc_settings
+from regtech_user_fi_management.config import settings
+from regtech_user_fi_management.keycloak_admin import apply_user_writes, keycloak_admin
+from regtech_user_fi_management.util.ttl_cache import TtlCache
 
 router = Router()
 
-oauth2_admin = OAuth2Admin(kc_settings)
+# /me is requested on every front end page load; writes made through this service refresh the entry,
+# changes made directly in Keycloak or through another worker show up once the short TTL lapses.
+user_cache: TtlCache[str, RegTechUser] = TtlCache(
+    "keycloak_users", ttl=settings.user_cache_ttl, maxsize=settings.user_cache_maxsize
+)
+
+
+async def current_user(request: Request) -> RegTechUser:
+    if (user := user_cache.get(request.user.id)) is None:
+        user = await keycloak_admin.get_user(request.user.id)
+        user_cache.set(request.user.id, user)
+    return user
 
 
 @router.get("/me/", response_model=RegTechUser)
 @requires("authenticated")
-def get_me(request: Request):
-    return oauth2_admin.get_user(request.user.id)
+async def get_me(request: Request):
+    return await current_user(request)
 
 
 @router.put("/me/", response_model=RegTechUser, dependencies=[Depends(check_domain)])
 @requires("manage-account")
-def update_me(request: Request, user: UserProfile):
-    oauth2_admin.update_user(request.user.id, user.to_keycloak_user())
+async def update_me(request: Request, user: UserProfile):
+    writes = [keycloak_admin.update_user(request.user.id, user.to_keycloak_user())]
     if user.leis:
-        oauth2_admin.associate_to_leis(request.user.id, user.leis)
-    return oauth2_admin.get_user(request.user.id)
+        writes.append(keycloak_admin.associate_to_leis(request.user.id, user.leis))
+    await asyncio.gather(*writes)
+    # build the response from what was just written rather than fetching the user back
+    updated = apply_user_writes(
+        user_cache.get(request.user.id) or request.user, name=f"{user.first_name} {user.last_name}", leis=user.leis
+    )
+    user_cache.set(request.user.id, updated)
+    return updated
 
 
 @router.put("/me/institutions/", response_model=RegTechUser, dependencies=[Depends(check_domain)])
 @requires("manage-account")
-def associate_lei(request: Request, leis: Set[str]):
-    oauth2_admin.associate_to_leis(request.user.id, leis)
-    return oauth2_admin.get_user(request.user.id)
+async def associate_lei(request: Request, leis: Set[str]):
+    await keycloak_admin.associate_to_leis(request.user.id, leis)
+    updated = apply_user_writes(user_cache.get(request.user.id) or request.user, leis=leis)
+    user_cache.set(request.user.id, updated)
+    return updated
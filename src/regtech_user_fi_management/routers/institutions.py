@@ -1,20 +1,39 @@
-from fastapi import Depends, Request, Response
+import asyncio
+from collections import Counter
+from datetime import datetime
+from fastapi import Depends, Header, Query, Request, Response
+from fastapi.responses import StreamingResponse
 from http import HTTPStatus
-from regtech_api_commons.oauth2.oauth2_admin import OAuth2Admin
-from regtech_user_fi_management.config import kc_settings
+from regtech_user_fi_management.config import settings
 from regtech_api_commons.api.router_wrapper import Router
+from regtech_user_fi_management.keycloak_admin import keycloak_admin
 from regtech_user_fi_management.dependencies import (
     check_domain,
 )
-from typing import Annotated, List, Tuple, Literal
-from regtech_user_fi_management.entities.engine.engine import get_session
+from typing import Annotated, AsyncIterator, Callable, List, Sequence, Tuple, Literal
+from regtech_user_fi_management.entities.engine.engine import (
+    AsyncSessionLocal,
+    get_session,
+    history_notifier,
+    issue_write_marker,
+    use_replica,
+)
 import regtech_user_fi_management.entities.repos.institutions_repo as repo
+from regtech_user_fi_management.entities.repos.reference_cache import get_reference_data
+from regtech_user_fi_management.util.cursor import InvalidCursorError, decode_cursor, encode_cursor
+from regtech_user_fi_management.util.etag import build_etag, etag_matches
+from regtech_user_fi_management.util.serialization import json_response
+from regtech_user_fi_management.util.export import EXPORT_MEDIA_TYPES, ExportFormat, csv_header, format_chunk
+from regtech_user_fi_management.util.sse import KEEP_ALIVE, SSE_MEDIA_TYPE, format_event
 from regtech_user_fi_management.entities.models.dto import (
+    FinancialInstitutionBulkUpsertDto,
     FinancialInstitutionDto,
     FinancialInstitutionWithRelationsDto,
     FinancialInstitutionDomainDto,
     FinancialInstitutionDomainCreate,
     FinancialInstitutionAssociationDto,
+    FinancialInstitutionFamilyDto,
+    FinancialInstitutionHistoryDto,
     InstitutionTypeDto,
     AddressStateDto,
     FederalRegulatorDto,
@@ -22,7 +41,9 @@ from regtech_user_fi_management.entities.models.dto import (
     SblTypeAssociationPatchDto,
     VersionedData,
 )
-from sqlalchemy.orm import Session
+from pydantic import TypeAdapter
+from sqlalchemy import Row
+from sqlalchemy.ext.asyncio import AsyncSession
 from starlette.authentication import requires
 from regtech_api_commons.models.auth import AuthenticatedUser
 from regtech_api_commons.api.exceptions import RegTechHttpException
@@ -33,89 +54,383 @@ from regtech_api_commons.api.dependencies import (
     get_email_domain,
 )
 
-oauth2_admin = OAuth2Admin(kc_settings)
-
 InstitutionType = Literal["sbl", "hmda"]
 
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+# built once so the institution read paths validate their DAOs a single time and encode straight to bytes
+institution_adapter = TypeAdapter(FinancialInstitutionWithRelationsDto)
+institutions_adapter = TypeAdapter(List[FinancialInstitutionWithRelationsDto])
+associated_institutions_adapter = TypeAdapter(List[FinancialInstitutionAssociationDto])
+history_adapter = TypeAdapter(List[FinancialInstitutionHistoryDto])
+
+
+READ_METHODS = {"GET", "HEAD", "OPTIONS"}
 
-def set_db(request: Request, session: Annotated[Session, Depends(get_session)]):
+WRITE_MARKER_COOKIE = "fi_last_write"
+
+
+async def set_db(request: Request, response: Response, session: Annotated[AsyncSession, Depends(get_session)]):
+    """
+    Routes reads to the replica only for clients that send back a write marker cookie showing no recent write.
+    Clients that don't keep the cookie, like cross-origin browsers or service clients, always read from the primary,
+    so they still see their own writes; a first read hands them a marker of no write so later reads can use the replica.
+    """
     request.state.db_session = session
+    current = request.cookies.get(WRITE_MARKER_COOKIE)
+    if request.method in READ_METHODS:
+        use_replica(session, current)
+        marker = issue_write_marker(written_at=0) if current is None else None
+    else:
+        marker = issue_write_marker()
+    if marker:
+        response.set_cookie(WRITE_MARKER_COOKIE, marker, httponly=True, samesite="lax")
 
 
 router = Router(dependencies=[Depends(set_db)])
 
 
+def institution_etag(lei: str, version: int | None, domain_count: int) -> str:
+    # domains aren't versioned with the institution, so their count is part of the representation's tag
+    return build_etag(lei, version, domain_count)
+
+
+def sbl_types_etag(lei: str, version: int | None) -> str:
+    return build_etag(lei, version, "sbl")
+
+
+ChangeKey = Tuple[datetime, str, int]
+
+
+def change_cursor(entry: Row) -> str:
+    return encode_cursor(entry.event_time.isoformat(), entry.lei, entry.version)
+
+
+def decode_change_cursor(cursor: str) -> ChangeKey:
+    try:
+        event_time, lei, version = decode_cursor(cursor, 3)
+        if not isinstance(lei, str) or not isinstance(version, int):
+            raise InvalidCursorError(f"Invalid cursor {cursor}.")
+        return datetime.fromisoformat(event_time), lei, version
+    except (InvalidCursorError, TypeError, ValueError) as e:
+        raise RegTechHttpException(HTTPStatus.BAD_REQUEST, name="Invalid Cursor", detail=str(e))
+
+
+async def read_changes(after: ChangeKey | None, count: int) -> Sequence[Row]:
+    """
+    A page of the change feed, read from the primary with a session of its own: a replica may not
+    have replayed entries the primary's notifications announce, and no connection is held between reads.
+    """
+    async with AsyncSessionLocal() as session:
+        return await repo.get_institution_changes(session, after, count, settings.change_feed_settle_seconds)
+
+
+async def wait_for_changes(changed: asyncio.Event, timeout: float) -> bool:
+    """
+    Waits up to `timeout` seconds for history to be written. Notifications are delivered once the writing
+    transaction commits, so the feed can be read straight away.
+    """
+    try:
+        await asyncio.wait_for(changed.wait(), timeout)
+    except asyncio.TimeoutError:
+        return False
+    changed.clear()
+    return True
+
+
+async def change_events(after: ChangeKey | None, count: int) -> AsyncIterator[str]:
+    """
+    Sends every history entry after `after` as a server-sent event, then each new one as it's written;
+    reads wake on history notifications and fall back to polling every heartbeat.
+    """
+    async with history_notifier.subscribe() as changed:
+        while True:
+            changed.clear()
+            res = await read_changes(after, count)
+            for entry in res:
+                yield format_event(
+                    FinancialInstitutionHistoryDto.model_validate(entry).model_dump_json(),
+                    id=change_cursor(entry),
+                    event="change",
+                )
+            if res:
+                after = (res[-1].event_time, res[-1].lei, res[-1].version)
+            if len(res) < count and not await wait_for_changes(changed, settings.change_feed_heartbeat_seconds):
+                yield KEEP_ALIVE
+
+
+async def not_modified(
+    session: AsyncSession, lei: str, if_none_match: str | None, make_etag: Callable[[Row[Tuple[int, int]]], str]
+) -> Response | None:
+    """
+    Answers a conditional GET with 304 using only the institution's version, so the institution
+    and its relationships are never loaded when the client's copy is current.
+    """
+    if if_none_match and (current := await repo.get_institution_version(session, lei)):
+        etag = make_etag(current)
+        if etag_matches(if_none_match, etag):
+            return Response(status_code=HTTPStatus.NOT_MODIFIED, headers={"ETag": etag})
+
+
 @router.get(
     "/", response_model=List[FinancialInstitutionWithRelationsDto], dependencies=[Depends(verify_institution_search)]
 )
 @requires("authenticated")
-def get_institutions(
+async def get_institutions(
     request: Request,
     leis: List[str] = Depends(parse_leis),
     domain: str = "",
-    page: int = 0,
-    count: int = 100,
+    page: Annotated[int, Query(ge=0)] = 0,
+    count: Annotated[int, Query(ge=1, le=settings.max_page_size)] = 100,
+    cursor: str | None = None,
 ):
-    return repo.get_institutions(request.state.db_session, leis, domain, page, count)
+    """
+    Pass `cursor` (empty to start) to page by keyset instead of offset; while more results may
+    follow, the cursor for the next page is returned in the X-Next-Cursor header.
+    """
+    after_lei = None
+    if cursor:
+        try:
+            after_lei = decode_cursor(cursor, 1)[0]
+            if not isinstance(after_lei, str):
+                raise InvalidCursorError(f"Invalid cursor {cursor}.")
+        except InvalidCursorError as e:
+            raise RegTechHttpException(HTTPStatus.BAD_REQUEST, name="Invalid Cursor", detail=str(e))
+    elif cursor is not None:
+        after_lei = ""
+    res = await repo.get_institutions(request.state.db_session, leis, domain, page, count, after_lei)
+    headers = {}
+    if after_lei is not None and res and len(res) == count:
+        headers[NEXT_CURSOR_HEADER] = encode_cursor(res[-1].lei)
+    return json_response(institutions_adapter, res, headers)
 
 
 @router.post("/", response_model=Tuple[str, FinancialInstitutionWithRelationsDto], dependencies=[Depends(check_domain)])
 @requires(["query-groups", "manage-users"])
-def create_institution(
+async def create_institution(
     request: Request,
     fi: FinancialInstitutionDto,
 ):
-    db_fi = repo.upsert_institution(request.state.db_session, fi, request.user)
-    kc_id = oauth2_admin.upsert_group(fi.lei, fi.name)
+    db_fi = await repo.upsert_institution(request.state.db_session, fi, request.user)
+    kc_id = await keycloak_admin.upsert_group(fi.lei, fi.name)
     return kc_id, db_fi
 
 
+@router.post("/bulk", response_model=FinancialInstitutionBulkUpsertDto, dependencies=[Depends(check_domain)])
+@requires(["query-groups", "manage-users"])
+async def bulk_upsert_institutions(
+    request: Request,
+    fis: List[FinancialInstitutionDto],
+):
+    """
+    Creates or updates many institutions at once; only new or changed institutions are written,
+    versioned, and have their Keycloak group upserted.
+    """
+    if duplicates := sorted(lei for lei, count in Counter(fi.lei for fi in fis).items() if count > 1):
+        raise RegTechHttpException(
+            HTTPStatus.BAD_REQUEST, name="Duplicate LEIs", detail=f"{', '.join(duplicates)} submitted more than once."
+        )
+    res = await repo.bulk_upsert_institutions(
+        request.state.db_session, fis, request.user, settings.bulk_upsert_chunk_size
+    )
+    names = {fi.lei: fi.name for fi in fis}
+    res.groups = await keycloak_admin.upsert_groups({lei: names[lei] for lei in res.created + res.updated})
+    return res
+
+
 @router.get("/associated", response_model=List[FinancialInstitutionAssociationDto])
 @requires("authenticated")
-def get_associated_institutions(request: Request):
+async def get_associated_institutions(request: Request):
     user: AuthenticatedUser = request.user
     email_domain = get_email_domain(user.email)
-    associated_institutions = repo.get_institutions(request.state.db_session, user.institutions)
-    return [
-        FinancialInstitutionAssociationDto(
-            **institution.__dict__,
-            approved=email_domain in [inst_domain.domain for inst_domain in institution.domains],
-        )
-        for institution in associated_institutions
-    ]
+    res = await repo.get_associated_institutions(request.state.db_session, user.institutions, email_domain)
+    return json_response(associated_institutions_adapter, res)
+
+
+@router.get("/search", response_model=List[FinancialInstitutionWithRelationsDto])
+@requires(["query-groups", "manage-users"])
+async def search_institutions(
+    request: Request,
+    q: Annotated[str, Query(min_length=3)],
+    limit: Annotated[int, Query(ge=1, le=settings.search_max_results)] = 20,
+):
+    """
+    Fuzzy, ranked search over institution, parent and top holder names; best matches first.
+    """
+    res = await repo.search_institutions(request.state.db_session, q.strip(), limit)
+    return json_response(institutions_adapter, res)
+
+
+@router.get("/changes", response_model=List[FinancialInstitutionHistoryDto])
+@requires(["query-groups", "manage-users"])
+async def get_institution_changes(
+    request: Request,
+    cursor: str | None = None,
+    count: Annotated[int, Query(ge=1, le=settings.max_page_size)] = 100,
+    wait: Annotated[float, Query(ge=0, le=settings.change_feed_max_wait)] = 0,
+):
+    """
+    History entries across all institutions, oldest first, after `cursor`; without one the feed starts
+    at the beginning. The cursor to continue from is returned in the X-Next-Cursor header.
+    With `wait`, an empty page is held for up to that many seconds until a change is written (long-poll).
+    """
+    after = decode_change_cursor(cursor) if cursor else None
+    async with history_notifier.subscribe() as changed:
+        res = await read_changes(after, count)
+        if not res and wait and await wait_for_changes(changed, wait):
+            res = await read_changes(after, count)
+    headers = {}
+    if res:
+        headers[NEXT_CURSOR_HEADER] = change_cursor(res[-1])
+    elif cursor:
+        headers[NEXT_CURSOR_HEADER] = cursor
+    return json_response(history_adapter, res, headers)
+
+
+@router.get("/changes/stream", response_class=StreamingResponse)
+@requires(["query-groups", "manage-users"])
+async def stream_institution_changes(
+    request: Request,
+    cursor: str | None = None,
+    count: Annotated[int, Query(ge=1, le=settings.max_page_size)] = 100,
+    last_event_id: Annotated[str | None, Header()] = None,
+):
+    """
+    The change feed as server-sent events. Each event's id is the cursor after it, so a reconnecting
+    client resumes where it left off through Last-Event-ID; `cursor` sets where a new stream starts.
+    """
+    start = last_event_id or cursor
+    after = decode_change_cursor(start) if start else None
+    return StreamingResponse(
+        change_events(after, count), media_type=SSE_MEDIA_TYPE, headers={"Cache-Control": "no-cache"}
+    )
+
+
+@router.get("/export", response_class=StreamingResponse)
+@requires(["query-groups", "manage-users"])
+async def export_institutions(request: Request, format: ExportFormat = "ndjson"):
+    """
+    Streams a snapshot of every institution with its relationships as NDJSON or CSV.
+    Rows are read from a server-side cursor in chunks, so memory use doesn't grow with the table.
+    """
+
+    async def stream():
+        # the response outlives the request scoped session, so the export reads with its own
+        async with AsyncSessionLocal() as session:
+            use_replica(session, request.cookies.get(WRITE_MARKER_COOKIE))
+            if format == "csv":
+                yield csv_header()
+            async for chunk in repo.stream_institutions(session, settings.export_chunk_size):
+                yield format_chunk([FinancialInstitutionWithRelationsDto.model_validate(fi) for fi in chunk], format)
+
+    return StreamingResponse(
+        stream(),
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="institutions.{format}"'},
+    )
 
 
 @router.get("/types/{type}", response_model=List[InstitutionTypeDto])
 @requires("authenticated")
-def get_institution_types(request: Request, type: InstitutionType):
+async def get_institution_types(request: Request, type: InstitutionType):
     match type:
         case "sbl":
-            return repo.get_sbl_types(request.state.db_session)
+            return await get_reference_data(request.state.db_session, "sbl_types")
         case "hmda":
-            return repo.get_hmda_types(request.state.db_session)
+            return await get_reference_data(request.state.db_session, "hmda_types")
 
 
 @router.get("/address-states", response_model=List[AddressStateDto])
 @requires("authenticated")
-def get_address_states(request: Request):
-    return repo.get_address_states(request.state.db_session)
+async def get_address_states(request: Request):
+    return await get_reference_data(request.state.db_session, "address_states")
 
 
 @router.get("/regulators", response_model=List[FederalRegulatorDto])
 @requires("authenticated")
-def get_federal_regulators(request: Request):
-    return repo.get_federal_regulators(request.state.db_session)
+async def get_federal_regulators(request: Request):
+    return await get_reference_data(request.state.db_session, "federal_regulators")
 
 
 @router.get(
     "/{lei}", response_model=FinancialInstitutionWithRelationsDto, dependencies=[Depends(verify_user_lei_relation)]
 )
 @requires("authenticated")
-def get_institution(
+async def get_institution(
     request: Request,
     lei: str,
+    as_of: Annotated[int | datetime | None, Query()] = None,
+    if_none_match: Annotated[str | None, Header()] = None,
 ):
-    res = repo.get_institution(request.state.db_session, lei)
+    """
+    Pass `as_of`, a version or a timestamp, to get the institution as it was at that version or time,
+    rebuilt from its history; domains aren't versioned, so they're left out.
+    """
+    if as_of is not None:
+        res = await repo.get_institution_as_of(request.state.db_session, lei, as_of)
+        if not res:
+            raise RegTechHttpException(
+                HTTPStatus.NOT_FOUND, name="Institution Not Found", detail=f"{lei} has no version as of {as_of}."
+            )
+        return json_response(institution_adapter, res)
+    if cached := await not_modified(
+        request.state.db_session,
+        lei,
+        if_none_match,
+        lambda current: institution_etag(lei, current.version, current.domain_count),
+    ):
+        return cached
+    res = await repo.get_institution(request.state.db_session, lei)
+    if not res:
+        raise RegTechHttpException(HTTPStatus.NOT_FOUND, name="Institution Not Found", detail=f"{lei} not found.")
+    return json_response(institution_adapter, res, {"ETag": institution_etag(lei, res.version, len(res.domains))})
+
+
+@router.get(
+    "/{lei}/history",
+    response_model=List[FinancialInstitutionHistoryDto],
+    dependencies=[Depends(verify_user_lei_relation)],
+)
+@requires("authenticated")
+async def get_institution_history(
+    request: Request,
+    lei: str,
+    count: Annotated[int, Query(ge=1, le=settings.max_page_size)] = 100,
+    cursor: str | None = None,
+):
+    """
+    The institution's recorded changes, newest first. While more entries may follow, the cursor
+    for the next page is returned in the X-Next-Cursor header.
+    """
+    before_version = None
+    if cursor:
+        try:
+            before_version = decode_cursor(cursor, 1)[0]
+            if not isinstance(before_version, int):
+                raise InvalidCursorError(f"Invalid cursor {cursor}.")
+        except InvalidCursorError as e:
+            raise RegTechHttpException(HTTPStatus.BAD_REQUEST, name="Invalid Cursor", detail=str(e))
+    res = await repo.get_institution_history(request.state.db_session, lei, count, before_version)
+    headers = {}
+    if len(res) == count:
+        headers[NEXT_CURSOR_HEADER] = encode_cursor(res[-1].version)
+    return json_response(history_adapter, res, headers)
+
+
+@router.get(
+    "/{lei}/family", response_model=FinancialInstitutionFamilyDto, dependencies=[Depends(verify_user_lei_relation)]
+)
+@requires("authenticated")
+async def get_institution_family(
+    request: Request,
+    lei: str,
+    depth: Annotated[int, Query(ge=1, le=settings.family_max_depth)] = settings.family_max_depth,
+):
+    """
+    The institution's parent chain, closest parent first, and every descendant down to `depth` levels;
+    `truncated` is set when either goes deeper than that.
+    """
+    res = await repo.get_institution_family(request.state.db_session, lei, depth)
     if not res:
         raise RegTechHttpException(HTTPStatus.NOT_FOUND, name="Institution Not Found", detail=f"{lei} not found.")
     return res
@@ -127,10 +442,21 @@ def get_institution(
     dependencies=[Depends(verify_user_lei_relation)],
 )
 @requires("authenticated")
-def get_types(request: Request, response: Response, lei: str, type: InstitutionType):
+async def get_types(
+    request: Request,
+    response: Response,
+    lei: str,
+    type: InstitutionType,
+    if_none_match: Annotated[str | None, Header()] = None,
+):
     match type:
         case "sbl":
-            if fi := repo.get_institution(request.state.db_session, lei):
+            if cached := await not_modified(
+                request.state.db_session, lei, if_none_match, lambda current: sbl_types_etag(lei, current.version)
+            ):
+                return cached
+            if fi := await repo.get_institution(request.state.db_session, lei, "sbl_types"):
+                response.headers["ETag"] = sbl_types_etag(lei, fi.version)
                 return VersionedData(version=fi.version, data=fi.sbl_institution_types)
             else:
                 response.status_code = HTTPStatus.NO_CONTENT
@@ -146,12 +472,12 @@ def get_types(request: Request, response: Response, lei: str, type: InstitutionT
     dependencies=[Depends(verify_user_lei_relation)],
 )
 @requires("authenticated")
-def update_types(
+async def update_types(
     request: Request, response: Response, lei: str, type: InstitutionType, types_patch: SblTypeAssociationPatchDto
 ):
     match type:
         case "sbl":
-            if fi := repo.update_sbl_types(
+            if fi := await repo.update_sbl_types(
                 request.state.db_session, request.user, lei, types_patch.sbl_institution_types
             ):
                 return VersionedData(version=fi.version, data=fi.sbl_institution_types)
@@ -167,14 +493,14 @@ def update_types(
     "/{lei}/domains/", response_model=List[FinancialInstitutionDomainDto], dependencies=[Depends(check_domain)]
 )
 @requires(["query-groups", "manage-users"])
-def add_domains(
+async def add_domains(
     request: Request,
     lei: str,
     domains: List[FinancialInstitutionDomainCreate],
 ):
-    return repo.add_domains(request.state.db_session, lei, domains)
+    return await repo.add_domains(request.state.db_session, lei, domains)
 
 
 @router.get("/domains/allowed", response_model=bool)
-def is_domain_allowed(request: Request, domain: str):
-    return repo.is_domain_allowed(request.state.db_session, domain)
+async def is_domain_allowed(request: Request, domain: str):
+    return await repo.is_domain_allowed(request.state.db_session, domain)
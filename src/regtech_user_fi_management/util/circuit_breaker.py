@@ -0,0 +1,75 @@
+import time
+from threading import Lock
+from typing import Callable, Literal
+
+CircuitState = Literal["closed", "open", "half_open"]
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class CircuitBreaker:
+    """
+    Fails calls fast once `failure_threshold` consecutive calls have failed. After `reset_timeout` seconds
+    a single trial call is let through; its success closes the circuit again, its failure re-opens it.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._lock = Lock()
+        self._failures = 0
+        self._opened_at: float | None = None
+        self._trial_in_flight = False
+
+    @property
+    def state(self) -> CircuitState:
+        with self._lock:
+            return self._state()
+
+    def _state(self) -> CircuitState:
+        if self._opened_at is None:
+            return "closed"
+        if self._clock() - self._opened_at < self.reset_timeout:
+            return "open"
+        return "half_open"
+
+    def before_call(self) -> None:
+        with self._lock:
+            match self._state():
+                case "open":
+                    raise CircuitOpenError(f"{self.name} circuit is open")
+                case "half_open":
+                    if self._trial_in_flight:
+                        raise CircuitOpenError(f"{self.name} circuit is open")
+                    self._trial_in_flight = True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def release_trial(self) -> None:
+        """
+        Lets another trial through after one that ended without telling whether the service recovered,
+        e.g. because it was cancelled; otherwise the circuit would stay half open with no trial to close it.
+        """
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._trial_in_flight or self._failures >= self.failure_threshold:
+                self._opened_at = self._clock()
+            self._trial_in_flight = False
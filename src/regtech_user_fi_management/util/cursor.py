@@ -0,0 +1,24 @@
+import base64
+import json
+from typing import Any, List
+
+
+class InvalidCursorError(ValueError):
+    pass
+
+
+def encode_cursor(*values: Any) -> str:
+    """
+    Packs the keyset values of the last row returned into an opaque, url safe cursor.
+    """
+    return base64.urlsafe_b64encode(json.dumps(values, separators=(",", ":")).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, size: int) -> List[Any]:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except ValueError as e:
+        raise InvalidCursorError(f"Invalid cursor {cursor}.") from e
+    if not isinstance(values, list) or len(values) != size:
+        raise InvalidCursorError(f"Invalid cursor {cursor}.")
+    return values
@@ -0,0 +1,23 @@
+from typing import Iterable
+
+
+def normalize_domain(domain: str) -> str:
+    return domain.strip().strip(".").lower()
+
+
+class DomainSuffixSet:
+    """
+    Hashed set of domains that also matches every subdomain of a member, e.g. `mail.yahoo.com`
+    matches when `yahoo.com` is in the set, while `notyahoo.com` does not.
+    A lookup costs one hash probe per label of the queried domain.
+    """
+
+    def __init__(self, domains: Iterable[str]):
+        self._domains = frozenset(normalize_domain(domain) for domain in domains if domain)
+
+    def __contains__(self, domain: str) -> bool:
+        labels = normalize_domain(domain).split(".")
+        return any(".".join(labels[i:]) in self._domains for i in range(len(labels)))
+
+    def __len__(self) -> int:
+        return len(self._domains)
@@ -0,0 +1,20 @@
+import hashlib
+from typing import Any
+
+
+def build_etag(*parts: Any) -> str:
+    """
+    Builds a strong, opaque ETag from the values that determine a representation.
+    """
+    digest = hashlib.sha256(":".join(str(part) for part in parts).encode()).hexdigest()[:32]
+    return f'"{digest}"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """
+    Evaluates an If-None-Match header against an ETag using the weak comparison RFC 9110 requires for it.
+    """
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    return "*" in candidates or etag in [candidate.removeprefix("W/") for candidate in candidates]
@@ -0,0 +1,77 @@
+import csv
+import io
+from typing import Iterable, Literal
+
+from regtech_user_fi_management.entities.models.dto import FinancialInstitutionWithRelationsDto
+
+ExportFormat = Literal["ndjson", "csv"]
+
+EXPORT_MEDIA_TYPES: dict[ExportFormat, str] = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+CSV_FIELDS = [
+    "lei",
+    "name",
+    "lei_status_code",
+    "lei_status_name",
+    "tax_id",
+    "rssd_id",
+    "primary_federal_regulator_id",
+    "primary_federal_regulator_name",
+    "hmda_institution_type_id",
+    "hmda_institution_type_name",
+    "sbl_institution_type_ids",
+    "sbl_institution_type_details",
+    "hq_address_street_1",
+    "hq_address_street_2",
+    "hq_address_street_3",
+    "hq_address_street_4",
+    "hq_address_city",
+    "hq_address_state_code",
+    "hq_address_zip",
+    "parent_lei",
+    "parent_legal_name",
+    "parent_rssd_id",
+    "top_holder_lei",
+    "top_holder_legal_name",
+    "top_holder_rssd_id",
+    "domains",
+    "version",
+]
+
+# multi-valued relations are flattened into a single column joined by this separator
+CSV_LIST_SEPARATOR = "|"
+
+
+def to_csv_row(fi: FinancialInstitutionWithRelationsDto) -> dict:
+    row = fi.model_dump(include=set(CSV_FIELDS))
+    row["lei_status_name"] = fi.lei_status.name if fi.lei_status else None
+    row["primary_federal_regulator_name"] = fi.primary_federal_regulator.name if fi.primary_federal_regulator else None
+    row["hmda_institution_type_name"] = fi.hmda_institution_type.name if fi.hmda_institution_type else None
+    row["sbl_institution_type_ids"] = CSV_LIST_SEPARATOR.join(t.sbl_type.id for t in fi.sbl_institution_types)
+    row["sbl_institution_type_details"] = CSV_LIST_SEPARATOR.join(
+        t.details for t in fi.sbl_institution_types if t.details
+    )
+    row["domains"] = CSV_LIST_SEPARATOR.join(d.domain for d in fi.domains)
+    return row
+
+
+def csv_header() -> str:
+    buffer = io.StringIO()
+    csv.DictWriter(buffer, fieldnames=CSV_FIELDS).writeheader()
+    return buffer.getvalue()
+
+
+def format_chunk(institutions: Iterable[FinancialInstitutionWithRelationsDto], format: ExportFormat) -> str:
+    """
+    Renders a chunk of institutions as NDJSON lines or CSV rows (without the header).
+    """
+    match format:
+        case "ndjson":
+            return "".join(fi.model_dump_json() + "\n" for fi in institutions)
+        case "csv":
+            buffer = io.StringIO()
+            csv.DictWriter(buffer, fieldnames=CSV_FIELDS).writerows(to_csv_row(fi) for fi in institutions)
+            return buffer.getvalue()
@@ -0,0 +1,18 @@
+from typing import Any, Mapping, TypeVar
+
+from fastapi import Response
+from pydantic import TypeAdapter
+
+T = TypeVar("T")
+
+
+def json_response(adapter: TypeAdapter[T], data: Any, headers: Mapping[str, str] | None = None) -> Response:
+    """
+    Validates `data` against the adapter's type once, reading from attributes, and dumps it straight to JSON bytes.
+    Returning a `Response` skips FastAPI's own response model validation and its stdlib based encoding.
+    """
+    return Response(
+        adapter.dump_json(adapter.validate_python(data, from_attributes=True)),
+        media_type="application/json",
+        headers=headers,
+    )
@@ -0,0 +1,15 @@
+SSE_MEDIA_TYPE = "text/event-stream"
+
+# a comment line, ignored by clients, that keeps idle connections from being closed by proxies
+KEEP_ALIVE = ": keep-alive\n\n"
+
+
+def format_event(data: str, id: str | None = None, event: str | None = None) -> str:
+    """
+    Formats a server-sent event; `id` is what the client sends back as Last-Event-ID when it reconnects.
+    """
+    lines = [f"id: {id}"] if id is not None else []
+    if event is not None:
+        lines.append(f"event: {event}")
+    lines.extend(f"data: {line}" for line in data.splitlines() or [""])
+    return "\n".join(lines) + "\n\n"
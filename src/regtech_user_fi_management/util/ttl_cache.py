@@ -0,0 +1,66 @@
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Callable, Generic, Hashable, List, Tuple, TypeVar
+from weakref import WeakSet
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+_caches: "WeakSet[TtlCache]" = WeakSet()
+
+
+def all_caches() -> List["TtlCache"]:
+    """
+    Every live cache, for reporting their hit rates.
+    """
+    return list(_caches)
+
+
+class TtlCache(Generic[K, V]):
+    """
+    Small in-process cache where each entry expires `ttl` seconds after it was stored.
+    When `maxsize` is set, the least recently used entry is evicted once the cache is full.
+    Safe to share between the event loop and threadpool workers.
+    """
+
+    def __init__(self, name: str, ttl: float, maxsize: int | None = None, clock: Callable[[], float] = time.monotonic):
+        self.name = name
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._clock = clock
+        self._entries: OrderedDict[K, Tuple[float, V]] = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        _caches.add(self)
+
+    def get(self, key: K) -> V | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= self._clock():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: K, value: V, ttl: float | None = None) -> None:
+        with self._lock:
+            self._entries[key] = (self._clock() + (self.ttl if ttl is None else ttl), value)
+            self._entries.move_to_end(key)
+            if self.maxsize is not None:
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+
+    def invalidate(self, key: K | None = None) -> None:
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -0,0 +1,45 @@
+import hashlib
+import hmac
+import time
+from typing import Callable
+
+
+class WriteMarker:
+    """
+    Signed record of when a client last wrote, handed to the client so that whichever process serves its
+    next request can tell the write happened. A marker is recent for `ttl` seconds, and settled after that;
+    markers from the future or with a signature that doesn't match are neither.
+    """
+
+    def __init__(self, secret: bytes, ttl: float, clock: Callable[[], float] = time.time):
+        self.secret = secret
+        self.ttl = ttl
+        self._clock = clock
+
+    def _sign(self, written_at: str) -> str:
+        return hmac.new(self.secret, written_at.encode(), hashlib.sha256).hexdigest()
+
+    def issue(self, written_at: float | None = None) -> str:
+        """
+        A marker for a write at `written_at`, by default now; pass 0 for a client that hasn't written.
+        """
+        # whole milliseconds, truncated so a fresh marker never reads as written in the future
+        written_ms = str(int((self._clock() if written_at is None else written_at) * 1000))
+        return f"{written_ms}.{self._sign(written_ms)}"
+
+    def _age(self, marker: str | None) -> float | None:
+        if not marker:
+            return None
+        written_at, _, signature = marker.rpartition(".")
+        if not hmac.compare_digest(signature, self._sign(written_at)):
+            return None
+        try:
+            return self._clock() - int(written_at) / 1000
+        except ValueError:
+            return None
+
+    def is_recent(self, marker: str | None) -> bool:
+        return (age := self._age(marker)) is not None and 0 <= age < self.ttl
+
+    def is_settled(self, marker: str | None) -> bool:
+        return (age := self._age(marker)) is not None and age >= self.ttl
@@ -26,7 +26,11 @@ def app_fixture(mocker: MockerFixture) -> FastAPI:
     domain_denied_mock = mocker.patch("regtech_user_fi_management.dependencies.email_domain_denied")
     domain_denied_mock.return_value = False
     from regtech_user_fi_management.main import app
+    from regtech_user_fi_management.entities.repos.reference_cache import invalidate_reference_cache
+    from regtech_user_fi_management.routers.admin import user_cache
 
+    invalidate_reference_cache()
+    user_cache.invalidate()
     return app
 
 
@@ -24,6 +24,32 @@ class TestAdminApi:
         assert res.json().get("name") == "test"
         assert res.json().get("institutions") == []
 
+    def test_get_me_cached(self, mocker: MockerFixture, app_fixture: FastAPI, auth_mock: Mock):
+        claims = {
+            "name": "test",
+            "preferred_username": "test_user",
+            "email": "test@local.host",
+            "sub": "testuser123",
+        }
+        auth_mock.return_value = (
+            AuthCredentials(["authenticated", "manage-account"]),
+            AuthenticatedUser.from_claim(claims),
+        )
+        get_user_mock = mocker.patch("regtech_api_commons.oauth2.oauth2_admin.OAuth2Admin.get_user")
+        get_user_mock.return_value = RegTechUser.from_claim(claims)
+        mocker.patch("regtech_api_commons.oauth2.oauth2_admin.OAuth2Admin.associate_to_leis")
+        client = TestClient(app_fixture)
+        client.get("/v1/admin/me")
+        res = client.get("/v1/admin/me")
+        assert res.status_code == 200
+        get_user_mock.assert_called_once_with("testuser123")
+
+        res = client.put("/v1/admin/me/institutions", json=["TEST1LEI100000000000"])
+        assert res.json().get("institutions") == ["TEST1LEI100000000000"]
+        res = client.get("/v1/admin/me")
+        get_user_mock.assert_called_once()
+        assert res.json().get("institutions") == ["TEST1LEI100000000000"]
+
     def test_get_me_authed_with_institutions(self, mocker: MockerFixture, app_fixture: FastAPI, auth_mock: Mock):
         claims = {
             "name": "test",
@@ -94,6 +120,7 @@ class TestAdminApi:
         res = client.put("/v1/admin/me", json=data)
         update_user_mock.assert_called_once_with("testuser123", {"firstName": "testFirst", "lastName": "testLast"})
         associate_lei_mock.assert_called_once_with("testuser123", {"TEST1LEI100000000000", "TEST2LEI200000000000"})
+        get_user_mock.assert_not_called()
         assert res.status_code == 200
         assert res.json().get("name") == "testFirst testLast"
         assert res.json().get("institutions") == ["TEST1LEI100000000000", "TEST2LEI200000000000"]
@@ -1,6 +1,11 @@
+import csv
+import io
+import json
+from datetime import datetime, timezone
 from http import HTTPStatus
 from unittest.mock import Mock, ANY
 
+import pytest
 from fastapi import FastAPI
 from fastapi.testclient import TestClient
 from pytest_mock import MockerFixture
@@ -16,8 +21,20 @@ from regtech_user_fi_management.entities.models.dao import (
     SblTypeMappingDao,
     LeiStatusDao,
 )
-from regtech_user_fi_management.entities.models.dto import SblTypeAssociationDto
-from regtech_user_fi_management.config import regex_configs
+from regtech_user_fi_management.entities.models.dto import (
+    FinancialInstitutionBulkUpsertDto,
+    FinancialInstitutionFamilyDto,
+    FinancialInstitutionFamilyMemberDto,
+    FinancialInstitutionHistoryDto,
+    FinancialInstitutionWithRelationsDto,
+    SblTypeAssociationDto,
+)
+from regtech_user_fi_management.config import regex_configs, settings
+from regtech_user_fi_management.entities.engine.routing import REPLICA_READS_KEY
+from regtech_user_fi_management.entities.engine.notifications import HistoryNotifier
+from regtech_user_fi_management.util.cursor import decode_cursor, encode_cursor
+from regtech_user_fi_management.util.sse import KEEP_ALIVE
+from regtech_user_fi_management.util.write_marker import WriteMarker
 
 
 class TestInstitutionsApi:
@@ -34,6 +51,34 @@ class TestInstitutionsApi:
         assert res.status_code == 200
         assert res.json()[0].get("name") == "Test Bank 123"
 
+    def test_get_institutions_cursor(
+        self, mocker: MockerFixture, app_fixture: FastAPI, authed_user_mock: Mock, get_institutions_mock: Mock
+    ):
+        client = TestClient(app_fixture)
+        res = client.get("/v1/institutions/?cursor=&count=1")
+        assert res.status_code == 200
+        get_institutions_mock.assert_called_once_with(ANY, None, "", 0, 1, "")
+        next_cursor = res.headers["X-Next-Cursor"]
+
+        res = client.get(f"/v1/institutions/?cursor={next_cursor}&count=2")
+        assert res.status_code == 200
+        get_institutions_mock.assert_called_with(ANY, None, "", 0, 2, "TESTBANK123000000000")
+        assert "X-Next-Cursor" not in res.headers
+
+        res = client.get("/v1/institutions/?count=1")
+        get_institutions_mock.assert_called_with(ANY, None, "", 0, 1, None)
+        assert "X-Next-Cursor" not in res.headers
+
+        res = client.get("/v1/institutions/?cursor=notacursor")
+        assert res.status_code == HTTPStatus.BAD_REQUEST
+        for value in (123, None):
+            res = client.get("/v1/institutions/", params={"cursor": encode_cursor(value)})
+            assert res.status_code == HTTPStatus.BAD_REQUEST
+        for count in (0, -1, settings.max_page_size + 1):
+            res = client.get("/v1/institutions/", params={"cursor": "", "count": count})
+            assert res.status_code == HTTPStatus.UNPROCESSABLE_ENTITY
+        assert client.get("/v1/institutions/", params={"page": -1}).status_code == HTTPStatus.UNPROCESSABLE_ENTITY
+
     def test_get_institutions_authed_not_admin(
         self,
         mocker: MockerFixture,
@@ -371,6 +416,59 @@ class TestInstitutionsApi:
         assert res.status_code == 200
         assert res.json().get("name") == "Test Bank 123"
 
+    def test_get_institution_etag(
+        self, mocker: MockerFixture, app_fixture: FastAPI, authed_user_mock: Mock, get_institutions_mock: Mock
+    ):
+        get_institution_mock = mocker.patch(
+            "regtech_user_fi_management.entities.repos.institutions_repo.get_institution"
+        )
+        get_institution_mock.return_value = get_institutions_mock.return_value[0]
+        get_institution_mock.return_value.version = 3
+        get_version_mock = mocker.patch(
+            "regtech_user_fi_management.entities.repos.institutions_repo.get_institution_version"
+        )
+        get_version_mock.return_value = Mock(version=3, domain_count=1)
+        client = TestClient(app_fixture)
+        lei_path = "TESTBANK123000000000"
+        res = client.get(f"/v1/institutions/{lei_path}")
+        assert res.status_code == 200
+        etag = res.headers["ETag"]
+        get_version_mock.assert_not_called()
+
+        res = client.get(f"/v1/institutions/{lei_path}", headers={"If-None-Match": etag})
+        assert res.status_code == HTTPStatus.NOT_MODIFIED
+        assert res.headers["ETag"] == etag
+        assert res.content == b""
+        get_version_mock.assert_called_once_with(ANY, lei_path)
+        get_institution_mock.assert_called_once()
+
+        get_version_mock.return_value = Mock(version=4, domain_count=1)
+        res = client.get(f"/v1/institutions/{lei_path}", headers={"If-None-Match": etag})
+        assert res.status_code == 200
+        assert get_institution_mock.call_count == 2
+
+    def test_get_sbl_types_etag(
+        self, mocker: MockerFixture, app_fixture: FastAPI, authed_user_mock: Mock, get_institutions_mock: Mock
+    ):
+        get_institution_mock = mocker.patch(
+            "regtech_user_fi_management.entities.repos.institutions_repo.get_institution"
+        )
+        get_institution_mock.return_value = get_institutions_mock.return_value[0]
+        get_institution_mock.return_value.version = 3
+        get_version_mock = mocker.patch(
+            "regtech_user_fi_management.entities.repos.institutions_repo.get_institution_version"
+        )
+        get_version_mock.return_value = Mock(version=3, domain_count=2)
+        client = TestClient(app_fixture)
+        lei_path = "TESTBANK123000000000"
+        res = client.get(f"/v1/institutions/{lei_path}/types/sbl")
+        assert res.status_code == 200
+        etag = res.headers["ETag"]
+
+        res = client.get(f"/v1/institutions/{lei_path}/types/sbl", headers={"If-None-Match": etag})
+        assert res.status_code == HTTPStatus.NOT_MODIFIED
+        get_institution_mock.assert_called_once()
+
     def test_get_institution_not_exists(self, mocker: MockerFixture, app_fixture: FastAPI, authed_user_mock: Mock):
         get_institution_mock = mocker.patch(
             "regtech_user_fi_management.entities.repos.institutions_repo.get_institution"
@@ -382,6 +480,66 @@ class TestInstitutionsApi:
         get_institution_mock.assert_called_once_with(ANY, lei_path)
         assert res.status_code == 404
 
+    def test_get_institution_as_of(self, mocker: MockerFixture, app_fixture: FastAPI, authed_user_mock: Mock):
+        as_of_mock = mocker.patch("regtech_user_fi_management.entities.repos.institutions_repo.get_institution_as_of")
+        as_of_mock.return_value = FinancialInstitutionWithRelationsDto(
+            name="Test Bank 123",
+            lei="TESTBANK123000000000",
+            lei_status_code="ISSUED",
+            hq_address_street_1="Test Address Street 1",
+            hq_address_city="Test City 1",
+            hq_address_zip="00000",
+            version=2,
+        )
+        client = TestClient(app_fixture)
+        res = client.get("/v1/institutions/TESTBANK123000000000", params={"as_of": 2})
+        assert res.status_code == 200
+        assert res.json()["version"] == 2
+        assert "ETag" not in res.headers
+        as_of_mock.assert_called_once_with(ANY, "TESTBANK123000000000", 2)
+
+        res = client.get("/v1/institutions/TESTBANK123000000000", params={"as_of": "2024-06-01T12:00:00Z"})
+        assert res.status_code == 200
+        as_of_mock.assert_called_with(ANY, "TESTBANK123000000000", datetime(2024, 6, 1, 12, tzinfo=timezone.utc))
+
+        assert client.get("/v1/institutions/TESTBANK123000000000", params={"as_of": "yesterday"}).status_code == 422
+
+        as_of_mock.return_value = None
+        res = client.get("/v1/institutions/TESTBANK123000000000", params={"as_of": 3})
+        assert res.status_code == 404
+
+    def test_get_institution_history(self, mocker: MockerFixture, app_fixture: FastAPI, authed_user_mock: Mock):
+        history_mock = mocker.patch(
+            "regtech_user_fi_management.entities.repos.institutions_repo.get_institution_history"
+        )
+        history_mock.return_value = [
+            FinancialInstitutionHistoryDto(
+                lei="TESTBANK123000000000",
+                version=version,
+                event_time=datetime(2024, 1, version),
+                modified_by="test_user_id",
+                changeset={"name": {"old": ["Old"], "new": ["New"]}},
+            )
+            for version in (3, 2)
+        ]
+        client = TestClient(app_fixture)
+        res = client.get("/v1/institutions/TESTBANK123000000000/history", params={"count": 2})
+        assert res.status_code == 200
+        assert [h["version"] for h in res.json()] == [3, 2]
+        assert res.json()[0]["changeset"] == {"name": {"old": ["Old"], "new": ["New"]}}
+        history_mock.assert_called_once_with(ANY, "TESTBANK123000000000", 2, None)
+        next_cursor = res.headers["X-Next-Cursor"]
+
+        res = client.get("/v1/institutions/TESTBANK123000000000/history", params={"cursor": next_cursor})
+        assert res.status_code == 200
+        history_mock.assert_called_with(ANY, "TESTBANK123000000000", 100, 2)
+        assert "X-Next-Cursor" not in res.headers
+
+        res = client.get("/v1/institutions/TESTBANK123000000000/history", params={"cursor": encode_cursor("x")})
+        assert res.status_code == HTTPStatus.BAD_REQUEST
+        res = client.get("/v1/institutions/TESTBANK123000000000/history", params={"count": settings.max_page_size + 1})
+        assert res.status_code == HTTPStatus.UNPROCESSABLE_ENTITY
+
     def test_add_domains_unauthed(self, app_fixture: FastAPI, unauthed_user_mock: Mock):
         client = TestClient(app_fixture)
 
@@ -437,10 +595,235 @@ class TestInstitutionsApi:
         domain_allowed_mock.assert_called_once_with(ANY, domain_to_check)
         assert res.json() is True
 
-    def test_get_associated_institutions(
-        self, mocker: MockerFixture, app_fixture: FastAPI, auth_mock: Mock, get_institutions_mock: Mock
+    def test_export_institutions(
+        self, mocker: MockerFixture, app_fixture: FastAPI, authed_user_mock: Mock, get_institutions_mock: Mock
     ):
-        get_institutions_mock.return_value = [
+        institutions = get_institutions_mock.return_value
+
+        async def stream_institutions(session, chunk_size):
+            for fi in institutions:
+                yield [fi]
+
+        stream_mock = mocker.patch("regtech_user_fi_management.entities.repos.institutions_repo.stream_institutions")
+        stream_mock.side_effect = stream_institutions
+        client = TestClient(app_fixture)
+
+        res = client.get("/v1/institutions/export")
+        assert res.status_code == 200
+        assert res.headers["content-type"] == "application/x-ndjson"
+        lines = res.text.splitlines()
+        assert len(lines) == 1
+        assert json.loads(lines[0])["lei"] == "TESTBANK123000000000"
+        assert json.loads(lines[0])["domains"][0]["domain"] == "test.bank"
+
+        res = client.get("/v1/institutions/export?format=csv")
+        assert res.status_code == 200
+        assert res.headers["content-type"].startswith("text/csv")
+        rows = list(csv.DictReader(io.StringIO(res.text)))
+        assert len(rows) == 1
+        assert rows[0]["lei"] == "TESTBANK123000000000"
+        assert rows[0]["sbl_institution_type_ids"] == "SIT1"
+        assert rows[0]["domains"] == "test.bank"
+
+    def test_search_institutions(
+        self, mocker: MockerFixture, app_fixture: FastAPI, authed_user_mock: Mock, get_institutions_mock: Mock
+    ):
+        search_mock = mocker.patch("regtech_user_fi_management.entities.repos.institutions_repo.search_institutions")
+        search_mock.return_value = get_institutions_mock.return_value
+        client = TestClient(app_fixture)
+        res = client.get("/v1/institutions/search", params={"q": " test bank ", "limit": 5})
+        assert res.status_code == 200
+        assert res.json()[0]["lei"] == "TESTBANK123000000000"
+        search_mock.assert_called_once_with(ANY, "test bank", 5)
+
+        assert client.get("/v1/institutions/search", params={"q": "te"}).status_code == 422
+        assert client.get("/v1/institutions/search", params={"q": "test", "limit": 51}).status_code == 422
+
+    def test_search_institutions_not_admin(self, app_fixture: FastAPI, auth_mock: Mock):
+        claims = {"name": "test", "preferred_username": "test_user", "email": "test@local.host", "sub": "testuser123"}
+        auth_mock.return_value = (AuthCredentials(["authenticated"]), AuthenticatedUser.from_claim(claims))
+        client = TestClient(app_fixture)
+        res = client.get("/v1/institutions/search", params={"q": "test bank"})
+        assert res.status_code == 403
+
+    def test_get_institution_family(self, mocker: MockerFixture, app_fixture: FastAPI, authed_user_mock: Mock):
+        family_mock = mocker.patch("regtech_user_fi_management.entities.repos.institutions_repo.get_institution_family")
+        family_mock.return_value = FinancialInstitutionFamilyDto(
+            lei="TESTBANK123000000000",
+            ancestors=[
+                FinancialInstitutionFamilyMemberDto(lei="012PARENTTESTBANK123", name="Parent", depth=-1),
+            ],
+        )
+        client = TestClient(app_fixture)
+        res = client.get("/v1/institutions/TESTBANK123000000000/family", params={"depth": 3})
+        assert res.status_code == 200
+        assert res.json()["ancestors"][0]["lei"] == "012PARENTTESTBANK123"
+        assert res.json()["truncated"] is False
+        family_mock.assert_called_once_with(ANY, "TESTBANK123000000000", 3)
+
+        assert client.get("/v1/institutions/TESTBANK123000000000/family", params={"depth": 11}).status_code == 422
+
+        family_mock.return_value = None
+        res = client.get("/v1/institutions/TESTBANK123000000000/family")
+        assert res.status_code == 404
+
+    @pytest.fixture
+    def changes(self) -> list:
+        return [
+            FinancialInstitutionHistoryDto(
+                lei=lei, version=1, event_time=datetime(2024, 1, 1), changeset={"name": {"old": [], "new": ["New"]}}
+            )
+            for lei in ("TESTBANK123000000000", "TESTBANK456000000000")
+        ]
+
+    @pytest.fixture
+    def listen_mock(self, mocker: MockerFixture) -> Mock:
+        return mocker.patch.object(HistoryNotifier, "_listen")
+
+    def test_get_institution_changes(
+        self, mocker: MockerFixture, app_fixture: FastAPI, authed_user_mock: Mock, listen_mock: Mock, changes: list
+    ):
+        changes_mock = mocker.patch(
+            "regtech_user_fi_management.entities.repos.institutions_repo.get_institution_changes"
+        )
+        changes_mock.return_value = changes
+        client = TestClient(app_fixture)
+        res = client.get("/v1/institutions/changes", params={"count": 2})
+        assert res.status_code == 200
+        assert [c["lei"] for c in res.json()] == ["TESTBANK123000000000", "TESTBANK456000000000"]
+        changes_mock.assert_called_once_with(ANY, None, 2, settings.change_feed_settle_seconds)
+        next_cursor = res.headers["X-Next-Cursor"]
+        assert decode_cursor(next_cursor, 3) == ["2024-01-01T00:00:00", "TESTBANK456000000000", 1]
+
+        changes_mock.return_value = []
+        res = client.get("/v1/institutions/changes", params={"cursor": next_cursor})
+        assert res.json() == []
+        changes_mock.assert_called_with(
+            ANY, (datetime(2024, 1, 1), "TESTBANK456000000000", 1), 100, settings.change_feed_settle_seconds
+        )
+        assert res.headers["X-Next-Cursor"] == next_cursor
+
+        assert client.get("/v1/institutions/changes", params={"cursor": "notacursor"}).status_code == 400
+        bad_cursor = encode_cursor("yesterday", "TESTBANK456000000000", 1)
+        assert client.get("/v1/institutions/changes", params={"cursor": bad_cursor}).status_code == 400
+        assert client.get("/v1/institutions/changes", params={"wait": 31}).status_code == 422
+        assert client.get("/v1/institutions/changes", params={"count": settings.max_page_size + 1}).status_code == 422
+        res = client.get("/v1/institutions/changes/stream", params={"count": settings.max_page_size + 1})
+        assert res.status_code == 422
+
+    def test_get_institution_changes_reads_primary(
+        self, mocker: MockerFixture, app_fixture: FastAPI, authed_user_mock: Mock, listen_mock: Mock
+    ):
+        from regtech_user_fi_management.entities.engine import engine as engine_module
+
+        mocker.patch.object(engine_module, "write_marker", WriteMarker(b"secret", ttl=5))
+        changes_mock = mocker.patch(
+            "regtech_user_fi_management.entities.repos.institutions_repo.get_institution_changes"
+        )
+        changes_mock.return_value = []
+        client = TestClient(app_fixture)
+        assert client.get("/v1/institutions/changes").status_code == 200
+        session = changes_mock.call_args.args[0]
+        assert REPLICA_READS_KEY not in session.info
+
+    def test_get_institution_changes_long_poll(
+        self, mocker: MockerFixture, app_fixture: FastAPI, authed_user_mock: Mock, listen_mock: Mock, changes: list
+    ):
+        changes_mock = mocker.patch(
+            "regtech_user_fi_management.entities.repos.institutions_repo.get_institution_changes"
+        )
+        changes_mock.side_effect = [[], changes]
+        wait_mock = mocker.patch("regtech_user_fi_management.routers.institutions.wait_for_changes")
+        wait_mock.return_value = True
+        client = TestClient(app_fixture)
+        res = client.get("/v1/institutions/changes", params={"wait": 10})
+        assert res.status_code == 200
+        assert len(res.json()) == 2
+        wait_mock.assert_called_once_with(ANY, 10)
+        assert changes_mock.call_count == 2
+
+    async def test_change_events(self, mocker: MockerFixture, app_fixture: FastAPI, listen_mock: Mock, changes: list):
+        from regtech_user_fi_management.routers.institutions import change_events
+
+        changes_mock = mocker.patch(
+            "regtech_user_fi_management.entities.repos.institutions_repo.get_institution_changes"
+        )
+        changes_mock.side_effect = [changes, [], []]
+        wait_mock = mocker.patch("regtech_user_fi_management.routers.institutions.wait_for_changes")
+        wait_mock.side_effect = [True, False]
+        events = change_events(None, 100)
+        first = await events.__anext__()
+        assert first.startswith(f"id: {encode_cursor('2024-01-01T00:00:00', 'TESTBANK123000000000', 1)}\n")
+        assert "event: change\n" in first
+        assert json.loads(first.split("data: ")[1])["lei"] == "TESTBANK123000000000"
+        assert (await events.__anext__()).startswith("id: ")
+        # a notification wakes the next read, which finds nothing new before the heartbeat
+        assert await events.__anext__() == KEEP_ALIVE
+        await events.aclose()
+        assert changes_mock.call_args_list[1].args[1:3] == ((datetime(2024, 1, 1), "TESTBANK456000000000", 1), 100)
+
+    def test_stream_institution_changes_invalid_cursor(
+        self, app_fixture: FastAPI, authed_user_mock: Mock, listen_mock: Mock
+    ):
+        client = TestClient(app_fixture)
+        res = client.get("/v1/institutions/changes/stream", headers={"Last-Event-ID": "notacursor"})
+        assert res.status_code == 400
+
+    def test_institution_changes_not_admin(self, app_fixture: FastAPI, auth_mock: Mock):
+        claims = {"name": "test", "preferred_username": "test_user", "email": "test@local.host", "sub": "testuser123"}
+        auth_mock.return_value = (AuthCredentials(["authenticated"]), AuthenticatedUser.from_claim(claims))
+        client = TestClient(app_fixture)
+        assert client.get("/v1/institutions/changes").status_code == 403
+        assert client.get("/v1/institutions/changes/stream").status_code == 403
+
+    def test_export_institutions_not_admin(self, app_fixture: FastAPI, auth_mock: Mock):
+        claims = {"name": "test", "preferred_username": "test_user", "email": "test@local.host", "sub": "testuser123"}
+        auth_mock.return_value = (AuthCredentials(["authenticated"]), AuthenticatedUser.from_claim(claims))
+        client = TestClient(app_fixture)
+        res = client.get("/v1/institutions/export")
+        assert res.status_code == 403
+
+    def test_bulk_upsert_institutions(self, mocker: MockerFixture, app_fixture: FastAPI, authed_user_mock: Mock):
+        bulk_upsert_mock = mocker.patch(
+            "regtech_user_fi_management.entities.repos.institutions_repo.bulk_upsert_institutions"
+        )
+        bulk_upsert_mock.return_value = FinancialInstitutionBulkUpsertDto(
+            created=["1234567890ABCDEFGH00"], updated=["1234567890ABCDEFGH01"], unchanged=["1234567890ABCDEFGH02"]
+        )
+        upsert_group_mock = mocker.patch("regtech_api_commons.oauth2.oauth2_admin.OAuth2Admin.upsert_group")
+        upsert_group_mock.side_effect = lambda lei, name: f"group-{lei}"
+        fis = [
+            {
+                "name": f"testName{i}",
+                "lei": f"1234567890ABCDEFGH0{i}",
+                "lei_status_code": "ISSUED",
+                "hq_address_street_1": "Test Address Street 1",
+                "hq_address_city": "Test City 1",
+                "hq_address_zip": "00000",
+            }
+            for i in range(3)
+        ]
+        client = TestClient(app_fixture)
+        res = client.post("/v1/institutions/bulk", json=fis)
+        assert res.status_code == 200
+        assert [fi.lei for fi in bulk_upsert_mock.call_args.args[1]] == [fi["lei"] for fi in fis]
+        assert upsert_group_mock.call_count == 2
+        upsert_group_mock.assert_any_call("1234567890ABCDEFGH00", "testName0")
+        upsert_group_mock.assert_any_call("1234567890ABCDEFGH01", "testName1")
+        assert res.json()["groups"] == {
+            "1234567890ABCDEFGH00": "group-1234567890ABCDEFGH00",
+            "1234567890ABCDEFGH01": "group-1234567890ABCDEFGH01",
+        }
+
+        res = client.post("/v1/institutions/bulk", json=[fis[0], fis[1], fis[0]])
+        assert res.status_code == HTTPStatus.BAD_REQUEST
+        assert "1234567890ABCDEFGH00" in res.json()["error_detail"]
+
+    def test_get_associated_institutions(self, mocker: MockerFixture, app_fixture: FastAPI, auth_mock: Mock):
+        get_associated_mock = mocker.patch(
+            "regtech_user_fi_management.entities.repos.institutions_repo.get_associated_institutions"
+        )
+        get_associated_mock.return_value = [
             FinancialInstitutionDao(
                 name="Test Bank 123",
                 lei="TESTBANK123000000000",
@@ -468,6 +851,7 @@ class TestInstitutionsApi:
                 top_holder_lei="01234TOPHOLDERLEI123",
                 top_holder_legal_name="TOP HOLDER LEI 123",
                 top_holder_rssd_id=123456,
+                approved=False,
             ),
             FinancialInstitutionDao(
                 name="Test Bank 234",
@@ -496,6 +880,7 @@ class TestInstitutionsApi:
                 top_holder_lei="01234TOPHOLDERLEI123",
                 top_holder_legal_name="TOP HOLDER LEI 123",
                 top_holder_rssd_id=341256,
+                approved=True,
             ),
         ]
         claims = {
@@ -512,7 +897,9 @@ class TestInstitutionsApi:
         client = TestClient(app_fixture)
         res = client.get("/v1/institutions/associated")
         assert res.status_code == 200
-        get_institutions_mock.assert_called_once_with(ANY, ["TESTBANK123000000000", "TESTBANK234000000000"])
+        get_associated_mock.assert_called_once_with(
+            ANY, ["TESTBANK123000000000", "TESTBANK234000000000"], "test234.bank"
+        )
         data = res.json()
         inst1 = next(filter(lambda inst: inst["lei"] == "TESTBANK123000000000", data))
         inst2 = next(filter(lambda inst: inst["lei"] == "TESTBANK234000000000", data))
@@ -522,9 +909,12 @@ class TestInstitutionsApi:
         assert inst2["lei_status"]["can_file"] is False
 
     def test_get_associated_institutions_with_no_institutions(
-        self, app_fixture: FastAPI, auth_mock: Mock, get_institutions_mock: Mock
+        self, mocker: MockerFixture, app_fixture: FastAPI, auth_mock: Mock
     ):
-        get_institutions_mock.return_value = []
+        get_associated_mock = mocker.patch(
+            "regtech_user_fi_management.entities.repos.institutions_repo.get_associated_institutions"
+        )
+        get_associated_mock.return_value = []
         claims = {
             "name": "test",
             "preferred_username": "test_user",
@@ -539,7 +929,7 @@ class TestInstitutionsApi:
         client = TestClient(app_fixture)
         res = client.get("/v1/institutions/associated")
         assert res.status_code == 200
-        get_institutions_mock.assert_called_once_with(ANY, [])
+        get_associated_mock.assert_called_once_with(ANY, [], "test234.bank")
         assert res.json() == []
 
     def test_get_institution_types(self, mocker: MockerFixture, app_fixture: FastAPI, authed_user_mock: Mock):
@@ -557,6 +947,17 @@ class TestInstitutionsApi:
         res = client.get("/v1/institutions/types/blah")
         assert res.status_code == 422
 
+    def test_get_institution_types_cached(self, mocker: MockerFixture, app_fixture: FastAPI, authed_user_mock: Mock):
+        mock = mocker.patch("regtech_user_fi_management.entities.repos.institutions_repo.get_sbl_types")
+        mock.return_value = [SBLInstitutionTypeDao(id="1", name="Bank or savings association")]
+        client = TestClient(app_fixture)
+        res = client.get("/v1/institutions/types/sbl")
+        assert res.status_code == 200
+        res = client.get("/v1/institutions/types/sbl")
+        assert res.status_code == 200
+        assert res.json() == [{"id": "1", "name": "Bank or savings association"}]
+        mock.assert_called_once()
+
     def test_get_address_states(self, mocker: MockerFixture, app_fixture: FastAPI, authed_user_mock: Mock):
         mock = mocker.patch("regtech_user_fi_management.entities.repos.institutions_repo.get_address_states")
         mock.return_value = []
@@ -643,6 +1044,52 @@ class TestInstitutionsApi:
             ANY, ANY, test_lei, ["1", SblTypeAssociationDto(id="2"), SblTypeAssociationDto(id="13", details="test")]
         )
 
+    def test_writes_keep_reads_on_primary(self, mocker: MockerFixture, app_fixture: FastAPI, authed_user_mock: Mock):
+        from regtech_user_fi_management.entities.engine import engine as engine_module
+
+        mocker.patch.object(engine_module, "write_marker", WriteMarker(b"secret", ttl=5))
+        mocker.patch("regtech_user_fi_management.entities.repos.institutions_repo.update_sbl_types")
+        get_institution_mock = mocker.patch(
+            "regtech_user_fi_management.entities.repos.institutions_repo.get_institution"
+        )
+        get_institution_mock.return_value = None
+        client = TestClient(app_fixture)
+        test_lei = "TESTBANK123000000000"
+
+        def read_from_replica() -> bool:
+            client.get(f"/v1/institutions/{test_lei}/types/sbl")
+            return REPLICA_READS_KEY in get_institution_mock.call_args.args[0].info
+
+        # a client's first read can't tell whether it just wrote; it's handed a marker for later ones
+        assert not read_from_replica()
+        assert "fi_last_write" in client.cookies
+        assert read_from_replica()
+
+        res = client.put(f"/v1/institutions/{test_lei}/types/sbl", json={"sbl_institution_types": ["1"]})
+        assert "fi_last_write" in res.cookies
+        assert not read_from_replica()
+
+    def test_cookieless_reads_stay_on_primary(
+        self, mocker: MockerFixture, app_fixture: FastAPI, authed_user_mock: Mock
+    ):
+        from regtech_user_fi_management.entities.engine import engine as engine_module
+
+        mocker.patch.object(engine_module, "write_marker", WriteMarker(b"secret", ttl=5))
+        mocker.patch("regtech_user_fi_management.entities.repos.institutions_repo.update_sbl_types")
+        get_institution_mock = mocker.patch(
+            "regtech_user_fi_management.entities.repos.institutions_repo.get_institution"
+        )
+        get_institution_mock.return_value = None
+        client = TestClient(app_fixture)
+        test_lei = "TESTBANK123000000000"
+
+        for _ in range(2):
+            client.put(f"/v1/institutions/{test_lei}/types/sbl", json={"sbl_institution_types": ["1"]})
+            client.cookies.clear()
+            client.get(f"/v1/institutions/{test_lei}/types/sbl")
+            client.cookies.clear()
+            assert REPLICA_READS_KEY not in get_institution_mock.call_args.args[0].info
+
     def test_update_non_existing_institution_types(
         self, mocker: MockerFixture, app_fixture: FastAPI, authed_user_mock: Mock
     ):
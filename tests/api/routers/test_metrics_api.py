@@ -0,0 +1,15 @@
+from unittest.mock import Mock
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+
+def test_metrics_endpoint(app_fixture: FastAPI, unauthed_user_mock: Mock):
+    client = TestClient(app_fixture)
+    client.get("/v1/institutions/address-states")
+    res = client.get("/metrics")
+    assert res.status_code == 200
+    assert res.headers["content-type"].startswith("text/plain")
+    assert 'http_request_duration_seconds_count{method="GET",route="/v1/institutions/address-states"' in res.text
+    assert "threadpool_threads_total" in res.text
+    assert 'cache_hits_total{cache="reference_data"}' in res.text
@@ -0,0 +1,92 @@
+from unittest.mock import Mock
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
+
+from regtech_user_fi_management.entities.engine.engine import get_session
+from regtech_user_fi_management.entities.engine.query_stats import instrument_engines
+from regtech_user_fi_management.entities.models.dao import (
+    AddressStateDao,
+    Base,
+    FederalRegulatorDao,
+    FinancialInstitutionDao,
+    FinancialInstitutionDomainDao,
+    HMDAInstitutionTypeDao,
+    LeiStatusDao,
+    SBLInstitutionTypeDao,
+    SblTypeMappingDao,
+)
+from tests.conftest import QueryBudget
+
+INSTITUTION_COUNT = 20
+
+
+@pytest.fixture
+async def sqlite_engine() -> AsyncEngine:
+    engine = create_async_engine("sqlite+aiosqlite://")
+    instrument_engines()
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with async_sessionmaker(engine)() as session:
+        sbl_type = SBLInstitutionTypeDao(id="1", name="SIT1")
+        session.add_all(
+            [
+                AddressStateDao(code="GA", name="Georgia"),
+                FederalRegulatorDao(id="FRI1", name="FRI1"),
+                HMDAInstitutionTypeDao(id="HIT1", name="HIT1"),
+                LeiStatusDao(code="ISSUED", name="Issued", can_file=True),
+            ]
+        )
+        for i in range(INSTITUTION_COUNT):
+            lei = f"TESTBANK{i:03}000000000"
+            session.add(
+                FinancialInstitutionDao(
+                    name=f"Test Bank {i}",
+                    lei=lei,
+                    lei_status_code="ISSUED",
+                    domains=[FinancialInstitutionDomainDao(domain="test.bank", lei=lei)],
+                    primary_federal_regulator_id="FRI1",
+                    hmda_institution_type_id="HIT1",
+                    sbl_institution_types=[SblTypeMappingDao(sbl_type=sbl_type, modified_by="test_user_id")],
+                    hq_address_street_1="Test Address Street 1",
+                    hq_address_city="Test City",
+                    hq_address_state_code="GA",
+                    hq_address_zip="00000",
+                    modified_by="test_user_id",
+                )
+            )
+        await session.commit()
+    yield engine
+    await engine.dispose()
+
+
+@pytest.fixture
+def db_app(app_fixture: FastAPI, sqlite_engine: AsyncEngine) -> FastAPI:
+    session_maker = async_sessionmaker(sqlite_engine, expire_on_commit=False)
+
+    async def sqlite_session():
+        async with session_maker() as session:
+            yield session
+
+    app_fixture.dependency_overrides[get_session] = sqlite_session
+    yield app_fixture
+    app_fixture.dependency_overrides.pop(get_session)
+
+
+def test_get_institutions_query_budget(db_app: FastAPI, authed_user_mock: Mock, query_budget: QueryBudget):
+    client = TestClient(db_app)
+    with query_budget(3):
+        res = client.get("/v1/institutions/", params={"domain": "test.bank"})
+    assert res.status_code == 200
+    assert len(res.json()) == INSTITUTION_COUNT
+
+
+def test_get_associated_institutions_query_budget(db_app: FastAPI, authed_user_mock: Mock, query_budget: QueryBudget):
+    authed_user_mock.return_value[1].institutions = [f"TESTBANK{i:03}000000000" for i in range(INSTITUTION_COUNT)]
+    client = TestClient(db_app)
+    with query_budget(3):
+        res = client.get("/v1/institutions/associated")
+    assert res.status_code == 200
+    assert len(res.json()) == INSTITUTION_COUNT
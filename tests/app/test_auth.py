@@ -0,0 +1,108 @@
+import time
+from threading import Event
+from unittest.mock import Mock
+
+import jwt
+import pytest
+from cryptography.hazmat.primitives.asymmetric import rsa
+from pydantic import AnyUrl
+from pytest_mock import MockerFixture
+from regtech_api_commons.oauth2.config import KeycloakSettings
+
+from regtech_user_fi_management.auth import JwksKeys, TokenVerifier
+
+ISSUER = "http://localhost/realms/regtech"
+AUDIENCE = "regtech-client"
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture(scope="module")
+def private_key():
+    return rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+
+@pytest.fixture
+def clock() -> FakeClock:
+    return FakeClock()
+
+
+@pytest.fixture
+def jwks_keys(mocker: MockerFixture, private_key, clock: FakeClock) -> JwksKeys:
+    jwk = {**jwt.algorithms.RSAAlgorithm.to_jwk(private_key.public_key(), as_dict=True), "kid": "k1", "alg": "RS256"}
+    keys = JwksKeys("http://localhost/certs", clock=clock)
+    mocker.patch.object(keys._client, "get_jwk_set", return_value=jwt.PyJWKSet.from_dict({"keys": [jwk]}))
+    return keys
+
+
+@pytest.fixture
+def verifier(jwks_keys: JwksKeys) -> TokenVerifier:
+    kc_settings = Mock(KeycloakSettings)
+    kc_settings.kc_realm_url = AnyUrl(ISSUER)
+    kc_settings.auth_client = AUDIENCE
+    kc_settings.jwt_opts = {"verify_at_hash": False}
+    return TokenVerifier(kc_settings, jwks_keys, cache_maxsize=10)
+
+
+def make_token(private_key, kid: str = "k1", **claims) -> str:
+    payload = {"sub": "testuser123", "iss": ISSUER, "aud": AUDIENCE, "exp": int(time.time()) + 300, **claims}
+    return jwt.encode(payload, private_key, algorithm="RS256", headers={"kid": kid})
+
+
+def test_claims_cached_until_expiry(mocker: MockerFixture, verifier: TokenVerifier, jwks_keys: JwksKeys, private_key):
+    jwks_keys.refresh()
+    decode_spy = mocker.spy(jwt, "decode")
+    token = make_token(private_key)
+    assert verifier.get_claims(token)["sub"] == "testuser123"
+    assert verifier.get_claims(token)["sub"] == "testuser123"
+    decode_spy.assert_called_once()
+    assert verifier.claims_cache.hits == 1
+
+
+def test_invalid_tokens_rejected(verifier: TokenVerifier, jwks_keys: JwksKeys, private_key):
+    jwks_keys.refresh()
+    assert verifier.get_claims(make_token(private_key, exp=int(time.time()) - 10)) is None
+    assert verifier.get_claims(make_token(private_key, aud="other-client")) is None
+    other_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    assert verifier.get_claims(make_token(other_key)) is None
+    assert verifier.get_claims("not.a.token") is None
+    assert len(verifier.claims_cache) == 0
+
+
+def wait_for_refresh(jwks_keys: JwksKeys) -> None:
+    if jwks_keys._refresh_thread is not None:
+        jwks_keys._refresh_thread.join(timeout=5)
+
+
+def test_unknown_key_refreshes_in_background(
+    verifier: TokenVerifier, jwks_keys: JwksKeys, clock: FakeClock, private_key
+):
+    jwks_keys.refresh()
+    token = make_token(private_key, kid="k2")
+    assert verifier.get_claims(token) is None
+    wait_for_refresh(jwks_keys)
+    assert jwks_keys._client.get_jwk_set.call_count == 2
+    assert verifier.get_claims(token) is None
+    wait_for_refresh(jwks_keys)
+    assert jwks_keys._client.get_jwk_set.call_count == 2
+    clock.now = jwks_keys.min_refresh_interval
+    assert verifier.get_claims(token) is None
+    wait_for_refresh(jwks_keys)
+    assert jwks_keys._client.get_jwk_set.call_count == 3
+
+
+def test_unknown_key_never_fetched_inline(verifier: TokenVerifier, jwks_keys: JwksKeys, private_key):
+    fetched = Event()
+    jwks_keys._client.get_jwk_set.side_effect = lambda: fetched.wait(5) and jwks_keys._client.get_jwk_set.return_value
+    token = make_token(private_key)
+    assert verifier.get_claims(token) is None
+    assert jwks_keys._refresh_thread.is_alive()
+    fetched.set()
+    wait_for_refresh(jwks_keys)
+    assert verifier.get_claims(token)["sub"] == "testuser123"
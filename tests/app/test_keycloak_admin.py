@@ -0,0 +1,88 @@
+import asyncio
+import time
+from http import HTTPStatus
+from unittest.mock import Mock
+
+import pytest
+from regtech_api_commons.api.exceptions import RegTechHttpException
+from regtech_api_commons.models.auth import RegTechUser
+from regtech_api_commons.oauth2.oauth2_admin import OAuth2Admin
+
+from regtech_user_fi_management.keycloak_admin import KeycloakAdmin, apply_user_writes
+from regtech_user_fi_management.util.circuit_breaker import CircuitBreaker
+
+
+@pytest.fixture
+def oauth2_admin() -> Mock:
+    return Mock(OAuth2Admin)
+
+
+@pytest.fixture
+def keycloak_admin(oauth2_admin: Mock):
+    admin = KeycloakAdmin(
+        oauth2_admin, max_workers=2, timeout=0.2, breaker=CircuitBreaker("test", failure_threshold=1, reset_timeout=60)
+    )
+    yield admin
+    admin.close()
+
+
+async def test_upsert_groups(keycloak_admin: KeycloakAdmin, oauth2_admin: Mock):
+    oauth2_admin.upsert_group.side_effect = lambda lei, name: f"group-{lei}"
+    assert await keycloak_admin.upsert_groups({"LEI1": "Bank 1", "LEI2": "Bank 2"}) == {
+        "LEI1": "group-LEI1",
+        "LEI2": "group-LEI2",
+    }
+
+
+async def test_queued_calls_dont_time_out(keycloak_admin: KeycloakAdmin, oauth2_admin: Mock):
+    # 20 calls of 0.05s on 2 workers take 0.5s in all, well past the 0.2s timeout of each
+    oauth2_admin.upsert_group.side_effect = lambda lei, name: time.sleep(0.05) or f"group-{lei}"
+    groups = {f"LEI{i}": f"Bank {i}" for i in range(20)}
+    assert await keycloak_admin.upsert_groups(groups) == {lei: f"group-{lei}" for lei in groups}
+    assert keycloak_admin.breaker.state == "closed"
+
+
+async def test_timeout_opens_breaker(keycloak_admin: KeycloakAdmin, oauth2_admin: Mock):
+    oauth2_admin.get_user.side_effect = lambda user_id: time.sleep(0.5)
+    with pytest.raises(RegTechHttpException) as e:
+        await keycloak_admin.get_user("testuser123")
+    assert e.value.status_code == HTTPStatus.GATEWAY_TIMEOUT
+    with pytest.raises(RegTechHttpException) as e:
+        await keycloak_admin.get_user("testuser123")
+    assert e.value.status_code == HTTPStatus.SERVICE_UNAVAILABLE
+    assert oauth2_admin.get_user.call_count == 1
+
+
+async def test_client_errors_keep_breaker_closed(keycloak_admin: KeycloakAdmin, oauth2_admin: Mock):
+    oauth2_admin.get_user.side_effect = RegTechHttpException(HTTPStatus.NOT_FOUND, name="User Not Found")
+    for _ in range(2):
+        with pytest.raises(RegTechHttpException) as e:
+            await keycloak_admin.get_user("testuser123")
+        assert e.value.status_code == HTTPStatus.NOT_FOUND
+    assert keycloak_admin.breaker.state == "closed"
+
+
+async def test_cancelled_trial_is_released(keycloak_admin: KeycloakAdmin, oauth2_admin: Mock):
+    keycloak_admin.breaker.record_failure()
+    keycloak_admin.breaker.reset_timeout = 0
+    assert keycloak_admin.breaker.state == "half_open"
+    oauth2_admin.get_user.side_effect = lambda user_id: time.sleep(0.1)
+    trial = asyncio.create_task(keycloak_admin.get_user("testuser123"))
+    await asyncio.sleep(0.01)
+    trial.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await trial
+
+    oauth2_admin.get_user.side_effect = None
+    oauth2_admin.get_user.return_value = {"id": "testuser123"}
+    assert await keycloak_admin.get_user("testuser123") == {"id": "testuser123"}
+    assert keycloak_admin.breaker.state == "closed"
+
+
+def test_apply_user_writes():
+    user = RegTechUser.from_claim({"sub": "testuser123", "name": "test", "institutions": ["/TESTBANK123"]})
+    updated = apply_user_writes(user, name="First Last", leis={"TESTBANK456", "TESTBANK123"})
+    assert updated.id == "testuser123"
+    assert updated.name == "First Last"
+    assert updated.institutions == ["TESTBANK123", "TESTBANK456"]
+    assert apply_user_writes({"id": "testuser123", "username": "test_user"}).username == "test_user"
@@ -0,0 +1,78 @@
+from unittest.mock import Mock
+
+from prometheus_client import REGISTRY
+from sqlalchemy import create_engine, text
+
+from regtech_user_fi_management.entities.engine.query_stats import instrument_engines
+from regtech_user_fi_management.keycloak_admin import KeycloakAdmin
+from regtech_user_fi_management.metrics import CacheCollector, PoolCollector, ThreadpoolCollector, instrumented
+from regtech_user_fi_management.util.circuit_breaker import CircuitBreaker
+from regtech_user_fi_management.util.ttl_cache import TtlCache
+
+
+def samples(collector) -> dict:
+    return {(s.name, tuple(s.labels.values())): s.value for metric in collector.collect() for s in metric.samples}
+
+
+async def test_statement_duration_by_repo_function():
+    engine = create_engine("sqlite://")
+    instrument_engines()
+
+    @instrumented
+    async def count_things():
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+            conn.execute(text("SELECT 2"))
+
+    labels = {"function": "count_things"}
+    before = REGISTRY.get_sample_value("db_statement_duration_seconds_count", labels) or 0
+    await count_things()
+    assert REGISTRY.get_sample_value("db_statement_duration_seconds_count", labels) == before + 2
+
+
+async def test_keycloak_latency():
+    def get_user(user_id: str):
+        return {"id": user_id}
+
+    oauth2_admin = Mock(get_user=get_user)
+    admin = KeycloakAdmin(oauth2_admin, 1, 1, CircuitBreaker("test", failure_threshold=1, reset_timeout=60))
+    labels = {"operation": "get_user", "outcome": "success"}
+    before = REGISTRY.get_sample_value("keycloak_request_duration_seconds_count", labels) or 0
+    await admin.get_user("testuser123")
+    admin.close()
+    assert REGISTRY.get_sample_value("keycloak_request_duration_seconds_count", labels) == before + 1
+    assert REGISTRY.get_sample_value("keycloak_requests_in_flight") == 0
+
+
+def test_pool_collector():
+    status = {"primary": {"checked_out": 2, "checkouts": 7}, "replica": {"checked_out": 1, "checkouts": 3}}
+    assert samples(PoolCollector(lambda: status)) == {
+        ("db_pool_checked_out", ("primary",)): 2,
+        ("db_pool_checkouts_total", ("primary",)): 7,
+        ("db_pool_checked_out", ("replica",)): 1,
+        ("db_pool_checkouts_total", ("replica",)): 3,
+    }
+
+
+def test_threadpool_collector():
+    limiter = Mock(borrowed_tokens=3, total_tokens=40)
+    assert samples(ThreadpoolCollector(lambda: limiter)) == {
+        ("threadpool_threads_in_use", ()): 3,
+        ("threadpool_threads_total", ()): 40,
+    }
+
+    def no_loop():
+        raise RuntimeError("no running event loop")
+
+    assert samples(ThreadpoolCollector(no_loop)) == {}
+
+
+def test_cache_collector():
+    first, second = TtlCache("test_cache", ttl=60), TtlCache("test_cache", ttl=60)
+    first.set("a", 1)
+    first.get("a")
+    second.get("b")
+    collected = samples(CacheCollector(lambda: [first, second]))
+    assert collected[("cache_hits_total", ("test_cache",))] == 1
+    assert collected[("cache_misses_total", ("test_cache",))] == 1
+    assert collected[("cache_entries", ("test_cache",))] == 1
@@ -0,0 +1,58 @@
+import logging
+from unittest.mock import Mock
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+
+from regtech_user_fi_management.entities.engine.query_stats import instrument_engines
+from regtech_user_fi_management.middleware import QueryStatsMiddleware, route_template
+
+
+@pytest.fixture
+def stats_app() -> FastAPI:
+    engine = create_engine("sqlite://")
+    instrument_engines()
+    app = FastAPI()
+
+    @app.get("/n-plus-one")
+    def n_plus_one():
+        with engine.connect() as conn:
+            for i in range(3):
+                conn.execute(text("SELECT :i"), {"i": i})
+        return {}
+
+    return app
+
+
+def test_query_stats_headers(stats_app: FastAPI, caplog):
+    stats_app.add_middleware(QueryStatsMiddleware, repeat_threshold=3, expose_headers=True)
+    with caplog.at_level(logging.INFO, logger="regtech_user_fi_management.middleware"):
+        res = TestClient(stats_app).get("/n-plus-one")
+    assert res.headers["X-Query-Count"] == "3"
+    assert float(res.headers["X-Query-Duration-Ms"]) > 0
+    assert res.headers["X-Query-Repeated"] == "1"
+    assert "GET /n-plus-one: 3 statements" in caplog.text
+    assert "possible N+1, statement ran 3 times: SELECT ?" in caplog.text
+
+
+def test_query_stats_headers_hidden(stats_app: FastAPI):
+    stats_app.add_middleware(QueryStatsMiddleware, repeat_threshold=3)
+    res = TestClient(stats_app).get("/n-plus-one")
+    assert res.status_code == 200
+    assert "X-Query-Count" not in res.headers
+
+
+def test_route_template():
+    route = Mock(path="/{lei}/types/{type}")
+    scope = {
+        "route": route,
+        "path": "/v1/institutions/TESTBANK123/types/sbl",
+        "path_params": {"lei": "TESTBANK123", "type": "sbl"},
+    }
+    assert route_template(scope) == "/v1/institutions/{lei}/types/{type}"
+    assert (
+        route_template({"route": Mock(path="/"), "path": "/v1/institutions/", "path_params": {}}) == "/v1/institutions/"
+    )
+    assert route_template({"path": "/missing"}) == "unmatched"
@@ -0,0 +1,74 @@
+from unittest.mock import MagicMock, Mock
+
+import pytest
+from pytest_mock import MockerFixture
+
+from regtech_user_fi_management import migrations
+
+
+@pytest.fixture
+def engine_mock() -> Mock:
+    engine = MagicMock()
+    conn = engine.connect.return_value.execution_options.return_value.__enter__.return_value
+    engine.conn = conn
+    return engine
+
+
+@pytest.fixture
+def run_migrations_mock(mocker: MockerFixture) -> Mock:
+    return mocker.patch("regtech_user_fi_management.migrations.run_migrations")
+
+
+def executed_sql(conn: Mock) -> list:
+    return [str(c.args[0]) for c in conn.execute.call_args_list]
+
+
+def test_migrate_with_lock_at_head_skips_lock(mocker: MockerFixture, engine_mock: Mock, run_migrations_mock: Mock):
+    mocker.patch("regtech_user_fi_management.migrations.is_at_head", return_value=True)
+    assert not migrations.migrate_with_lock(engine_mock, "main", Mock())
+    engine_mock.conn.execute.assert_not_called()
+    run_migrations_mock.assert_not_called()
+
+
+def test_migrate_with_lock_upgrades(mocker: MockerFixture, engine_mock: Mock, run_migrations_mock: Mock):
+    mocker.patch("regtech_user_fi_management.migrations.is_at_head", side_effect=[False, False])
+    cfg = Mock()
+    assert migrations.migrate_with_lock(engine_mock, "main", cfg)
+    run_migrations_mock.assert_called_once_with(cfg)
+    assert executed_sql(engine_mock.conn) == ["SELECT pg_advisory_lock(:id)", "SELECT pg_advisory_unlock(:id)"]
+
+
+def test_migrate_with_lock_migrated_while_waiting(mocker: MockerFixture, engine_mock: Mock, run_migrations_mock: Mock):
+    mocker.patch("regtech_user_fi_management.migrations.is_at_head", side_effect=[False, True])
+    assert not migrations.migrate_with_lock(engine_mock, "main", Mock())
+    run_migrations_mock.assert_not_called()
+    assert executed_sql(engine_mock.conn) == ["SELECT pg_advisory_lock(:id)", "SELECT pg_advisory_unlock(:id)"]
+
+
+def test_migrate_with_lock_unlocks_on_failure(mocker: MockerFixture, engine_mock: Mock, run_migrations_mock: Mock):
+    mocker.patch("regtech_user_fi_management.migrations.is_at_head", return_value=False)
+    run_migrations_mock.side_effect = RuntimeError("boom")
+    with pytest.raises(RuntimeError):
+        migrations.migrate_with_lock(engine_mock, "main", Mock())
+    assert executed_sql(engine_mock.conn)[-1] == "SELECT pg_advisory_unlock(:id)"
+
+
+def test_verify_at_head(mocker: MockerFixture):
+    mocker.patch("regtech_user_fi_management.migrations.head_revision", return_value="head")
+    current = mocker.patch("regtech_user_fi_management.migrations.current_revision", return_value="head")
+    migrations.verify_at_head(MagicMock(), "main", Mock())
+    current.return_value = "older"
+    with pytest.raises(RuntimeError, match="older"):
+        migrations.verify_at_head(MagicMock(), "main", Mock())
+
+
+def test_startup_migrations_off(mocker: MockerFixture):
+    locked = mocker.patch("regtech_user_fi_management.migrations.migrate_with_lock")
+    verify = mocker.patch("regtech_user_fi_management.migrations.verify_at_head")
+    migrations.startup_migrations("off", Mock(), "main")
+    locked.assert_not_called()
+    verify.assert_not_called()
+
+
+def test_head_revision_matches_scripts():
+    assert migrations.head_revision(migrations.alembic_config()) is not None
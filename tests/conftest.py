@@ -0,0 +1,26 @@
+from contextlib import contextmanager
+from typing import Callable, ContextManager, Iterator
+
+import pytest
+
+from regtech_user_fi_management.entities.engine.query_stats import QueryStats, track_queries
+
+QueryBudget = Callable[..., ContextManager[QueryStats]]
+
+
+@pytest.fixture
+def query_budget() -> QueryBudget:
+    """
+    Asserts the block runs at most `max_statements` statements on instrumented engines, and no statement
+    shape more than `max_repeats` times.
+    """
+
+    @contextmanager
+    def budget(max_statements: int, max_repeats: int = 1) -> Iterator[QueryStats]:
+        with track_queries() as stats:
+            yield stats
+        statements = "\n".join(stats.statements)
+        assert stats.count <= max_statements, f"{stats.count} statements over budget {max_statements}:\n{statements}"
+        assert not (repeated := stats.repeated(max_repeats + 1)), f"statements repeated: {repeated}"
+
+    return budget
@@ -1,41 +1,45 @@
 import pytest
 
-from sqlalchemy import create_engine, Engine
-from sqlalchemy.orm import scoped_session, sessionmaker
+from asyncio import current_task
+from sqlalchemy.ext.asyncio import AsyncEngine, async_scoped_session, async_sessionmaker, create_async_engine
+from regtech_user_fi_management.entities.engine.query_stats import instrument_engines, track_queries
 from regtech_user_fi_management.entities.models.dao import Base
 
 
-@pytest.fixture(scope="session")
+@pytest.fixture(scope="function")
 def engine():
-    return create_engine("sqlite://")
+    return create_async_engine("sqlite+aiosqlite://")
 
 
 @pytest.fixture(scope="function", autouse=True)
-def setup_db(
-    request: pytest.FixtureRequest,
-    engine: Engine,
-):
-
-    Base.metadata.create_all(bind=engine)
+async def setup_db(engine: AsyncEngine):
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    yield
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+    await engine.dispose()
 
-    def teardown():
-        Base.metadata.drop_all(bind=engine)
 
-    request.addfinalizer(teardown)
+@pytest.fixture(scope="function")
+async def transaction_session(session_generator: async_scoped_session):
+    async with session_generator() as session:
+        yield session
 
 
 @pytest.fixture(scope="function")
-def transaction_session(session_generator: scoped_session):
-    with session_generator() as session:
+async def query_session(session_generator: async_scoped_session):
+    async with session_generator() as session:
         yield session
 
 
 @pytest.fixture(scope="function")
-def query_session(session_generator: scoped_session):
-    with session_generator() as session:
-        yield session
+def session_generator(engine: AsyncEngine):
+    return async_scoped_session(async_sessionmaker(engine, expire_on_commit=False), current_task)
 
 
 @pytest.fixture(scope="function")
-def session_generator(engine: Engine):
-    return scoped_session(sessionmaker(engine, expire_on_commit=False))
+def query_counter():
+    instrument_engines()
+    with track_queries() as stats:
+        yield stats
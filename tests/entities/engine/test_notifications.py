@@ -0,0 +1,53 @@
+from unittest.mock import AsyncMock, Mock
+
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from regtech_user_fi_management.entities.engine.notifications import (
+    HISTORY_CHANNEL,
+    HistoryNotifier,
+    history_notification,
+)
+
+
+def test_history_notification():
+    assert "pg_notify" in str(history_notification("postgresql"))
+    assert history_notification("sqlite") is None
+
+
+async def test_subscribers_are_woken(engine: AsyncEngine):
+    notifier = HistoryNotifier(engine)
+    async with notifier.subscribe() as first, notifier.subscribe() as second:
+        notifier._notify(None, 1, HISTORY_CHANNEL, "")
+        assert first.is_set() and second.is_set()
+    assert notifier._subscribers == set()
+
+
+async def test_listens_once_on_postgres():
+    driver = Mock(is_closed=Mock(return_value=False), add_listener=AsyncMock())
+    connection = Mock(get_raw_connection=AsyncMock(return_value=Mock(driver_connection=driver)))
+    engine = Mock(connect=AsyncMock(return_value=connection))
+    engine.dialect.name = "postgresql"
+    notifier = HistoryNotifier(engine)
+
+    async with notifier.subscribe():
+        pass
+    async with notifier.subscribe():
+        pass
+    engine.connect.assert_awaited_once()
+    driver.add_listener.assert_awaited_once_with(HISTORY_CHANNEL, notifier._notify)
+
+    driver.is_closed.return_value = True
+    connection.invalidate, connection.close = AsyncMock(), AsyncMock()
+    async with notifier.subscribe():
+        pass
+    connection.invalidate.assert_awaited_once()
+    assert engine.connect.await_count == 2
+
+
+async def test_falls_back_to_polling_when_listen_fails():
+    engine = Mock(connect=AsyncMock(side_effect=OSError("connection refused")))
+    engine.dialect.name = "postgresql"
+    notifier = HistoryNotifier(engine)
+    async with notifier.subscribe() as changed:
+        assert not changed.is_set()
+    assert notifier._connection is None
@@ -0,0 +1,73 @@
+import pytest
+from prometheus_client import REGISTRY
+from sqlalchemy import text
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+
+from regtech_user_fi_management.entities.engine.pool import InstrumentedAsyncQueuePool, PoolMetrics, pool_metrics
+
+
+@pytest.fixture
+async def pooled_engine(tmp_path) -> AsyncEngine:
+    pool_metrics.reset()
+    engine = create_async_engine(
+        f"sqlite+aiosqlite:///{tmp_path}/pool.db",
+        poolclass=InstrumentedAsyncQueuePool,
+        pool_size=1,
+        max_overflow=0,
+        pool_timeout=0.1,
+    )
+    yield engine
+    await engine.dispose()
+
+
+def checkout_waits(pool: str = "primary") -> tuple:
+    labels = {"pool": pool}
+    return (
+        REGISTRY.get_sample_value("db_pool_checkout_wait_seconds_count", labels) or 0,
+        REGISTRY.get_sample_value("db_pool_checkout_wait_seconds_sum", labels) or 0,
+    )
+
+
+async def test_checkout_metrics(pooled_engine: AsyncEngine):
+    count_before, sum_before = checkout_waits()
+    async with pooled_engine.connect() as conn:
+        await conn.execute(text("SELECT 1"))
+        status = pool_metrics.snapshot(pooled_engine.pool)
+        assert status["pool_size"] == 1
+        assert status["checked_out"] == 1
+        assert status["checkouts"] == 1
+    status = pool_metrics.snapshot(pooled_engine.pool)
+    assert status["checked_out"] == 0
+    assert status["checked_in"] == 1
+    count, total = checkout_waits()
+    assert count == count_before + 1
+    assert total > sum_before
+
+
+async def test_checkout_timeout_metrics(pooled_engine: AsyncEngine):
+    count_before, sum_before = checkout_waits()
+    async with pooled_engine.connect():
+        with pytest.raises(PoolTimeoutError):
+            async with pooled_engine.connect():
+                pass
+    status = pool_metrics.snapshot(pooled_engine.pool)
+    assert status["checkouts"] == 1
+    assert status["checkout_timeouts"] == 1
+    count, total = checkout_waits()
+    assert count == count_before + 2
+    assert total - sum_before >= 0.1
+
+
+async def test_pool_records_to_its_own_metrics(tmp_path):
+    pool_metrics.reset()
+    replica_metrics = PoolMetrics("test_replica")
+    engine = create_async_engine(
+        f"sqlite+aiosqlite:///{tmp_path}/replica.db", poolclass=InstrumentedAsyncQueuePool.recording_to(replica_metrics)
+    )
+    async with engine.connect() as conn:
+        await conn.execute(text("SELECT 1"))
+    await engine.dispose()
+    assert replica_metrics.checkouts == 1
+    assert checkout_waits("test_replica")[0] == 1
+    assert pool_metrics.checkouts == 0
@@ -0,0 +1,36 @@
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from regtech_user_fi_management.entities.engine.query_stats import (
+    QueryStats,
+    instrument_engines,
+    statement_shape,
+    track_queries,
+)
+
+
+def test_statement_shape():
+    assert statement_shape("SELECT a FROM t WHERE id IN ($1, $2,\n $3)") == "SELECT a FROM t WHERE id IN (?)"
+    assert statement_shape("SELECT a FROM t WHERE id = %(id_1)s") == statement_shape("SELECT a FROM t WHERE id = ?")
+
+
+def test_repeated():
+    stats = QueryStats()
+    for i in range(3):
+        stats.record(f"SELECT a FROM t WHERE id IN ({', '.join('?' * (i + 1))})", 0.001)
+    stats.record("SELECT b FROM u", 0.001)
+    assert stats.repeated(3) == {"SELECT a FROM t WHERE id IN (?)": 3}
+    assert stats.repeated(4) == {}
+
+
+async def test_track_queries(engine: AsyncEngine):
+    instrument_engines()
+    async with engine.connect() as conn:
+        await conn.execute(text("SELECT 1"))
+        with track_queries() as outer:
+            await conn.execute(text("SELECT 2"))
+            with track_queries() as inner:
+                await conn.execute(text("SELECT 3"))
+    assert inner.statements == ["SELECT 3"]
+    assert outer.statements == ["SELECT 2", "SELECT 3"]
+    assert outer.duration >= inner.duration > 0
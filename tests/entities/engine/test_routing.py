@@ -0,0 +1,83 @@
+import pytest
+from pytest_mock import MockerFixture
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
+
+from regtech_user_fi_management.entities.engine import engine as engine_module
+from regtech_user_fi_management.entities.engine.routing import REPLICA_READS_KEY, RoutingSession
+from regtech_user_fi_management.entities.models.dao import Base, FederalRegulatorDao
+from regtech_user_fi_management.util.write_marker import WriteMarker
+
+
+@pytest.fixture
+async def replica_engine() -> AsyncEngine:
+    engine = create_async_engine("sqlite+aiosqlite://")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    yield engine
+    await engine.dispose()
+
+
+@pytest.fixture
+async def routing_sessionmaker(engine: AsyncEngine, replica_engine: AsyncEngine) -> async_sessionmaker:
+    async with replica_engine.begin() as conn:
+        await conn.execute(FederalRegulatorDao.__table__.insert().values(id="REP", name="Replica"))
+    return async_sessionmaker(
+        engine, expire_on_commit=False, sync_session_class=RoutingSession, replica=replica_engine.sync_engine
+    )
+
+
+async def regulator_ids(session) -> set:
+    return set((await session.scalars(select(FederalRegulatorDao.id))).all())
+
+
+async def test_reads_go_to_primary_by_default(routing_sessionmaker: async_sessionmaker):
+    async with routing_sessionmaker() as session:
+        assert await regulator_ids(session) == set()
+
+
+async def test_reads_go_to_replica_when_flagged(routing_sessionmaker: async_sessionmaker):
+    async with routing_sessionmaker(info={REPLICA_READS_KEY: True}) as session:
+        assert await regulator_ids(session) == {"REP"}
+        assert await regulator_ids(session) == {"REP"}
+
+
+async def test_locking_reads_go_to_primary(routing_sessionmaker: async_sessionmaker):
+    async with routing_sessionmaker(info={REPLICA_READS_KEY: True}) as session:
+        res = await session.scalars(select(FederalRegulatorDao.id).with_for_update())
+        assert res.all() == []
+        assert not session.info[REPLICA_READS_KEY]
+
+
+async def test_reads_after_write_stay_on_primary(routing_sessionmaker: async_sessionmaker):
+    async with routing_sessionmaker(info={REPLICA_READS_KEY: True}) as session:
+        session.add(FederalRegulatorDao(id="PRI", name="Primary"))
+        await session.flush()
+        assert not session.info[REPLICA_READS_KEY]
+        assert await regulator_ids(session) == {"PRI"}
+
+
+async def test_use_replica_sticks_to_primary_after_write(mocker: MockerFixture):
+    marker = WriteMarker(b"secret", ttl=5)
+    mocker.patch.object(engine_module, "write_marker", marker)
+    session = mocker.Mock(info={})
+    engine_module.use_replica(session, engine_module.issue_write_marker(written_at=0))
+    assert session.info[REPLICA_READS_KEY]
+
+    # issued by whichever process served the write, honoured by any that shares the secret
+    written = WriteMarker(b"secret", ttl=5).issue()
+    session = mocker.Mock(info={})
+    engine_module.use_replica(session, written)
+    assert REPLICA_READS_KEY not in session.info
+    # a client without a genuine marker may have just written
+    engine_module.use_replica(session)
+    engine_module.use_replica(session, WriteMarker(b"other", ttl=5).issue(written_at=0))
+    assert REPLICA_READS_KEY not in session.info
+
+
+def test_use_replica_without_replica_configured(mocker: MockerFixture):
+    mocker.patch.object(engine_module, "write_marker", None)
+    session = mocker.Mock(info={})
+    engine_module.use_replica(session)
+    assert REPLICA_READS_KEY not in session.info
+    assert engine_module.issue_write_marker() is None
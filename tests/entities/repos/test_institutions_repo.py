@@ -1,9 +1,14 @@
+from datetime import datetime, timezone
 import pytest
 from pytest_mock import MockerFixture
-from sqlalchemy.orm import Session
+from sqlalchemy import select, update
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.exc import InvalidRequestError
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from regtech_user_fi_management.entities.models.dto import (
     FinancialInstitutionDto,
+    FinancialInstitutionWithRelationsDto,
     FinancialInstitutionDomainCreate,
     SblTypeAssociationDto,
 )
@@ -18,17 +23,21 @@ from regtech_user_fi_management.entities.models.dao import (
     SblTypeMappingDao,
 )
 import regtech_user_fi_management.entities.repos.institutions_repo as repo
+from regtech_user_fi_management.entities.repos.repo_utils import get_history_tables
+from regtech_user_fi_management.entities.repos.denied_domains import invalidate_denied_domains
 from regtech_api_commons.models.auth import AuthenticatedUser
+from regtech_user_fi_management.entities.engine.query_stats import QueryStats
 
 
 class TestInstitutionsRepo:
     auth_user: AuthenticatedUser = AuthenticatedUser.from_claim({"id": "test_user_id"})
 
     @pytest.fixture(scope="function", autouse=True)
-    def setup(
+    async def setup(
         self,
-        transaction_session: Session,
+        transaction_session: AsyncSession,
     ):
+        invalidate_denied_domains()
         state_ga, state_ca, state_fl = (
             AddressStateDao(code="GA", name="Georgia"),
             AddressStateDao(code="CA", name="California"),
@@ -148,65 +157,196 @@ class TestInstitutionsRepo:
         transaction_session.add(fi_dao_123)
         transaction_session.add(fi_dao_456)
         transaction_session.add(fi_dao_sub_456)
-        transaction_session.commit()
+        await transaction_session.commit()
 
-    def test_get_sbl_types(self, query_session: Session):
+    async def test_get_sbl_types(self, query_session: AsyncSession):
         expected_ids = {"1", "2", "13"}
-        res = repo.get_sbl_types(query_session)
+        res = await repo.get_sbl_types(query_session)
         assert len(res) == 3
         assert set([r.id for r in res]) == expected_ids
 
-    def test_get_hmda_types(self, query_session: Session):
+    async def test_get_hmda_types(self, query_session: AsyncSession):
         expected_ids = {"HIT1", "HIT2", "HIT3"}
-        res = repo.get_hmda_types(query_session)
+        res = await repo.get_hmda_types(query_session)
         assert len(res) == 3
         assert set([r.id for r in res]) == expected_ids
 
-    def test_get_address_states(self, query_session: Session):
+    async def test_get_address_states(self, query_session: AsyncSession):
         expected_codes = {"CA", "GA", "FL"}
-        res = repo.get_address_states(query_session)
+        res = await repo.get_address_states(query_session)
         assert len(res) == 3
         assert set([r.code for r in res]) == expected_codes
 
-    def test_get_federal_regulators(self, query_session: Session):
+    async def test_get_federal_regulators(self, query_session: AsyncSession):
         expected_ids = {"FRI1", "FRI2", "FRI3"}
-        res = repo.get_federal_regulators(query_session)
+        res = await repo.get_federal_regulators(query_session)
         assert len(res) == 3
         assert set([r.id for r in res]) == expected_ids
 
-    def test_get_institutions(self, query_session: Session):
-        res = repo.get_institutions(query_session)
+    async def test_get_institutions(self, query_session: AsyncSession):
+        res = await repo.get_institutions(query_session)
         assert len(res) == 3
 
-    def test_get_institutions_by_domain(self, query_session: Session):
+    async def test_get_institutions_query_count(self, query_session: AsyncSession, query_counter: QueryStats):
+        query_counter.reset()
+        res = await repo.get_institutions(query_session)
+        # institutions with their lookups joined, then domains, then sbl types joined to their type
+        assert query_counter.count == 3
+        dtos = [FinancialInstitutionWithRelationsDto.model_validate(fi) for fi in res]
+        assert dtos[0].hq_address_state.name == "Georgia"
+        assert dtos[0].sbl_institution_types[0].sbl_type.name == "Test SBL Instituion ID 1"
+        assert query_counter.count == 3
+
+    async def test_get_institution_profiles(self, session_generator, query_counter: QueryStats):
+        for profile, expected_count in [("full", 3), ("sbl_types", 2), ("none", 1)]:
+            async with session_generator() as session:
+                query_counter.reset()
+                fi = await repo.get_institution(session, "TESTBANK123000000000", profile)
+                assert query_counter.count == expected_count
+                assert fi.name == "Test Bank 123"
+                if profile == "none":
+                    with pytest.raises(InvalidRequestError):
+                        fi.sbl_institution_types
+                else:
+                    assert fi.sbl_institution_types[0].sbl_type.id == "1"
+                if profile == "full":
+                    assert fi.domains[0].domain == "test.bank.1"
+                    assert fi.hq_address_state.code == "GA"
+                else:
+                    with pytest.raises(InvalidRequestError):
+                        fi.domains
+                    with pytest.raises(InvalidRequestError):
+                        fi.hq_address_state
+
+    async def test_get_institutions_paged(self, query_session: AsyncSession):
+        res = await repo.get_institutions(query_session, count=2)
+        assert [fi.lei for fi in res] == ["TESTBANK123000000000", "TESTBANK456000000000"]
+        res = await repo.get_institutions(query_session, page=1, count=2)
+        assert [fi.lei for fi in res] == ["TESTSUBBANK456000000"]
+
+    async def test_get_associated_institutions(self, query_session: AsyncSession):
+        res = await repo.get_associated_institutions(
+            query_session, ["TESTBANK456000000000", "TESTBANK123000000000", "NONEXISTINGBANK00000"], "test.bank.1"
+        )
+        assert [(fi.lei, fi.approved) for fi in res] == [
+            ("TESTBANK123000000000", True),
+            ("TESTBANK456000000000", False),
+        ]
+        assert res[0].domains[0].domain == "test.bank.1"
+        assert await repo.get_associated_institutions(query_session, [], "test.bank.1") == []
+
+    async def test_stream_institutions(self, query_session: AsyncSession):
+        chunks = [chunk async for chunk in repo.stream_institutions(query_session, chunk_size=2)]
+        assert [[fi.lei for fi in chunk] for chunk in chunks] == [
+            ["TESTBANK123000000000", "TESTBANK456000000000"],
+            ["TESTSUBBANK456000000"],
+        ]
+        assert chunks[0][0].domains[0].domain == "test.bank.1"
+        assert chunks[0][0] not in query_session
+
+    async def test_search_institutions(self, query_session: AsyncSession):
+        res = await repo.search_institutions(query_session, "bank 456")
+        assert [fi.lei for fi in res] == ["TESTBANK456000000000", "TESTSUBBANK456000000"]
+        assert res[0].domains[0].domain == "test.bank.2"
+        res = await repo.search_institutions(query_session, "top holder lei", limit=2)
+        assert [fi.lei for fi in res] == ["TESTBANK123000000000", "TESTBANK456000000000"]
+        assert await repo.search_institutions(query_session, "100%") == []
+
+    def family_member(self, lei: str, parent_lei: str | None) -> FinancialInstitutionDao:
+        return FinancialInstitutionDao(
+            name=f"Family {lei}",
+            lei=lei,
+            lei_status_code="ISSUED",
+            parent_lei=parent_lei,
+            hq_address_street_1="Test Address Street 1",
+            hq_address_city="Test City 1",
+            hq_address_zip="00000",
+            modified_by="test_user_id",
+        )
+
+    async def test_get_institution_family(self, transaction_session: AsyncSession, query_session: AsyncSession):
+        transaction_session.add_all(
+            [
+                self.family_member("FAMILYTOP00000000000", None),
+                self.family_member("FAMILYMID00000000000", "FAMILYTOP00000000000"),
+                self.family_member("FAMILYSUB10000000000", "FAMILYMID00000000000"),
+                self.family_member("FAMILYSUB20000000000", "FAMILYMID00000000000"),
+                self.family_member("FAMILYLEAF0000000000", "FAMILYSUB10000000000"),
+            ]
+        )
+        await transaction_session.commit()
+
+        res = await repo.get_institution_family(query_session, "FAMILYMID00000000000")
+        assert [(m.lei, m.depth) for m in res.ancestors] == [("FAMILYTOP00000000000", -1)]
+        assert [(m.lei, m.depth) for m in res.descendants] == [
+            ("FAMILYSUB10000000000", 1),
+            ("FAMILYSUB20000000000", 1),
+            ("FAMILYLEAF0000000000", 2),
+        ]
+        assert not res.truncated
+
+        res = await repo.get_institution_family(query_session, "FAMILYLEAF0000000000", max_depth=1)
+        assert [m.lei for m in res.ancestors] == ["FAMILYSUB10000000000"]
+        assert res.descendants == []
+        assert res.truncated
+
+        assert await repo.get_institution_family(query_session, "NONEXISTINGBANK00000") is None
+
+    async def test_get_institution_family_cycle(self, transaction_session: AsyncSession, query_session: AsyncSession):
+        transaction_session.add_all(
+            [
+                self.family_member("CYCLEA00000000000000", "CYCLEB00000000000000"),
+                self.family_member("CYCLEB00000000000000", "CYCLEA00000000000000"),
+            ]
+        )
+        await transaction_session.commit()
+
+        res = await repo.get_institution_family(query_session, "CYCLEA00000000000000")
+        assert [(m.lei, m.depth) for m in res.ancestors] == [("CYCLEB00000000000000", -1)]
+        assert [(m.lei, m.depth) for m in res.descendants] == [("CYCLEB00000000000000", 1)]
+        assert not res.truncated
+
+    async def test_get_institutions_keyset(self, query_session: AsyncSession):
+        res = await repo.get_institutions(query_session, count=2, after_lei="")
+        assert [fi.lei for fi in res] == ["TESTBANK123000000000", "TESTBANK456000000000"]
+        res = await repo.get_institutions(query_session, page=5, count=2, after_lei=res[-1].lei)
+        assert [fi.lei for fi in res] == ["TESTSUBBANK456000000"]
+
+    async def test_get_institutions_by_domain(self, query_session: AsyncSession):
         # verify 'generic' domain queries don't work
-        res = repo.get_institutions(query_session, domain="bank")
+        res = await repo.get_institutions(query_session, domain="bank")
         assert len(res) == 0
 
-        res = repo.get_institutions(query_session, domain="test.bank.1")
+        res = await repo.get_institutions(query_session, domain="test.bank.1")
         assert len(res) == 1
 
         # shouldn't find sub.test.bank.2
-        res = repo.get_institutions(query_session, domain="test.bank.2")
+        res = await repo.get_institutions(query_session, domain="test.bank.2")
         assert len(res) == 1
 
-        res = repo.get_institutions(query_session, domain="sub.test.bank.2")
+        res = await repo.get_institutions(query_session, domain="sub.test.bank.2")
         assert len(res) == 1
 
-    def test_get_institutions_by_domain_not_existing(self, query_session: Session):
-        res = repo.get_institutions(query_session, domain="testing.bank")
+    async def test_get_institutions_by_domain_not_existing(self, query_session: AsyncSession):
+        res = await repo.get_institutions(query_session, domain="testing.bank")
         assert len(res) == 0
 
-    def test_get_institutions_by_lei_list(self, query_session: Session):
-        res = repo.get_institutions(query_session, leis=["TESTBANK123000000000", "TESTBANK456000000000"])
+    async def test_get_institutions_by_lei_list(self, query_session: AsyncSession):
+        res = await repo.get_institutions(query_session, leis=["TESTBANK123000000000", "TESTBANK456000000000"])
         assert len(res) == 2
 
-    def test_get_institutions_by_lei_list_item_not_existing(self, query_session: Session):
-        res = repo.get_institutions(query_session, leis=["0123NOTTESTBANK01234"])
+    async def test_get_institutions_by_lei_list_item_not_existing(self, query_session: AsyncSession):
+        res = await repo.get_institutions(query_session, leis=["0123NOTTESTBANK01234"])
         assert len(res) == 0
 
-    def test_empty_state(self, transaction_session: Session):
-        db_fi = repo.upsert_institution(
+    async def test_get_institution_version(self, query_session: AsyncSession):
+        res = await repo.get_institution_version(query_session, "TESTBANK123000000000")
+        assert res.version == 0
+        assert res.domain_count == 1
+        assert await repo.get_institution_version(query_session, "0123NOTTESTBANK01234") is None
+
+    async def test_empty_state(self, transaction_session: AsyncSession):
+        db_fi = await repo.upsert_institution(
             transaction_session,
             FinancialInstitutionDto(
                 name="New Bank 123",
@@ -235,14 +375,14 @@ class TestInstitutionsRepo:
             self.auth_user,
         )
         assert db_fi.domains == []
-        res = repo.get_institutions(transaction_session)
+        res = await repo.get_institutions(transaction_session)
         assert len(res) == 4
         new_sbl_types = next(iter([fi for fi in res if fi.lei == "NEWBANK1230000000000"])).sbl_institution_types
         assert len(new_sbl_types) == 1
         assert next(iter(new_sbl_types)).sbl_type.name == "Test SBL Instituion ID 1"
 
-    def test_add_institution(self, transaction_session: Session):
-        db_fi = repo.upsert_institution(
+    async def test_add_institution(self, transaction_session: AsyncSession):
+        db_fi = await repo.upsert_institution(
             transaction_session,
             FinancialInstitutionDto(
                 name="New Bank 123",
@@ -271,14 +411,16 @@ class TestInstitutionsRepo:
             self.auth_user,
         )
         assert db_fi.domains == []
-        res = repo.get_institutions(transaction_session)
+        res = await repo.get_institutions(transaction_session)
         assert len(res) == 4
         new_sbl_types = next(iter([fi for fi in res if fi.lei == "NEWBANK1230000000000"])).sbl_institution_types
         assert len(new_sbl_types) == 1
         assert next(iter(new_sbl_types)).sbl_type.name == "Test SBL Instituion ID 1"
 
-    def test_add_institution_only_required_fields(self, transaction_session: Session, query_session: Session):
-        repo.upsert_institution(
+    async def test_add_institution_only_required_fields(
+        self, transaction_session: AsyncSession, query_session: AsyncSession
+    ):
+        await repo.upsert_institution(
             transaction_session,
             FinancialInstitutionDto(
                 name="Minimal Bank 123",
@@ -291,13 +433,15 @@ class TestInstitutionsRepo:
             ),
             self.auth_user,
         )
-        res = repo.get_institution(query_session, "MINBANK1230000000000")
+        res = await repo.get_institution(query_session, "MINBANK1230000000000")
         assert res is not None
         assert res.tax_id is None
 
-    def test_add_institution_missing_required_fields(self, transaction_session: Session, query_session: Session):
+    async def test_add_institution_missing_required_fields(
+        self, transaction_session: AsyncSession, query_session: AsyncSession
+    ):
         with pytest.raises(Exception) as e:
-            repo.upsert_institution(
+            await repo.upsert_institution(
                 transaction_session,
                 FinancialInstitutionDto(
                     name="Minimal Bank 123",
@@ -306,11 +450,11 @@ class TestInstitutionsRepo:
                 self.auth_user,
             )
         assert "field required" in str(e.value).lower()
-        res = repo.get_institution(query_session, "MINBANK1230000000000")
+        res = await repo.get_institution(query_session, "MINBANK1230000000000")
         assert res is None
 
-    def test_update_institution(self, transaction_session: Session):
-        repo.upsert_institution(
+    async def test_update_institution(self, transaction_session: AsyncSession):
+        await repo.upsert_institution(
             transaction_session,
             FinancialInstitutionDto(
                 name="Test Bank 234",
@@ -323,65 +467,81 @@ class TestInstitutionsRepo:
             ),
             self.auth_user,
         )
-        res = repo.get_institutions(transaction_session)
+        res = await repo.get_institutions(transaction_session)
         assert len(res) == 3
         assert res[0].name == "Test Bank 234"
 
-    def test_add_domains(self, transaction_session: Session, query_session: Session):
-        repo.add_domains(
+    async def test_add_domains(self, transaction_session: AsyncSession, query_session: AsyncSession):
+        await repo.add_domains(
             transaction_session,
             "TESTBANK123000000000",
             [FinancialInstitutionDomainCreate(domain="bank.test")],
         )
         transaction_session.expunge_all()
-        fi = repo.get_institution(query_session, "TESTBANK123000000000")
+        fi = await repo.get_institution(query_session, "TESTBANK123000000000")
         assert len(fi.domains) == 2
 
-    def test_domain_allowed(self, transaction_session: Session):
+    async def test_domain_allowed(self, transaction_session: AsyncSession):
         denied_domain = DeniedDomainDao(domain="yahoo.com")
         transaction_session.add(denied_domain)
-        transaction_session.commit()
-        assert repo.is_domain_allowed(transaction_session, "yahoo.com") is False
-        assert repo.is_domain_allowed(transaction_session, "gmail.com") is True
-        assert repo.is_domain_allowed(transaction_session, "") is False
-
-    def test_institution_mapped_to_state_valid(self, query_session: Session):
-        res = repo.get_institutions(query_session, leis=["TESTBANK123000000000"])
+        await transaction_session.commit()
+        assert await repo.is_domain_allowed(transaction_session, "yahoo.com") is False
+        assert await repo.is_domain_allowed(transaction_session, "mail.yahoo.com") is False
+        assert await repo.is_domain_allowed(transaction_session, "notyahoo.com") is True
+        assert await repo.is_domain_allowed(transaction_session, "gmail.com") is True
+        assert await repo.is_domain_allowed(transaction_session, "") is False
+
+    async def test_denied_domains_held_in_memory(self, mocker: MockerFixture, transaction_session: AsyncSession):
+        transaction_session.add(DeniedDomainDao(domain="yahoo.com"))
+        await transaction_session.commit()
+        scalars_spy = mocker.spy(transaction_session, "scalars")
+        assert await repo.is_domain_allowed(transaction_session, "yahoo.com") is False
+        assert await repo.is_domain_allowed(transaction_session, "gmail.com") is True
+        scalars_spy.assert_called_once()
+
+        transaction_session.add(DeniedDomainDao(domain="gmail.com"))
+        await transaction_session.commit()
+        assert await repo.is_domain_allowed(transaction_session, "gmail.com") is True
+        invalidate_denied_domains()
+        assert await repo.is_domain_allowed(transaction_session, "gmail.com") is False
+
+    async def test_institution_mapped_to_state_valid(self, query_session: AsyncSession):
+        res = await repo.get_institutions(query_session, leis=["TESTBANK123000000000"])
         assert res[0].hq_address_state.name == "Georgia"
 
-    def test_institution_mapped_to_state_invalid(self, query_session: Session):
-        res = repo.get_institutions(query_session, leis=["TESTBANK456000000000"])
+    async def test_institution_mapped_to_state_invalid(self, query_session: AsyncSession):
+        res = await repo.get_institutions(query_session, leis=["TESTBANK456000000000"])
         assert res[0].hq_address_state.name != "Georgia"
 
-    def test_institution_mapped_to_federal_regulator_valid(self, query_session: Session):
-        res = repo.get_institutions(query_session, leis=["TESTBANK456000000000"])
+    async def test_institution_mapped_to_federal_regulator_valid(self, query_session: AsyncSession):
+        res = await repo.get_institutions(query_session, leis=["TESTBANK456000000000"])
         assert res[0].primary_federal_regulator.name != "Test Federal Regulator ID 1"
 
-    def test_institution_mapped_to_federal_regulator_invalid(self, query_session: Session):
-        res = repo.get_institutions(query_session, leis=["TESTBANK123000000000"])
+    async def test_institution_mapped_to_federal_regulator_invalid(self, query_session: AsyncSession):
+        res = await repo.get_institutions(query_session, leis=["TESTBANK123000000000"])
         assert res[0].primary_federal_regulator.name == "Test Federal Regulator ID 1"
 
-    def test_institution_mapped_to_hmda_it_valid(self, query_session: Session):
-        res = repo.get_institutions(query_session, leis=["TESTBANK123000000000"])
+    async def test_institution_mapped_to_hmda_it_valid(self, query_session: AsyncSession):
+        res = await repo.get_institutions(query_session, leis=["TESTBANK123000000000"])
         assert res[0].hmda_institution_type.name == "Test HMDA Instituion ID 1"
 
-    def test_institution_mapped_to_hmda_it_invalid(self, query_session: Session):
-        res = repo.get_institutions(query_session, leis=["TESTBANK456000000000"])
+    async def test_institution_mapped_to_hmda_it_invalid(self, query_session: AsyncSession):
+        res = await repo.get_institutions(query_session, leis=["TESTBANK456000000000"])
         assert res[0].hmda_institution_type.name != "Test HMDA Instituion ID 1"
 
-    def test_institution_mapped_to_sbl_it_valid(self, query_session: Session):
-        res = repo.get_institutions(query_session, leis=["TESTBANK123000000000"])
+    async def test_institution_mapped_to_sbl_it_valid(self, query_session: AsyncSession):
+        res = await repo.get_institutions(query_session, leis=["TESTBANK123000000000"])
         assert res[0].sbl_institution_types[0].sbl_type.name == "Test SBL Instituion ID 1"
 
-    def test_institution_mapped_to_sbl_it_invalid(self, query_session: Session):
-        res = repo.get_institutions(query_session, leis=["TESTBANK456000000000"])
+    async def test_institution_mapped_to_sbl_it_invalid(self, query_session: AsyncSession):
+        res = await repo.get_institutions(query_session, leis=["TESTBANK456000000000"])
         assert res[0].sbl_institution_types[0].sbl_type.name != "Test SBL Instituion ID 1"
 
-    def test_update_sbl_institution_types(
-        self, mocker: MockerFixture, query_session: Session, transaction_session: Session
+    async def test_update_sbl_institution_types(
+        self, mocker: MockerFixture, query_session: AsyncSession, transaction_session: AsyncSession
     ):
         test_lei = "TESTBANK123000000000"
-        existing_inst = repo.get_institution(query_session, test_lei)
+        existing_inst = await repo.get_institution(query_session, test_lei)
         query_session.expunge(existing_inst)
         sbl_types = [
             SblTypeAssociationDto(id="1"),
@@ -389,14 +549,16 @@ class TestInstitutionsRepo:
             SblTypeAssociationDto(id="13", details="test"),
         ]
         commit_spy = mocker.patch.object(transaction_session, "commit", wraps=transaction_session.commit)
-        updated_inst = repo.update_sbl_types(transaction_session, self.auth_user, test_lei, sbl_types)
+        updated_inst = await repo.update_sbl_types(transaction_session, self.auth_user, test_lei, sbl_types)
         commit_spy.assert_called_once()
         assert len(existing_inst.sbl_institution_types) == 1
         assert len(updated_inst.sbl_institution_types) == 3
         diffs = set(updated_inst.sbl_institution_types).difference(set(existing_inst.sbl_institution_types))
         assert len(diffs) == 2
 
-    def test_update_sbl_institution_types_inst_non_exist(self, mocker: MockerFixture, transaction_session: Session):
+    async def test_update_sbl_institution_types_inst_non_exist(
+        self, mocker: MockerFixture, transaction_session: AsyncSession
+    ):
         test_lei = "NONEXISTINGBANK00000"
         sbl_types = [
             SblTypeAssociationDto(id="1"),
@@ -404,6 +566,162 @@ class TestInstitutionsRepo:
             SblTypeAssociationDto(id="13", details="test"),
         ]
         commit_spy = mocker.patch.object(transaction_session, "commit", wraps=transaction_session.commit)
-        res = repo.update_sbl_types(transaction_session, self.auth_user, test_lei, sbl_types)
+        res = await repo.update_sbl_types(transaction_session, self.auth_user, test_lei, sbl_types)
         commit_spy.assert_not_called()
         assert res is None
+
+    @pytest.fixture
+    def history_tables(self):
+        return get_history_tables()
+
+    def bulk_fi(self, lei: str, name: str, sbl_types: list) -> FinancialInstitutionDto:
+        return FinancialInstitutionDto(
+            name=name,
+            lei=lei,
+            lei_status_code="ISSUED",
+            sbl_institution_types=sbl_types,
+            hq_address_street_1="Test Address Street 3",
+            hq_address_city="Test City 3",
+            hq_address_state_code="FL",
+            hq_address_zip="22222",
+        )
+
+    async def test_bulk_upsert_institutions(
+        self, transaction_session: AsyncSession, query_session: AsyncSession, history_tables
+    ):
+        fi_history, mapping_history = history_tables
+        fis = [
+            self.bulk_fi("BULKBANK100000000000", "Bulk Bank 1", [SblTypeAssociationDto(id="1")]),
+            self.bulk_fi("BULKBANK200000000000", "Bulk Bank 2", ["2"]),
+            self.bulk_fi("TESTBANK123000000000", "Test Bank 123 Renamed", []),
+        ]
+        res = await repo.bulk_upsert_institutions(transaction_session, fis, self.auth_user, chunk_size=2)
+        assert res.created == ["BULKBANK100000000000", "BULKBANK200000000000"]
+        assert res.updated == ["TESTBANK123000000000"]
+        assert res.unchanged == []
+
+        fis[1] = self.bulk_fi("BULKBANK200000000000", "Bulk Bank 2", ["2", SblTypeAssociationDto(id="13", details="x")])
+        res = await repo.bulk_upsert_institutions(transaction_session, fis, self.auth_user)
+        assert res.updated == ["BULKBANK200000000000"]
+        assert res.unchanged == ["BULKBANK100000000000", "TESTBANK123000000000"]
+
+        fi = await repo.get_institution(query_session, "BULKBANK200000000000")
+        assert fi.version == 2
+        assert {(t.type_id, t.details, t.version) for t in fi.sbl_institution_types} == {("2", None, 2), ("13", "x", 2)}
+        renamed = await repo.get_institution(query_session, "TESTBANK123000000000")
+        assert renamed.name == "Test Bank 123 Renamed"
+        assert renamed.version == 1
+        assert renamed.sbl_institution_types == []
+
+        history = (await query_session.execute(select(fi_history).order_by("lei", "version"))).mappings().all()
+        assert [(h["lei"], h["version"]) for h in history] == [
+            ("BULKBANK100000000000", 1),
+            ("BULKBANK200000000000", 1),
+            ("BULKBANK200000000000", 2),
+            ("TESTBANK123000000000", 1),
+        ]
+        assert history[2]["changeset"] == {
+            "sbl_institution_types": {
+                "new": [
+                    {
+                        "fi_id": "BULKBANK200000000000",
+                        "type_id": "13",
+                        "details": "x",
+                        "modified_by": "test_user_id",
+                        "version": 2,
+                    }
+                ],
+                "field_changes": [],
+            }
+        }
+        assert history[3]["changeset"]["name"] == {"old": ["Test Bank 123"], "new": ["Test Bank 123 Renamed"]}
+        mapping = (await query_session.execute(select(mapping_history))).all()
+        assert len(mapping) == 4
+
+    async def test_get_institution_history(self, transaction_session: AsyncSession, query_session: AsyncSession):
+        lei = "BULKBANK100000000000"
+        for name in ["Bulk Bank 1", "Bulk Bank 1 Renamed", "Bulk Bank 1 Renamed Again"]:
+            await repo.bulk_upsert_institutions(transaction_session, [self.bulk_fi(lei, name, ["1"])], self.auth_user)
+
+        history = await repo.get_institution_history(query_session, lei, count=2)
+        assert [h.version for h in history] == [3, 2]
+        assert history[0].changeset["name"] == {"old": ["Bulk Bank 1 Renamed"], "new": ["Bulk Bank 1 Renamed Again"]}
+        history = await repo.get_institution_history(query_session, lei, count=2, before_version=2)
+        assert [h.version for h in history] == [1]
+        assert await repo.get_institution_history(query_session, "NONEXISTINGBANK00000") == []
+
+    async def test_get_institution_as_of(
+        self, transaction_session: AsyncSession, query_session: AsyncSession, history_tables
+    ):
+        fi_history, mapping_history = history_tables
+        lei = "BULKBANK100000000000"
+        await repo.bulk_upsert_institutions(
+            transaction_session, [self.bulk_fi(lei, "Bulk Bank 1", ["1"])], self.auth_user
+        )
+        await repo.bulk_upsert_institutions(
+            transaction_session,
+            [self.bulk_fi(lei, "Bulk Bank 1 Renamed", ["2", SblTypeAssociationDto(id="13", details="x")])],
+            self.auth_user,
+        )
+        # both versions are written within the same second, spread them out to look them up by time
+        for version, event_time in [(1, datetime(2024, 1, 1)), (2, datetime(2024, 6, 1))]:
+            for table, key in [(fi_history, fi_history.c.lei), (mapping_history, mapping_history.c.fi_id)]:
+                await transaction_session.execute(
+                    update(table).where(key == lei, table.c.version == version).values(event_time=event_time)
+                )
+        await transaction_session.commit()
+
+        first = await repo.get_institution_as_of(query_session, lei, 1)
+        assert first.name == "Bulk Bank 1"
+        assert first.version == 1
+        assert first.lei_status is None
+        assert first.hq_address_state.name == "Florida"
+        assert [(t.sbl_type.id, t.details) for t in first.sbl_institution_types] == [("1", None)]
+        assert first.domains == []
+
+        second = await repo.get_institution_as_of(query_session, lei, datetime(2024, 7, 1, tzinfo=timezone.utc))
+        assert second.name == "Bulk Bank 1 Renamed"
+        assert [(t.sbl_type.id, t.details) for t in second.sbl_institution_types] == [("13", "x"), ("2", None)]
+        assert (await repo.get_institution_as_of(query_session, lei, datetime(2024, 3, 1))).version == 1
+
+        assert await repo.get_institution_as_of(query_session, lei, datetime(2023, 1, 1)) is None
+        assert await repo.get_institution_as_of(query_session, lei, 3) is None
+
+    async def test_get_institution_changes(
+        self, transaction_session: AsyncSession, query_session: AsyncSession, history_tables
+    ):
+        fi_history, _ = history_tables
+        fis = [
+            self.bulk_fi("BULKBANK100000000000", "Bulk Bank 1", []),
+            self.bulk_fi("BULKBANK200000000000", "Bulk Bank 2", []),
+        ]
+        await repo.bulk_upsert_institutions(transaction_session, fis, self.auth_user)
+        fis[0] = self.bulk_fi("BULKBANK100000000000", "Bulk Bank 1 Renamed", [])
+        await repo.bulk_upsert_institutions(transaction_session, fis, self.auth_user)
+        for lei, version, event_time in [
+            ("BULKBANK100000000000", 1, datetime(2024, 1, 1)),
+            ("BULKBANK200000000000", 1, datetime(2024, 1, 1)),
+            ("BULKBANK100000000000", 2, datetime.now(timezone.utc).replace(tzinfo=None)),
+        ]:
+            await transaction_session.execute(
+                update(fi_history)
+                .where(fi_history.c.lei == lei, fi_history.c.version == version)
+                .values(event_time=event_time)
+            )
+        await transaction_session.commit()
+
+        changes = await repo.get_institution_changes(query_session, count=2)
+        assert [(c.lei, c.version) for c in changes] == [("BULKBANK100000000000", 1), ("BULKBANK200000000000", 1)]
+        last = changes[-1]
+        changes = await repo.get_institution_changes(query_session, (last.event_time, last.lei, last.version))
+        assert [(c.lei, c.version) for c in changes] == [("BULKBANK100000000000", 2)]
+        assert changes[0].changeset["name"] == {"old": ["Bulk Bank 1"], "new": ["Bulk Bank 1 Renamed"]}
+
+        changes = await repo.get_institution_changes(query_session, settle_seconds=60)
+        assert [(c.lei, c.version) for c in changes] == [("BULKBANK100000000000", 1), ("BULKBANK200000000000", 1)]
+
+    def test_change_feed_cutoff(self):
+        cutoff = str(repo.change_feed_cutoff("postgresql", 5).compile(dialect=postgresql.dialect()))
+        assert "min(pg_stat_activity.xact_start)" in cutoff
+        assert "-5 seconds" in str(repo.change_feed_cutoff("sqlite", 5).compile(compile_kwargs={"literal_binds": True}))
+        assert repo.change_feed_cutoff("sqlite", 0) is None
@@ -0,0 +1,52 @@
+import pytest
+from pytest_mock import MockerFixture
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from regtech_user_fi_management.entities.models.dao import AddressStateDao, SBLInstitutionTypeDao
+from regtech_user_fi_management.entities.models.dto import AddressStateDto, InstitutionTypeDto
+import regtech_user_fi_management.entities.repos.institutions_repo as repo
+from regtech_user_fi_management.entities.repos.reference_cache import (
+    get_reference_data,
+    invalidate_reference_cache,
+    reference_cache,
+    warm_up_reference_cache,
+)
+
+
+class TestReferenceCache:
+    @pytest.fixture(scope="function", autouse=True)
+    async def setup(self, transaction_session: AsyncSession):
+        invalidate_reference_cache()
+        transaction_session.add_all(
+            [
+                AddressStateDao(code="GA", name="Georgia"),
+                SBLInstitutionTypeDao(id="1", name="Test SBL Instituion ID 1"),
+                SBLInstitutionTypeDao(id="2", name="Test SBL Instituion ID 2"),
+            ]
+        )
+        await transaction_session.commit()
+        yield
+        invalidate_reference_cache()
+
+    async def test_cached_after_first_load(self, mocker: MockerFixture, query_session: AsyncSession):
+        get_sbl_types_spy = mocker.spy(repo, "get_sbl_types")
+        res = await get_reference_data(query_session, "sbl_types")
+        assert {r.id for r in res} == {"1", "2"}
+        assert all(isinstance(r, InstitutionTypeDto) for r in res)
+        assert await get_reference_data(query_session, "sbl_types") is res
+        get_sbl_types_spy.assert_called_once()
+
+    async def test_invalidate(self, mocker: MockerFixture, query_session: AsyncSession):
+        get_address_states_spy = mocker.spy(repo, "get_address_states")
+        await get_reference_data(query_session, "address_states")
+        invalidate_reference_cache("address_states")
+        res = await get_reference_data(query_session, "address_states")
+        assert res == [AddressStateDto(code="GA", name="Georgia")]
+        assert get_address_states_spy.call_count == 2
+
+    async def test_warm_up(self, mocker: MockerFixture, query_session: AsyncSession):
+        await warm_up_reference_cache(query_session)
+        assert len(reference_cache) == 4
+        get_hmda_types_spy = mocker.spy(repo, "get_hmda_types")
+        assert await get_reference_data(query_session, "hmda_types") == []
+        get_hmda_types_spy.assert_not_called()
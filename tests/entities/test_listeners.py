@@ -1,11 +1,9 @@
 from copy import deepcopy
 import pytest
-from unittest.mock import Mock, call
-from pytest_mock import MockerFixture
+from unittest.mock import Mock
 
-from sqlalchemy import Connection, Insert, Table
-from sqlalchemy.orm import Mapper, InstanceState, AttributeState
-from sqlalchemy.orm.attributes import History
+from sqlalchemy import Column, Connection, Insert, MetaData, String, Table, create_engine
+from sqlalchemy.orm import Session, make_transient_to_detached
 
 from regtech_user_fi_management.entities.models.dao import (
     FinancialInstitutionDao,
@@ -13,13 +11,13 @@ from regtech_user_fi_management.entities.models.dao import (
     SblTypeMappingDao,
 )
 
-from regtech_user_fi_management.entities.listeners import _setup_fi_history
+from regtech_user_fi_management.entities.listeners import _setup_fi_history, check_history_tables, inspect_fi
 
 
 class TestListeners:
     fi_history: Table = Mock(Table)
     mapping_history: Table = Mock(Table)
-    mapper: Mapper = Mock(Mapper)
+    session: Session = Mock(Session)
     connection: Connection = Mock(Connection)
     target: FinancialInstitutionDao = FinancialInstitutionDao(
         name="Test Bank 123",
@@ -49,85 +47,120 @@ class TestListeners:
     @pytest.fixture(autouse=True)
     def setup(self):
         self.fi_history.reset_mock()
-        self.fi_history.columns = {"name": "test"}
+        self.fi_history.columns = {"name": "test", "event_time": "test"}
         self.mapping_history.reset_mock()
-        self.mapper.reset_mock()
+        self.session.reset_mock()
+        self.session.info = {}
+        self.session.new = []
+        self.session.dirty = []
+        self.session.connection.return_value = self.connection
+        self.session.get_bind.return_value.dialect.name = "sqlite"
         self.connection.reset_mock()
 
-    def test_fi_history_listener(self, mocker: MockerFixture):
-        inspect_mock = mocker.patch("regtech_user_fi_management.entities.listeners.inspect")
-        attr_mock1: AttributeState = Mock(AttributeState)
-        attr_mock1.key = "name"
-        attr_mock2: AttributeState = Mock(AttributeState)
-        attr_mock2.key = "event_time"
-        state_mock: InstanceState = Mock(InstanceState)
-        state_mock.attrs = [attr_mock1, attr_mock2]
-        inspect_mock.return_value = state_mock
-        fi_listener = _setup_fi_history(self.fi_history, self.mapping_history)
-        fi_listener(self.mapper, self.connection, self.target)
-        inspect_mock.assert_called_once_with(self.target)
+    def flush(self, new=[], dirty=[]):
+        collect_history, insert_history = _setup_fi_history(self.fi_history, self.mapping_history)
+        self.session.new = new
+        self.session.dirty = dirty
+        collect_history(self.session, None, None)
+        insert_history(self.session, None)
+
+    def persistent_fi(self) -> FinancialInstitutionDao:
+        mapping = SblTypeMappingDao(
+            lei="TESTBANK123000000000", type_id="SIT1", details="old type", modified_by="test_user_id", version=1
+        )
+        fi = FinancialInstitutionDao(
+            lei="TESTBANK123000000000", name="Test Bank 123", version=1, sbl_institution_types=[mapping]
+        )
+        make_transient_to_detached(mapping)
+        make_transient_to_detached(fi)
+        return fi
+
+    def test_fi_history_listener(self):
+        fi_insert_mock = Mock(Insert)
+        self.fi_history.insert.return_value = fi_insert_mock
+        target = deepcopy(self.target)
+        self.flush(new=[target])
         self.fi_history.insert.assert_called_once()
         self.mapping_history.insert.assert_called_once()
+        args, _ = fi_insert_mock.values.call_args
+        assert args[0] == [{"name": "Test Bank 123", "changeset": inspect_fi(self.target)}]
+        assert target.version == 1
+        assert target.sbl_institution_types[0].version == 1
 
-    def test_fi_history_listener_no_types(self, mocker: MockerFixture):
-        inspect_mock = mocker.patch("regtech_user_fi_management.entities.listeners.inspect")
-        attr_mock1: AttributeState = Mock(AttributeState)
-        attr_mock1.key = "name"
-        attr_mock2: AttributeState = Mock(AttributeState)
-        attr_mock2.key = "event_time"
-        state_mock: InstanceState = Mock(InstanceState)
-        state_mock.attrs = [attr_mock1, attr_mock2]
-        inspect_mock.return_value = state_mock
-        fi_listener = _setup_fi_history(self.fi_history, self.mapping_history)
+    def test_fi_history_listener_no_types(self):
         no_types = deepcopy(self.target)
         no_types.sbl_institution_types = []
-        fi_listener(self.mapper, self.connection, no_types)
-        inspect_mock.assert_called_once_with(no_types)
+        self.flush(new=[no_types])
         self.fi_history.insert.assert_called_once()
         self.mapping_history.insert.assert_not_called()
 
-    def _get_fi_inspect_mock(self):
-        fi_attr_mock: AttributeState = Mock(AttributeState)
-        fi_attr_mock.key = "sbl_institution_types"
-        fi_attr_mock.value = self.target.sbl_institution_types
-        fi_attr_mock.history = History(added=[], deleted=[], unchanged=[])
-        fi_state_mock: InstanceState = Mock(InstanceState)
-        fi_state_mock.attrs = [fi_attr_mock]
-        return fi_state_mock
-
-    def _get_mapping_inspect_mock(self):
-        mapping_attr_mock: AttributeState = Mock(AttributeState)
-        mapping_attr_mock.key = "details"
-        mapping_attr_mock.history = History(added=["new type"], deleted=["old type"], unchanged=[])
-        mapping_state_mock: InstanceState = Mock(InstanceState)
-        mapping_state_mock.attrs = [mapping_attr_mock]
-        return mapping_state_mock
-
-    def test_fi_mapping_changed(self, mocker: MockerFixture):
-        inspect_mock = mocker.patch("regtech_user_fi_management.entities.listeners.inspect")
-        fi_state_mock = self._get_fi_inspect_mock()
-        mapping_state_mock = self._get_mapping_inspect_mock()
-
-        def inspect_side_effect(inspect_target):
-            if inspect_target == self.target:
-                return fi_state_mock
-            elif inspect_target == self.target.sbl_institution_types[0]:
-                return mapping_state_mock
-
-        inspect_mock.side_effect = inspect_side_effect
+    def test_fi_history_listener_no_changes(self):
+        fi = self.persistent_fi()
+        self.flush(dirty=[fi])
+        self.fi_history.insert.assert_not_called()
+        self.connection.execute.assert_not_called()
+        assert fi.version == 1
+
+    def test_inspect_fi(self):
+        fi = self.persistent_fi()
+        assert inspect_fi(fi) == {}
+        fi.name = "Test Bank 456"
+        fi.tax_id = "98-7654321"
+        fi.event_time = None
+        assert inspect_fi(fi) == {
+            "name": {"old": ["Test Bank 123"], "new": ["Test Bank 456"]},
+            "tax_id": {"old": [], "new": ["98-7654321"]},
+        }
+        fi.name = "Test Bank 123"
+        assert "name" not in inspect_fi(fi)
+
+    def test_fi_mapping_changed(self):
         fi_insert_mock = Mock(Insert)
         self.fi_history.insert.return_value = fi_insert_mock
         mapping_insert_mock = Mock(Insert)
         self.mapping_history.insert.return_value = mapping_insert_mock
-        fi_listener = _setup_fi_history(self.fi_history, self.mapping_history)
-        fi_listener(self.mapper, self.connection, self.target)
-        inspect_mock.assert_has_calls([call(self.target), call(self.target.sbl_institution_types[0])])
+        fi = self.persistent_fi()
+        fi.sbl_institution_types[0].details = "new type"
+        self.flush(dirty=[fi])
         self.fi_history.insert.assert_called_once()
         self.mapping_history.insert.assert_called_once()
         fi_insert_mock.values.assert_called_once()
         args, _ = fi_insert_mock.values.call_args
         insert_data = args[0]
-        assert insert_data["changeset"]["sbl_institution_types"]["field_changes"][0]["details"] == {
+        assert len(insert_data) == 1
+        assert insert_data[0]["changeset"]["sbl_institution_types"]["field_changes"][0]["details"] == {
             "old": ["old type"],
             "new": ["new type"],
         }
+        assert fi.version == 2
+
+    def test_fi_history_one_insert_per_flush(self):
+        fi_insert_mock = Mock(Insert)
+        self.fi_history.insert.return_value = fi_insert_mock
+        other = deepcopy(self.target)
+        other.lei = "TESTBANK456000000000"
+        self.flush(new=[deepcopy(self.target), other, SblTypeMappingDao(type_id="1")])
+        self.fi_history.insert.assert_called_once()
+        self.mapping_history.insert.assert_called_once()
+        args, _ = fi_insert_mock.values.call_args
+        assert len(args[0]) == 2
+        assert all(row.keys() == {"name", "changeset"} for row in args[0])
+        assert self.connection.execute.call_count == 2
+        assert self.session.info == {}
+
+    def test_fi_history_notifies_on_postgres(self):
+        self.session.get_bind.return_value.dialect.name = "postgresql"
+        self.flush(new=[deepcopy(self.target)])
+        assert self.connection.execute.call_count == 3
+        assert "pg_notify" in str(self.connection.execute.call_args.args[0])
+
+
+def test_check_history_tables_mismatch():
+    engine = create_engine("sqlite://")
+    metadata = MetaData()
+    Table("financial_institutions_history", metadata, Column("lei", String), Column("legacy", String))
+    Table("fi_to_type_mapping_history", metadata, Column("fi_id", String))
+    metadata.create_all(engine)
+    with pytest.raises(RuntimeError, match="financial_institutions_history") as e:
+        check_history_tables(engine)
+    assert "undeclared: ['legacy']" in str(e.value)
@@ -3,6 +3,8 @@ from sqlalchemy.engine import Engine
 
 from pytest_alembic import MigrationContext
 
+from regtech_user_fi_management.entities.listeners import check_history_tables
+
 
 def test_financial_institutions_schema_migrate_up_to_045aa502e050(
     alembic_runner: MigrationContext, alembic_engine: Engine
@@ -100,3 +102,46 @@ def test_migration_to_6613e1e2c133(alembic_runner: MigrationContext, alembic_eng
     assert "lei_status_code" in [
         column.get("name") for column in inspector.get_columns("financial_institutions_history")
     ]
+
+
+def test_declared_history_tables_match_migrations(alembic_runner: MigrationContext, alembic_engine: Engine):
+    alembic_runner.migrate_up_to("head")
+
+    check_history_tables(alembic_engine)
+
+
+def test_parent_and_top_holder_lei_indexes_migrate_up_to_d87cac81c861(
+    alembic_runner: MigrationContext, alembic_engine: Engine
+):
+    alembic_runner.migrate_up_to("d87cac81c861")
+
+    inspector = sqlalchemy.inspect(alembic_engine)
+    indexes = {index["name"]: index["column_names"] for index in inspector.get_indexes("financial_institutions")}
+    assert indexes["ix_financial_institutions_parent_lei"] == ["parent_lei"]
+    assert indexes["ix_financial_institutions_top_holder_lei"] == ["top_holder_lei"]
+
+
+def test_history_event_time_indexes_migrate_up_to_9c2e4b7f1a35(
+    alembic_runner: MigrationContext, alembic_engine: Engine
+):
+    alembic_runner.migrate_up_to("9c2e4b7f1a35")
+
+    inspector = sqlalchemy.inspect(alembic_engine)
+    fi_indexes = {
+        index["name"]: index["column_names"] for index in inspector.get_indexes("financial_institutions_history")
+    }
+    assert fi_indexes["ix_financial_institutions_history_lei_event_time"] == ["lei", "event_time"]
+    mapping_indexes = {
+        index["name"]: index["column_names"] for index in inspector.get_indexes("fi_to_type_mapping_history")
+    }
+    assert mapping_indexes["ix_fi_to_type_mapping_history_fi_id_event_time"] == ["fi_id", "event_time"]
+
+
+def test_history_change_feed_index_migrate_up_to_e41b6d2c8f07(alembic_runner: MigrationContext, alembic_engine: Engine):
+    alembic_runner.migrate_up_to("e41b6d2c8f07")
+
+    inspector = sqlalchemy.inspect(alembic_engine)
+    indexes = {
+        index["name"]: index["column_names"] for index in inspector.get_indexes("financial_institutions_history")
+    }
+    assert indexes["ix_financial_institutions_history_event_time_lei_version"] == ["event_time", "lei", "version"]
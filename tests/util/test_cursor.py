@@ -0,0 +1,15 @@
+import pytest
+
+from regtech_user_fi_management.util.cursor import InvalidCursorError, decode_cursor, encode_cursor
+
+
+def test_cursor_round_trip():
+    cursor = encode_cursor("2024-01-01T00:00:00", "TESTBANK123000000000", 2)
+    assert decode_cursor(cursor, 3) == ["2024-01-01T00:00:00", "TESTBANK123000000000", 2]
+
+
+def test_invalid_cursor():
+    with pytest.raises(InvalidCursorError):
+        decode_cursor("notacursor", 1)
+    with pytest.raises(InvalidCursorError):
+        decode_cursor(encode_cursor("a", "b"), 1)
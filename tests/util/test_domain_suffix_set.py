@@ -0,0 +1,18 @@
+from regtech_user_fi_management.util.domain_suffix_set import DomainSuffixSet
+
+
+def test_exact_and_subdomain_match():
+    denied = DomainSuffixSet(["yahoo.com", "Gmail.com."])
+    assert "yahoo.com" in denied
+    assert "mail.yahoo.com" in denied
+    assert "a.b.yahoo.com" in denied
+    assert "GMAIL.COM" in denied
+    assert "notyahoo.com" not in denied
+    assert "yahoo.com.bank" not in denied
+    assert "com" not in denied
+    assert len(denied) == 2
+
+
+def test_empty_set():
+    denied = DomainSuffixSet([])
+    assert "yahoo.com" not in denied
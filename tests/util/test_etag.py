@@ -0,0 +1,17 @@
+from regtech_user_fi_management.util.etag import build_etag, etag_matches
+
+
+def test_build_etag_is_strong_and_stable():
+    etag = build_etag("TESTBANK123000000000", 2)
+    assert etag.startswith('"') and etag.endswith('"')
+    assert etag == build_etag("TESTBANK123000000000", 2)
+    assert etag != build_etag("TESTBANK123000000000", 3)
+
+
+def test_etag_matches():
+    etag = build_etag("TESTBANK123000000000", 2)
+    assert etag_matches(etag, etag)
+    assert etag_matches(f'"other", W/{etag}', etag)
+    assert etag_matches("*", etag)
+    assert not etag_matches('"other"', etag)
+    assert not etag_matches(None, etag)
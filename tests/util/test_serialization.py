@@ -0,0 +1,26 @@
+import json
+from typing import List
+
+from pydantic import BaseModel, TypeAdapter
+
+from regtech_user_fi_management.util.serialization import json_response
+
+
+class Item(BaseModel):
+    id: int
+    tags: List[str]
+
+
+class ItemSource:
+    def __init__(self, id: int, tags: List[str]):
+        self.id = id
+        self.tags = tags
+
+
+def test_json_response_from_attributes():
+    adapter = TypeAdapter(List[Item])
+    res = json_response(adapter, [ItemSource(1, ["a"]), ItemSource(2, [])], {"X-Test": "1"})
+    assert res.media_type == "application/json"
+    assert res.headers["X-Test"] == "1"
+    assert isinstance(res.body, bytes)
+    assert json.loads(res.body) == [{"id": 1, "tags": ["a"]}, {"id": 2, "tags": []}]
@@ -0,0 +1,7 @@
+from regtech_user_fi_management.util.sse import format_event
+
+
+def test_format_event():
+    assert format_event('{"a": 1}', id="abc", event="change") == 'id: abc\nevent: change\ndata: {"a": 1}\n\n'
+    assert format_event("first\nsecond") == "data: first\ndata: second\n\n"
+    assert format_event("") == "data: \n\n"
@@ -0,0 +1,54 @@
+from regtech_user_fi_management.util.ttl_cache import TtlCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_entry_expires_after_ttl():
+    clock = FakeClock()
+    cache = TtlCache("test", ttl=10, clock=clock)
+    cache.set("key", "value")
+    clock.now = 9.9
+    assert cache.get("key") == "value"
+    clock.now = 10
+    assert cache.get("key") is None
+    assert len(cache) == 0
+    assert cache.hits == 1
+    assert cache.misses == 1
+
+
+def test_per_entry_ttl():
+    clock = FakeClock()
+    cache = TtlCache("test", ttl=10, clock=clock)
+    cache.set("short", 1, ttl=1)
+    cache.set("long", 2)
+    clock.now = 5
+    assert cache.get("short") is None
+    assert cache.get("long") == 2
+
+
+def test_lru_eviction():
+    cache = TtlCache("test", ttl=10, maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+
+def test_invalidate():
+    cache = TtlCache("test", ttl=10)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.invalidate("a")
+    assert cache.get("a") is None
+    assert cache.get("b") == 2
+    cache.invalidate()
+    assert len(cache) == 0
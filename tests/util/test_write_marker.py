@@ -0,0 +1,45 @@
+from regtech_user_fi_management.util.write_marker import WriteMarker
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_recent_until_ttl():
+    clock = FakeClock()
+    marker = WriteMarker(b"secret", ttl=5, clock=clock)
+    issued = marker.issue()
+    assert marker.is_recent(issued)
+    assert not marker.is_settled(issued)
+    clock.now += 5
+    assert not marker.is_recent(issued)
+    assert marker.is_settled(issued)
+    assert marker.is_settled(marker.issue(written_at=0))
+
+
+def test_forged_markers_ignored():
+    clock = FakeClock()
+    marker = WriteMarker(b"secret", ttl=5, clock=clock)
+    assert not marker.is_recent(None)
+    assert not marker.is_settled(None)
+    assert not marker.is_recent("1000000")
+    assert not marker.is_settled("0")
+    assert not marker.is_recent(WriteMarker(b"other", ttl=5, clock=clock).issue())
+    written_at, _, signature = marker.issue().rpartition(".")
+    assert not marker.is_recent(f"{int(written_at) + 1000}.{signature}")
+    clock.now += 10
+    future = marker.issue()
+    clock.now -= 10
+    assert not marker.is_recent(future)
+    assert not marker.is_settled(future)
+
+
+def test_fresh_marker_is_recent():
+    clock = FakeClock()
+    clock.now = 1000.0009
+    marker = WriteMarker(b"secret", ttl=5, clock=clock)
+    assert marker.is_recent(marker.issue())